@@ -4,8 +4,12 @@ __author__ = """Matthew D. Bray"""
 __email__ = 'matthew.d.bray1985@gmail.com'
 __version__ = '0.1.0'
 
+import logging
+
 from meshiah.fileio import *
 
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 __all__ = [
     "__version__"
 ]
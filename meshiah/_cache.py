@@ -0,0 +1,48 @@
+#  Keys of results cached on meshes
+#
+#  A key holds the arrays the result was computed from, so none of them
+#  can be freed and its id reused by a new array while the result is
+#  cached, and matches only those very objects. Writable arrays are also
+#  checksummed, so changing them in place is noticed; read-only arrays,
+#  such as memory maps of the binary cache, cannot change and are not.
+import zlib
+
+import numpy as np
+
+
+def _crc(array):
+    array = np.asarray(array)
+    if not array.flags.writeable:
+        return None
+    array = np.ascontiguousarray(array)
+    return zlib.crc32(array.reshape(-1).view(np.uint8))
+
+
+class ArrayKey(object):
+    """
+    Cache key of a result computed from some arrays
+
+    :param arrays: The arrays
+    :param extra: Hashable values the result also depends on
+    """
+
+    __slots__ = ("arrays", "extra", "checksums")
+
+    def __init__(self, arrays, extra=()):
+        self.arrays = tuple(arrays)
+        self.extra = extra
+        self.checksums = tuple(_crc(array) for array in self.arrays)
+
+    def matches(self, arrays, extra=()):
+        """ Whether a result cached with this key applies to the arrays """
+        arrays = tuple(arrays)
+        return len(arrays) == len(self.arrays) and extra == self.extra \
+            and all(a is b for a, b in zip(arrays, self.arrays)) \
+            and all(_crc(array) == checksum
+                    for array, checksum in zip(arrays, self.checksums))
+
+
+def mesh_arrays(mesh):
+    """ The points and cell arrays of a mesh and its cell types """
+    return ([mesh.points] + [data for _, data in mesh.cells],
+            tuple(cell_type for cell_type, _ in mesh.cells))
@@ -0,0 +1,323 @@
+#  Performance benchmarks for the Meshiah package
+import datetime
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import meshio
+
+import meshiah
+from meshiah import generate
+
+__all__ = [
+    "bench",
+    "check_regressions",
+    "load_history",
+    "measure",
+    "plugin_import_time",
+    "record_history",
+    "run_benchmarks",
+]
+
+DEFAULT_HISTORY = "meshiah-bench.json"
+DEFAULT_SCALES = (100000,)
+# Imports a ParaView plugin module in a fresh interpreter, with the
+# paraview.util.vtkAlgorithm decorators replaced by ones that register
+# nothing, and reports the time, memory, output and packages it imported
+_PLUGIN_IMPORT = """
+import importlib.util, io, json, sys, time, tracemalloc, types
+
+class Decorators:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: lambda item: item
+
+algorithm = types.ModuleType("paraview.util.vtkAlgorithm")
+algorithm.VTKPythonAlgorithmBase = object
+for name in ("smproxy", "smproperty", "smdomain", "smhint"):
+    setattr(algorithm, name, Decorators())
+sys.modules.update({"paraview": types.ModuleType("paraview"),
+                    "paraview.util": types.ModuleType("paraview.util"),
+                    "paraview.util.vtkAlgorithm": algorithm})
+before = set(sys.modules)
+stdout, stderr = sys.stdout, sys.stderr
+sys.stdout = sys.stderr = io.StringIO()
+if sys.argv[2] == "trace":
+    tracemalloc.start()
+try:
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("plugin", sys.argv[1])
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+    wall_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() \
+        else 0
+finally:
+    output = sys.stdout.getvalue()
+    sys.stdout, sys.stderr = stdout, stderr
+print(json.dumps({"wall_time": wall_time, "peak_memory": peak,
+                  "output": output,
+                  "imported": sorted({name.split(".")[0] for name in
+                                      set(sys.modules) - before})}))
+"""
+
+
+def measure(func, repeat=3, items=0, nbytes=0):
+    """
+    Times a callable and records its peak memory
+
+    The wall time is the best of `repeat` runs. Peak memory is measured
+    in a separate run under tracemalloc so the tracing overhead does not
+    leak into the timings.
+
+    :param func: Callable taking no arguments
+    :param repeat: Number of timed runs
+    :param items: Number of items (cells, values) processed per call
+    :param nbytes: Number of bytes read or written per call
+
+    :returns dict of wall_time, peak_memory, items_per_s and mb_per_s
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    wall_time = min(times)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    if not was_tracing:
+        tracemalloc.stop()
+
+    wall = max(wall_time, 1e-9)
+    return {
+        "wall_time": wall_time,
+        "peak_memory": max(0, peak - base),
+        "items": items,
+        "items_per_s": items / wall,
+        "bytes": nbytes,
+        "mb_per_s": nbytes / wall / 1e6,
+    }
+
+
+def plugin_import_time(filename, repeat=3):
+    """
+    Times importing a ParaView plugin module, ParaView itself left out
+
+    Each import runs in a new interpreter so nothing is cached, the best
+    of `repeat` is kept and the peak memory comes from one more, traced,
+    import as for measure.
+
+    :param filename: Plugin .py file
+
+    :returns dict as measure, with the output printed while loading and
+        the top level packages imported by the plugin
+    """
+    def run(mode):
+        result = subprocess.run(
+            [sys.executable, "-c", _PLUGIN_IMPORT, filename, mode],
+            capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(f"Importing {filename} failed:\n"
+                               f"{result.stderr}")
+        return json.loads(result.stdout)
+
+    wall_time = min(run("time")["wall_time"] for _ in range(max(1, repeat)))
+    traced = run("trace")
+    return {
+        "wall_time": wall_time,
+        "peak_memory": traced["peak_memory"],
+        "items": 0,
+        "items_per_s": 0.0,
+        "bytes": 0,
+        "mb_per_s": 0.0,
+        "output": traced["output"],
+        "imported": traced["imported"],
+    }
+
+
+def _selected(name, select):
+    """ Whether a case is run, select being substrings of the names """
+    return not select or any(s in name for s in select)
+
+
+def _mesh_case_names(label, ext):
+    return [f"{case}[{label}]"
+            for case in (f"read_{ext}", "read_mbm", "write_mbm", "vtk_cells",
+                         "write_vtu", "write_vtu_raw")]
+
+
+def _mesh_cases(label, filename, reader, workdir):
+    """ Benchmarks for reading, converting and writing one mesh file """
+    mesh = reader(filename)
+    ncells = sum(len(data) for _, data in mesh.cells)
+    nbytes = os.path.getsize(filename)
+    vtu_file = os.path.join(workdir, f"{label}.vtu")
+    mbm_file = os.path.join(workdir, f"{label}.mbm")
+    raw_file = os.path.join(workdir, f"{label}.raw.vtu")
+    meshiah.write_mbm(mbm_file, mesh)
+    meshiah.write_vtu(raw_file, mesh)
+    names = _mesh_case_names(label, meshiah.get_ext(filename))
+    return list(zip(names, [
+        (lambda: reader(filename), ncells, nbytes),
+        (lambda: meshiah.read_mbm(mbm_file), ncells,
+         os.path.getsize(mbm_file)),
+        (lambda: meshiah.write_mbm(mbm_file, mesh), ncells,
+         os.path.getsize(mbm_file)),
+        (lambda: meshiah.vtk_cell_arrays(mesh), ncells, 0),
+        (lambda: meshio.write(vtu_file, mesh), ncells, 0),
+        (lambda: meshiah.write_vtu(raw_file, mesh), ncells,
+         os.path.getsize(raw_file)),
+    ]))
+
+
+def _data_case_names(label):
+    return [f"read_fsd_file[{label}]", f"read_flux_file[{label}]"]
+
+
+def _data_cases(label, nvalues, workdir):
+    """ Benchmarks for reading fsd and flux result files """
+    prefix = os.path.join(workdir, label)
+    fsd_file = generate.generate_fsd_series(prefix, nvalues, 1)[0]
+    flux_file = generate.generate_flux_series(prefix, nvalues, 1)[0]
+    return list(zip(_data_case_names(label), [
+        (lambda: meshiah.read_fsd_file(fsd_file), nvalues,
+         os.path.getsize(fsd_file)),
+        (lambda: meshiah.read_flux_file(flux_file), nvalues,
+         os.path.getsize(flux_file)),
+    ]))
+
+
+def run_benchmarks(fixture_dir="tmp", scales=DEFAULT_SCALES, repeat=3,
+                   select=None, workdir=None, plugin_dir="plugins"):
+    """
+    Runs the benchmark suite
+
+    Benchmarks the Scenario1 fixtures in `fixture_dir` (when present),
+    synthetic meshes of roughly each requested number of cells and the
+    import of the ParaView plugins in `plugin_dir`.
+
+    :param fixture_dir: Directory holding Scenario1.2dm and Scenario1.3dm
+    :param scales: Sequence of synthetic mesh sizes in cells
+    :param repeat: Number of timed runs per benchmark
+    :param select: Optional list of substrings, only matching cases run
+    :param workdir: Directory for generated files, a temporary one if None
+    :param plugin_dir: Directory holding the ParaView plugins
+
+    :returns dict of benchmark name to measurement
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = workdir or tmpdir
+        # Files are only generated and converted for the selected cases
+        cases = []
+        for ext, reader in (("2dm", meshiah.read_2dm),
+                            ("3dm", meshiah.read_3dm)):
+            label = f"Scenario1-{ext}"
+            fixture = os.path.join(fixture_dir, f"Scenario1.{ext}")
+            if os.path.exists(fixture) and any(
+                    _selected(name, select)
+                    for name in _mesh_case_names(label, ext)):
+                cases += _mesh_cases(label, fixture, reader, workdir)
+        for scale in scales:
+            scale = int(scale)
+            for ext, writer, reader in (
+                    ("2dm", generate.generate_2dm, meshiah.read_2dm),
+                    ("3dm", generate.generate_3dm, meshiah.read_3dm)):
+                label = f"synthetic-{ext}-{scale}"
+                if not any(_selected(name, select)
+                           for name in _mesh_case_names(label, ext)):
+                    continue
+                filename = os.path.join(workdir, f"{label}.{ext}")
+                writer(filename, scale)
+                cases += _mesh_cases(label, filename, reader, workdir)
+            label = f"synthetic-{scale}"
+            if any(_selected(name, select)
+                   for name in _data_case_names(label)):
+                cases += _data_cases(label, scale, workdir)
+
+        results = {}
+        for name, (func, items, nbytes) in cases:
+            if _selected(name, select):
+                results[name] = measure(func, repeat=repeat, items=items,
+                                        nbytes=nbytes)
+    for filename in sorted(glob.glob(os.path.join(plugin_dir, "*.py"))):
+        name = f"import_plugin[{os.path.basename(filename)[:-3]}]"
+        if not _selected(name, select):
+            continue
+        results[name] = plugin_import_time(filename, repeat=repeat)
+    return results
+
+
+def load_history(filename):
+    """ Loads the benchmark history, an empty history if it does not exist """
+    if not os.path.exists(filename):
+        return {"runs": []}
+    with open(filename) as ifile:
+        return json.load(ifile)
+
+
+def record_history(filename, results, history=None):
+    """ Appends a run of benchmark results to the JSON history file """
+    history = load_history(filename) if history is None else history
+    history["runs"].append({
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    })
+    with open(filename, 'w') as ofile:
+        json.dump(history, ofile, indent=1)
+    return history
+
+
+def check_regressions(results, history, threshold=0.25, window=5,
+                      metrics=("wall_time", "peak_memory")):
+    """
+    Compares results against the recorded history
+
+    The baseline for each benchmark and metric is the median of its last
+    `window` recorded values. A result regresses when it exceeds the
+    baseline by more than `threshold` (a fraction, 0.25 is 25%).
+
+    :returns list of regression messages, empty when nothing regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        for metric in metrics:
+            previous = [run["results"][name][metric]
+                        for run in history["runs"]
+                        if name in run["results"]][-window:]
+            if not previous:
+                continue
+            baseline = statistics.median(previous)
+            value = result[metric]
+            if baseline > 0 and value > baseline * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {value:.6g} exceeds baseline "
+                    f"{baseline:.6g} by {100 * (value / baseline - 1):.1f}%")
+    return regressions
+
+
+def bench(history_file=DEFAULT_HISTORY, threshold=0.25, record=True,
+          **kwargs):
+    """
+    Runs the benchmark suite and checks it against the history file
+
+    Keyword arguments are passed on to run_benchmarks.
+
+    :returns (results, regressions)
+    """
+    results = run_benchmarks(**kwargs)
+    history = load_history(history_file)
+    regressions = check_regressions(results, history, threshold=threshold)
+    if record:
+        record_history(history_file, results, history)
+    return results, regressions
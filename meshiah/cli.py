@@ -1,19 +1,344 @@
 """Console script for meshiah."""
 import argparse
+import logging
+import os
 import sys
 
 
-def main():
-    """Console script for meshiah."""
-    parser = argparse.ArgumentParser()
-    parser.add_argument('_', nargs='*')
-    args = parser.parse_args()
+def bench(args):
+    """ Runs the benchmark suite and reports regressions """
+    from meshiah.bench import bench
+
+    results, regressions = bench(history_file=args.history,
+                                 threshold=args.threshold,
+                                 record=not args.no_record,
+                                 fixture_dir=args.fixtures,
+                                 plugin_dir=args.plugins,
+                                 scales=args.scale or [100000],
+                                 repeat=args.repeat,
+                                 select=args.select)
+    for name, result in results.items():
+        print(f"{name:<40} {result['wall_time']:10.4f} s "
+              f"{result['peak_memory'] / 1e6:10.2f} MB "
+              f"{result['items_per_s']:14.0f} items/s")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def generate(args):
+    """ Writes a synthetic mesh and matching result files """
+    from meshiah.generate import (generate, generate_flux_series,
+                                  generate_fsd_series)
+
+    npoints, ncells = generate(args.output, args.cells,
+                               regions=args.regions,
+                               randomize=args.randomize, seed=args.seed)
+    print(f"Wrote {args.output} with {npoints} nodes and {ncells} elements")
+    prefix = os.path.splitext(args.output)[0]
+    if args.fsd_steps:
+        filenames = generate_fsd_series(prefix, npoints, args.fsd_steps,
+                                        seed=args.seed)
+        print(f"Wrote {len(filenames)} fsd files {prefix}_*.fsd")
+    if args.flux_files:
+        filenames = generate_flux_series(prefix, ncells, args.flux_files,
+                                         number_of_lights=args.lights,
+                                         seed=args.seed)
+        print(f"Wrote {len(filenames)} flux files {prefix}_*.bin")
+    return 0
+
+
+def convert(args):
+    """ Converts a mesh to another format, e.g. 3dm to .mbm or raw .vtu """
+    import meshio
+    import meshiah
+
+    mesh = meshiah.read(args.input)
+    ext = meshiah.get_ext(args.output)
+    if ext == meshiah.binary_extension:
+        meshiah.write_mbm(args.output, mesh)
+    elif ext == "vtu":
+        meshiah.write_vtu(args.output, mesh, compression=args.compression)
+    else:
+        meshio.write(args.output, mesh)
+    return 0
+
+
+def flux(args):
+    """ Sums flux files per facet into a flux file and/or mesh cell data """
+    import meshio
+    import meshiah
+    from meshiah.flux import aggregate_flux, flux_cell_data
+
+    totals, number_of_lights = aggregate_flux(
+        args.files, normalize=False, max_workers=args.workers,
+        processes=args.processes)
+    if args.output:
+        meshiah.write_flux_file(args.output, totals, number_of_lights)
+        print(f"Wrote {args.output} with {len(totals)} facets and "
+              f"{number_of_lights} lights")
+    if args.mesh:
+        values = totals if args.total else totals / number_of_lights
+        mesh = flux_cell_data(meshiah.read(args.mesh), values, args.name)
+        meshio.write(args.mesh_output, mesh)
+        print(f"Wrote {args.name} to {args.mesh_output}")
+    return 0
+
+
+def stats(args):
+    """ Reduces a result series to per entity statistics on the mesh """
+    import meshiah
+    from meshiah.stats import add_statistics, series_statistics
+
+    result = series_statistics(args.files, max_workers=args.workers,
+                               processes=args.processes)
+    mesh = add_statistics(meshiah.read(args.mesh), result, args.name)
+    meshiah.write_vtu(args.output, mesh)
+    print(f"Wrote {args.name} statistics of {result.count} steps to "
+          f"{args.output}")
+    return 0
+
+
+def compare(args):
+    """ Compares the result series of two runs step by step """
+    import numpy as np
+    import meshiah
+    from meshiah.stats import add_differences, compare_series
 
-    print("Arguments: " + str(args._))
-    print("Replace this message by putting your code into "
-          "meshiah.cli.main")
+    result = compare_series(args.reference, args.test,
+                            max_workers=args.workers,
+                            processes=args.processes)
+    table = result.table()
+    if args.table:
+        np.savetxt(args.table, np.column_stack(list(table.values())),
+                   delimiter=",", header=",".join(table), comments="",
+                   fmt=["%d", "%.17g", "%.17g", "%.17g", "%d"])
+    worst = int(np.argmax(table["max_abs"]))
+    print(f"{len(table['steps'])} steps, largest difference "
+          f"{table['max_abs'][worst]:.6g} at step {worst} entity "
+          f"{table['worst'][worst]}, largest RMS {table['rms'].max():.6g}, "
+          f"largest relative {table['relative'].max():.6g}")
+    for entity in result.worst_entities(args.worst):
+        print(f"  entity {entity}: {result.entity_max[entity]:.6g} at step "
+              f"{result.entity_step[entity]}")
+    if args.output:
+        mesh = add_differences(meshiah.read(args.mesh), result, args.name)
+        meshiah.write_vtu(args.output, mesh)
+        print(f"Wrote {args.name} differences to {args.output}")
     return 0
 
 
+def refine(args):
+    """ Uniformly refines a mesh, e.g. for a mesh convergence study """
+    import meshio
+    import meshiah
+    from meshiah.refine import refine_mesh
+
+    mesh = refine_mesh(meshiah.read(args.input), levels=args.levels)
+    ext = meshiah.get_ext(args.output)
+    if ext == meshiah.binary_extension:
+        meshiah.write_mbm(args.output, mesh)
+    elif ext == "vtu":
+        meshiah.write_vtu(args.output, mesh)
+    else:
+        meshio.write(args.output, mesh)
+    print(f"Wrote {args.output} with {len(mesh.points)} nodes and "
+          f"{sum(len(conn) for _, conn in mesh.cells)} elements")
+    return 0
+
+
+def remap(args):
+    """ Transfers fsd fields from one mesh onto the nodes of another """
+    import numpy as np
+    import meshiah
+    from meshiah.remap import remap_weights
+
+    source = meshiah.read(args.source)
+    weights = remap_weights(source, meshiah.read(args.target).points)
+    steps = np.stack([meshiah.read_fsd_file(path) for path in args.files])
+    filenames = meshiah.write_fsd(args.output, weights(steps, axis=1),
+                                  max_workers=args.workers)
+    print(f"Wrote {len(filenames)} fsd files {args.output}_*.fsd, "
+          f"{weights.outside.sum()} nodes outside the source mesh")
+    return 0
+
+
+def fingerprint(args):
+    """ Prints a layout and numbering independent hash of each mesh """
+    from meshiah.diff import fingerprint
+
+    for filename in args.files:
+        if os.path.splitext(filename)[1] in (".2dm", ".3dm"):
+            print(f"{fingerprint(filename)}  {filename}")
+        else:
+            import meshiah
+
+            print(f"{fingerprint(meshiah.read(filename))}  {filename}")
+    return 0
+
+
+def diff(args):
+    """ Reports the nodes and elements that differ between two meshes """
+    import meshiah
+    from meshiah.diff import mesh_diff
+
+    result = mesh_diff(meshiah.read(args.old), meshiah.read(args.new))
+    print(result.summary())
+    return 0 if result.equivalent else 1
+
+
+def main(argv=None):
+    """Console script for meshiah."""
+    parser = argparse.ArgumentParser(prog="meshiah")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="log progress, twice for debug messages")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace of the I/O phases")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write the I/O phase timings as JSON")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bench_parser = subparsers.add_parser(
+        "bench", help="run the performance benchmark suite")
+    bench_parser.add_argument("--fixtures", default="tmp",
+                              help="directory holding the Scenario1 meshes")
+    bench_parser.add_argument("--plugins", default="plugins",
+                              help="directory holding the ParaView plugins")
+    bench_parser.add_argument("--scale", type=int, action="append",
+                              help="synthetic mesh size in cells, repeatable")
+    bench_parser.add_argument("--repeat", type=int, default=3)
+    bench_parser.add_argument("--history", default="meshiah-bench.json",
+                              help="JSON file the results are recorded in")
+    bench_parser.add_argument("--threshold", type=float, default=0.25,
+                              help="allowed slowdown as a fraction")
+    bench_parser.add_argument("--no-record", action="store_true",
+                              help="do not append the results to the history")
+    bench_parser.add_argument("-k", "--select", action="append",
+                              help="only run benchmarks containing this text")
+    bench_parser.set_defaults(func=bench)
+
+    generate_parser = subparsers.add_parser(
+        "generate", help="write a synthetic 2dm/3dm mesh and results")
+    generate_parser.add_argument("output", help="mesh file, .2dm or .3dm")
+    generate_parser.add_argument("--cells", type=int, required=True,
+                                 help="approximate number of elements")
+    generate_parser.add_argument("--regions", type=int, default=1)
+    generate_parser.add_argument("--randomize", action="store_true",
+                                 help="jitter nodes and scramble numbering")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--fsd-steps", type=int, default=0,
+                                 help="number of fsd timesteps to write")
+    generate_parser.add_argument("--flux-files", type=int, default=0,
+                                 help="number of flux .bin files to write")
+    generate_parser.add_argument("--lights", type=int, default=1,
+                                 help="number of lights in the flux header")
+    generate_parser.set_defaults(func=generate)
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="convert a mesh, e.g. to the binary .mbm format")
+    convert_parser.add_argument("input")
+    convert_parser.add_argument("output")
+    convert_parser.add_argument("--compression", type=int, metavar="LEVEL",
+                                help="zlib level for .vtu output")
+    convert_parser.set_defaults(func=convert)
+
+    flux_parser = subparsers.add_parser(
+        "flux", help="sum flux .bin files of many lights per facet")
+    flux_parser.add_argument("files", nargs="+", help="flux .bin files")
+    flux_parser.add_argument("-o", "--output",
+                             help="flux file of the totals and light count")
+    flux_parser.add_argument("--mesh", help="mesh to attach the flux to")
+    flux_parser.add_argument("--mesh-output",
+                             help="mesh file written with the flux")
+    flux_parser.add_argument("--name", default="FluxData",
+                             help="name of the cell data array")
+    flux_parser.add_argument("--total", action="store_true",
+                             help="attach totals instead of per light flux")
+    flux_parser.add_argument("-j", "--workers", type=int, default=1)
+    flux_parser.add_argument("--processes", action="store_true",
+                             help="sum in processes instead of threads")
+    flux_parser.set_defaults(func=flux)
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="min/max/mean/std/time of peak of an fsd series")
+    stats_parser.add_argument("mesh", help="mesh the results belong to")
+    stats_parser.add_argument("files", nargs="+",
+                              help="fsd or flux files in time order")
+    stats_parser.add_argument("-o", "--output", required=True,
+                              help=".vtu file written with the statistics")
+    stats_parser.add_argument("--name", default="FSD",
+                              help="prefix of the data array names")
+    stats_parser.add_argument("-j", "--workers", type=int, default=1)
+    stats_parser.add_argument("--processes", action="store_true",
+                              help="reduce in processes instead of threads")
+    stats_parser.set_defaults(func=stats)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="per step and per entity differences of two runs")
+    compare_parser.add_argument("mesh", help="mesh the results belong to")
+    compare_parser.add_argument("--reference", nargs="+", required=True,
+                                help="fsd or flux files of the reference run")
+    compare_parser.add_argument("--test", nargs="+", required=True,
+                                help="files of the run to check, same order")
+    compare_parser.add_argument("-o", "--output",
+                                help=".vtu file written with the differences")
+    compare_parser.add_argument("--table",
+                                help="CSV file of the per step errors")
+    compare_parser.add_argument("--name", default="FSD",
+                                help="prefix of the data array names")
+    compare_parser.add_argument("--worst", type=int, default=10,
+                                help="number of worst entities listed")
+    compare_parser.add_argument("-j", "--workers", type=int, default=1)
+    compare_parser.add_argument("--processes", action="store_true",
+                                help="compare in processes instead of threads")
+    compare_parser.set_defaults(func=compare)
+
+    refine_parser = subparsers.add_parser(
+        "refine", help="split triangles into 4 and tetrahedra into 8")
+    refine_parser.add_argument("input")
+    refine_parser.add_argument("output")
+    refine_parser.add_argument("-n", "--levels", type=int, default=1,
+                               help="number of times to refine")
+    refine_parser.set_defaults(func=refine)
+
+    remap_parser = subparsers.add_parser(
+        "remap", help="interpolate fsd files onto the nodes of a new mesh")
+    remap_parser.add_argument("source", help="mesh the fsd files belong to")
+    remap_parser.add_argument("target", help="mesh to transfer them to")
+    remap_parser.add_argument("files", nargs="+", help="fsd files")
+    remap_parser.add_argument("-o", "--output", required=True,
+                              help="prefix of the fsd files written")
+    remap_parser.add_argument("-j", "--workers", type=int, default=1)
+    remap_parser.set_defaults(func=remap)
+
+    fingerprint_parser = subparsers.add_parser(
+        "fingerprint", help="hash meshes ignoring formatting and numbering")
+    fingerprint_parser.add_argument("files", nargs="+")
+    fingerprint_parser.set_defaults(func=fingerprint)
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="added, removed and moved nodes and elements")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.set_defaults(func=diff)
+
+    args = parser.parse_args(argv)
+    if args.command == "flux" and bool(args.mesh) != bool(args.mesh_output):
+        parser.error("--mesh and --mesh-output go together")
+    if args.command is None:
+        parser.print_help()
+        return 0
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][
+            min(args.verbose, 2)],
+        format="%(name)s: %(message)s")
+    if args.trace or args.profile:
+        from meshiah.instrument import record
+
+        with record(json_file=args.profile, trace_file=args.trace):
+            return args.func(args)
+    return args.func(args)
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1 @@
+from .diff import *
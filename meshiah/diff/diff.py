@@ -0,0 +1,314 @@
+#  Content fingerprints and structural differences of meshes
+#
+#  A node is identified by the bits of its coordinates and an element by
+#  the sorted identities of its nodes and its Region, never by file layout
+#  or numbering. The fingerprint sums 64 bit hashes of every node and
+#  element, two independent lanes of them, which is independent of their
+#  order and accumulates chunk by chunk. The diff matches nodes and
+#  elements between two meshes by sorting their keys and joining, so it
+#  is O(n log n) however the meshes were renumbered.
+import hashlib
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "MeshDiff",
+    "fingerprint",
+    "mesh_diff",
+]
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+_SEEDS = np.array([0x243F6A8885A308D3, 0x13198A2E03707344], dtype=np.uint64)
+
+
+def _mix(x):
+    """ splitmix64 finalizer, wrapping uint64 arithmetic """
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _node_hashes(points):
+    """ Hashes of the coordinates of points, shape (n, lanes) """
+    # Adding 0 turns -0.0 into 0.0, the same value in the file
+    bits = np.ascontiguousarray(np.asarray(points, dtype=np.float64) + 0.0)
+    bits = bits.view(np.uint64)
+    hashes = np.broadcast_to(_SEEDS, (len(bits), len(_SEEDS))).copy()
+    for column in bits.T:
+        hashes = _mix(hashes ^ column[:, None])
+    return hashes
+
+
+def _element_hashes(node_hashes, conn, regions, cell_type):
+    """ Hashes of elements from the sorted hashes of their nodes """
+    corners = np.sort(node_hashes[np.asarray(conn)], axis=1)
+    seed = np.uint64(int.from_bytes(
+        hashlib.blake2b(cell_type.encode(), digest_size=8).digest(),
+        'little'))
+    hashes = np.broadcast_to(_SEEDS ^ seed,
+                             (len(corners), len(_SEEDS))).copy()
+    for column in range(corners.shape[1]):
+        hashes = _mix(hashes ^ corners[:, column])
+    if regions is not None:
+        hashes = _mix(hashes ^ np.asarray(regions, dtype=np.int64).view(
+            np.uint64)[:, None])
+    return hashes
+
+
+def _chunks_of_mesh(mesh, chunk_size):
+    points = np.asarray(mesh.points)
+    regions = mesh.cell_data.get("Region")
+
+    def nodes():
+        for start in range(0, len(points), chunk_size):
+            yield points[start:start + chunk_size]
+
+    def elements():
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            for start in range(0, len(conn), chunk_size):
+                yield (cell_type, conn[start:start + chunk_size],
+                       None if regions is None
+                       else regions[i][start:start + chunk_size])
+    return nodes(), elements()
+
+
+def _chunks_of_file(filename, chunk_size):
+    from meshiah.fileio.index import (ELEMENT_CARDS, get_index,
+                                      read_element_range, read_node_range)
+
+    index = get_index(filename)
+    card = next(card for card in ELEMENT_CARDS if card in index["cards"])
+
+    def nodes():
+        for start in range(0, int(index["ND_count"]), chunk_size):
+            yield read_node_range(filename, start, start + chunk_size, index)
+
+    def elements():
+        for start in range(0, int(index[f"{card}_count"]), chunk_size):
+            conn, regions = read_element_range(filename, start,
+                                               start + chunk_size, index)
+            yield ELEMENT_CARDS[card], conn, regions
+    return nodes(), elements()
+
+
+def fingerprint(mesh, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Hash of the content of a mesh, independent of layout and numbering
+
+    Equal for two meshes with the same nodes and the same elements, of
+    the same type and Region, whatever the order and numbering of either
+    or the number formatting of the files they came from.
+
+    :param mesh: The mesh, or the name of a 2dm/3dm file which is then
+        streamed through its byte offset index, see get_index
+    :param chunk_size: Nodes or elements hashed at a time
+
+    :returns hex digest of 32 characters
+    """
+    if isinstance(mesh, str):
+        nodes, elements = _chunks_of_file(mesh, chunk_size)
+    else:
+        nodes, elements = _chunks_of_mesh(mesh, chunk_size)
+    totals = np.zeros(2 * len(_SEEDS) + 2, dtype=np.uint64)
+    with phase("fingerprint"):
+        # Element hashes need the hash of every node, 16 bytes per node
+        node_hashes = np.concatenate([_node_hashes(chunk)
+                                      for chunk in nodes] or
+                                     [np.empty((0, len(_SEEDS)),
+                                               dtype=np.uint64)])
+        totals[:2] = node_hashes.sum(axis=0, dtype=np.uint64)
+        totals[-2] = len(node_hashes)
+        for cell_type, conn, regions in elements:
+            hashes = _element_hashes(node_hashes, conn, regions, cell_type)
+            totals[2:4] += hashes.sum(axis=0, dtype=np.uint64)
+            totals[-1] += np.uint64(len(conn))
+    count("cells", int(totals[-1]))
+    return hashlib.blake2b(totals.astype('<u8').tobytes(),
+                           digest_size=16).hexdigest()
+
+
+def _keys(hashes):
+    """ Sortable keys of two lane hashes """
+    return np.ascontiguousarray(hashes).view(
+        np.dtype([("a", np.uint64), ("b", np.uint64)])).reshape(-1)
+
+
+def _join(old, new):
+    """
+    Sorted-key join of two key arrays, duplicates matched in order
+
+    :returns (matched old indices, matched new indices)
+    """
+    old_order = np.argsort(old, kind='stable')
+    new_order = np.argsort(new, kind='stable')
+    old_sorted = old[old_order]
+    new_sorted = new[new_order]
+    # Rank duplicates so that the k-th copy matches the k-th copy
+    old_rank = _rank(old_sorted)
+    new_rank = _rank(new_sorted)
+    both = np.concatenate([old_sorted, new_sorted])
+    ranks = np.concatenate([old_rank, new_rank])
+    side = np.r_[np.zeros(len(old), bool), np.ones(len(new), bool)]
+    order = np.lexsort((side, ranks, both["b"], both["a"]))
+    key, rank, side = both[order], ranks[order], side[order]
+    pair = ((key[1:] == key[:-1]) & (rank[1:] == rank[:-1]) &
+            ~side[:-1] & side[1:])
+    first = np.flatnonzero(pair)
+    positions = order[first], order[first + 1] - len(old)
+    return old_order[positions[0]], new_order[positions[1]]
+
+
+def _rank(sorted_keys):
+    """ Position of each key among its equal neighbours """
+    new = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    starts = np.flatnonzero(new)
+    return np.arange(len(sorted_keys)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(sorted_keys)]))
+
+
+class MeshDiff:
+    """
+    Differences between two meshes
+
+    Nodes are matched by coordinates. Of those left over, nodes joined
+    to the same matched neighbours in both meshes are moved nodes, the
+    others were removed from the old or added to the new mesh. Elements
+    are matched by their nodes, counting moved nodes as the same, and by
+    type; matched elements whose Region differs are changed.
+
+    :ivar node_map: (old ids, new ids) of the nodes matched by position
+    :ivar moved: (old ids, new ids) of the moved nodes
+    :ivar removed_nodes: Old ids of removed nodes
+    :ivar added_nodes: New ids of added nodes
+    :ivar element_map: (old ids, new ids) of matched elements, numbered
+        across all blocks
+    :ivar changed: (old ids, new ids) of matched elements whose Region
+        differs
+    :ivar removed_elements: Old ids of removed elements
+    :ivar added_elements: New ids of added elements
+    """
+
+    def __init__(self, **tables):
+        self.__dict__.update(tables)
+
+    @property
+    def renumbered(self):
+        """ Number of matched nodes whose id differs """
+        return int((self.node_map[0] != self.node_map[1]).sum())
+
+    @property
+    def equivalent(self):
+        """ The meshes hold the same nodes and elements """
+        return not (len(self.moved[0]) or len(self.removed_nodes) or
+                    len(self.added_nodes) or len(self.changed[0]) or
+                    len(self.removed_elements) or len(self.added_elements))
+
+    def summary(self):
+        """ One line per kind of difference """
+        return "\n".join([
+            f"nodes: {len(self.node_map[0])} matched "
+            f"({self.renumbered} renumbered), {len(self.moved[0])} moved, "
+            f"{len(self.removed_nodes)} removed, "
+            f"{len(self.added_nodes)} added",
+            f"elements: {len(self.element_map[0])} matched, "
+            f"{len(self.changed[0])} with a changed Region, "
+            f"{len(self.removed_elements)} removed, "
+            f"{len(self.added_elements)} added",
+        ])
+
+
+def _elements(mesh):
+    """ Connectivity rows, type codes and Region of all blocks """
+    for i, (cell_type, conn) in enumerate(mesh.cells):
+        regions = mesh.cell_data.get("Region")
+        yield (cell_type, np.asarray(conn),
+               None if regions is None else np.asarray(regions[i]))
+
+
+def _stars(mesh, labels, matched):
+    """ Hashes of the matched neighbours of the unmatched nodes """
+    stars = np.zeros((len(mesh.points), len(_SEEDS)), dtype=np.uint64)
+    for _, conn, _ in _elements(mesh):
+        hashes = _mix(labels.view(np.uint64)[conn][..., None] ^ _SEEDS)
+        hashes[~matched[conn]] = 0
+        totals = hashes.sum(axis=1, dtype=np.uint64)
+        rows, columns = np.nonzero(~matched[conn])
+        np.add.at(stars, conn[rows, columns], totals[rows])
+    return stars
+
+
+def mesh_diff(old, new):
+    """
+    Structural differences between two meshes, see MeshDiff
+
+    :param old: The old mesh
+    :param new: The new mesh
+
+    :returns MeshDiff
+    """
+    with phase("mesh_diff"):
+        nold, nnew = len(old.points), len(new.points)
+        old_nodes, new_nodes = _join(_keys(_node_hashes(old.points)),
+                                     _keys(_node_hashes(new.points)))
+        old_left = np.setdiff1d(np.arange(nold), old_nodes)
+        new_left = np.setdiff1d(np.arange(nnew), new_nodes)
+
+        # Nodes share labels across meshes: one per matched pair, then one
+        # per moved pair, and distinct ones for removed and added nodes
+        nmatched = len(old_nodes)
+        old_labels = np.empty(nold, dtype=np.int64)
+        new_labels = np.empty(nnew, dtype=np.int64)
+        old_labels[old_nodes] = new_labels[new_nodes] = np.arange(nmatched)
+        old_matched = np.zeros(nold, dtype=bool)
+        new_matched = np.zeros(nnew, dtype=bool)
+        old_matched[old_nodes] = new_matched[new_nodes] = True
+        old_stars = _stars(old, old_labels, old_matched)[old_left]
+        new_stars = _stars(new, new_labels, new_matched)[new_left]
+        # Isolated nodes have no neighbours to recognise them by
+        old_left_joined = old_left[old_stars.any(axis=1)]
+        new_left_joined = new_left[new_stars.any(axis=1)]
+        old_moved, new_moved = _join(
+            _keys(old_stars[old_stars.any(axis=1)]),
+            _keys(new_stars[new_stars.any(axis=1)]))
+        moved = (old_left_joined[old_moved], new_left_joined[new_moved])
+        old_labels[moved[0]] = new_labels[moved[1]] = nmatched + np.arange(
+            len(moved[0]))
+        base = nmatched + len(moved[0])
+        removed = np.setdiff1d(old_left, moved[0])
+        added = np.setdiff1d(new_left, moved[1])
+        old_labels[removed] = base + np.arange(len(removed))
+        new_labels[added] = base + len(removed) + np.arange(len(added))
+
+        element_keys, regions = [], []
+        for mesh, labels in ((old, old_labels), (new, new_labels)):
+            keys, mesh_regions = [], []
+            label_hashes = _mix(labels.view(np.uint64)[:, None] ^ _SEEDS)
+            for cell_type, conn, region in _elements(mesh):
+                keys.append(_element_hashes(label_hashes, conn, None,
+                                            cell_type))
+                mesh_regions.append(np.zeros(len(conn), dtype=np.int64)
+                                    if region is None else region)
+            keys = np.concatenate(keys) if keys else np.empty(
+                (0, len(_SEEDS)), dtype=np.uint64)
+            element_keys.append(_keys(keys))
+            regions.append(np.concatenate(mesh_regions) if mesh_regions
+                           else np.empty(0, dtype=np.int64))
+        old_elements, new_elements = _join(*element_keys)
+        changed = regions[0][old_elements] != regions[1][new_elements]
+    count("nodes", nold + nnew)
+    return MeshDiff(
+        node_map=(old_nodes, new_nodes),
+        moved=moved,
+        removed_nodes=removed,
+        added_nodes=added,
+        element_map=(old_elements, new_elements),
+        changed=(old_elements[changed], new_elements[changed]),
+        removed_elements=np.setdiff1d(np.arange(len(element_keys[0])),
+                                      old_elements),
+        added_elements=np.setdiff1d(np.arange(len(element_keys[1])),
+                                    new_elements),
+    )
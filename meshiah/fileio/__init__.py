@@ -1 +1,11 @@
+from .binary import *
 from .fileio import *
+from .follow import *
+from .index import *
+from .outofcore import *
+from .parallel import *
+from .preview import *
+from .select import *
+from .shared import *
+from .vtk import *
+from .vtu import *
@@ -0,0 +1,62 @@
+#  Card level parsing shared by the ERDC readers
+#
+#  Lines are kept as bytes so their lengths are byte offsets into the
+#  file, which the sidecar index relies on.
+import itertools
+import operator
+import warnings
+
+import numpy as np
+
+# Number of numeric fields following each card
+CARD_COLUMNS = {"ND": 4, "E3T": 5, "E4T": 6}
+
+
+def card_mask(lines, card):
+    """ Boolean array marking the lines starting with the given card """
+    prefixes = (card.encode() + b" ", card.encode() + b"\t")
+    return np.fromiter(map(operator.methodcaller("startswith", prefixes),
+                           lines), dtype=bool, count=len(lines))
+
+
+def card_lines(lines, card, mask=None):
+    """ The lines starting with the given card """
+    if mask is None:
+        mask = card_mask(lines, card)
+    return list(itertools.compress(lines, mask))
+
+
+def region_lines(lines, regions):
+    """ The element lines whose last field is one of the Region ids """
+    regions = {str(int(region)).encode() for region in regions}
+    return [line for line in lines if line.rsplit(None, 1)[-1] in regions]
+
+
+def parse_cards(lines, card, ncolumns=None):
+    """
+    Parses the numeric fields of card lines into a 2D float64 array
+
+    :param lines: Lines all starting with card
+    :param card: The card name, stripped before parsing
+    :param ncolumns: The number of numeric fields per line
+    """
+    ncolumns = ncolumns or CARD_COLUMNS[card]
+    text = b"".join(lines).replace(card.encode(), b" ")
+    values = parse_text(text, f"{card} cards")
+    if values.size != len(lines) * ncolumns:
+        raise ValueError(f"Malformed {card} cards: expected {ncolumns} "
+                         f"fields on each of {len(lines)} lines")
+    return values.reshape(len(lines), ncolumns)
+
+
+def parse_text(text, what):
+    """ Parses whitespace separated numbers into a float64 array """
+    if not text.strip():
+        return np.empty(0)
+    with warnings.catch_warnings():
+        # NumPy warns, rather than raises, when it stops at a bad token
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, sep=" ")
+        except (DeprecationWarning, ValueError):
+            raise ValueError(f"Malformed {what}") from None
@@ -0,0 +1,380 @@
+#  Vectorized ASCII formatting for the Meshiah writers
+#
+#  Values are rendered into fixed width uint8 character blocks with NumPy
+#  arithmetic so millions of rows can be written without a Python level
+#  loop over the lines.
+from fractions import Fraction
+
+import numpy as np
+
+SPACE = ord(' ')
+MINUS = ord('-')
+POINT = ord('.')
+ZERO = ord('0')
+NEWLINE = ord('\n')
+
+# Every group of four digits rendered three ways, packed into uint32 so a
+# single take writes four characters: zero padded ("0042"), space padded
+# ("  42", "   0") and space padded with zero blank ("  42", "    ").
+_ZERO_PADDED = 0
+_SPACE_PADDED = 10000
+_BLANK_ZERO = 20000
+_GROUPS = np.array(
+    [list(f"{i:04d}".encode()) for i in range(10000)] +
+    [list(f"{i:4d}".encode()) for i in range(10000)] +
+    [list(f"{i:4d}".encode() if i else b"    ") for i in range(10000)],
+    dtype=np.uint8).view(np.uint32).ravel()
+_POWERS = 10 ** np.arange(1, 19, dtype=np.int64)
+_UNITS = 10 ** np.arange(18, dtype=np.int64)
+EXPONENT = ord('e')
+PLUS = ord('+')
+
+# Magnitudes whose shortest digits are found with NumPy arithmetic, the
+# few outside go through repr
+_SHORTEST_RANGE = (1e-250, 1e250)
+# 10**k as the sum of two doubles for the scales used in that range
+_SCALE_MIN = 16 - 252
+_SCALE_HI = np.array([float(Fraction(10) ** k)
+                      for k in range(_SCALE_MIN, 16 + 252)])
+_SCALE_LO = np.array([float(Fraction(10) ** k - Fraction(hi))
+                      for k, hi in zip(range(_SCALE_MIN, 16 + 252),
+                                       _SCALE_HI)])
+# Relative margin below which a rounding decision counts as a tie
+_TIE = 1e-9
+# Values formatted at a time by format_exact, their temporaries stay in
+# cache
+_EXACT_BLOCK = 1 << 16
+
+
+def int_width(max_value):
+    """ Number of characters needed for integers up to max_value """
+    return len(str(int(max_value)))
+
+
+def float_width(max_abs, decimals):
+    """ Number of characters needed for floats up to max_abs in magnitude """
+    return int_width(int(max_abs)) + decimals + 2
+
+
+def _digits(values, width, pad=False):
+    """ Right aligned decimal digits of non-negative integers """
+    values = np.asarray(values, dtype=np.int64)
+    ngroups = -(-width // 4)
+    groups = np.empty((len(values), ngroups), dtype=np.uint32)
+    remaining = values
+    for level in range(ngroups):
+        column = ngroups - 1 - level
+        if not pad and level > 0 and not remaining.any():
+            groups[:, :column + 1] = _GROUPS[_BLANK_ZERO]
+            break
+        remaining, group = np.divmod(remaining, 10000)
+        if not pad:
+            # Groups holding the leading digits are space padded
+            leading = values < 10 ** (4 * (level + 1))
+            group += leading * (_SPACE_PADDED if level == 0 else _BLANK_ZERO)
+        groups[:, column] = np.take(_GROUPS, group)
+    chars = groups.view(np.uint8).reshape(len(values), 4 * ngroups)
+    return chars[:, 4 * ngroups - width:]
+
+
+def _ndigits(values):
+    """ Number of decimal digits of non-negative integers """
+    return np.searchsorted(_POWERS, values, side='right') + 1
+
+
+def format_int(values, width):
+    """
+    Formats integers as right aligned fixed width text
+
+    :param values: 1D array of integers
+    :param width: Width of the field, including any padding
+
+    :returns uint8 array of shape (n, width)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    negative = values < 0
+    chars = _digits(np.abs(values), width)
+    if negative.any():
+        rows = np.nonzero(negative)[0]
+        chars[rows, width - _ndigits(-values[rows]) - 1] = MINUS
+    return chars
+
+
+def format_float(values, width, decimals):
+    """
+    Formats floats as right aligned fixed point text
+
+    :param values: 1D array of finite floats
+    :param width: Width of the field, including any padding
+    :param decimals: Number of digits after the decimal point
+
+    :returns uint8 array of shape (n, width)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not np.isfinite(values).all():
+        raise ValueError("Only finite values can be formatted")
+    scale = 10 ** decimals
+    scaled = np.rint(np.abs(values) * scale).astype(np.int64)
+    return _fixed(scaled, decimals, (values < 0) & (scaled > 0), width)
+
+
+def _fixed(scaled, decimals, negative, width):
+    """ Fixed point text of integers holding decimals digits after the point
+    """
+    whole, fraction = np.divmod(scaled, 10 ** decimals)
+    int_chars = width - decimals - 1
+    chars = np.empty((len(scaled), width), dtype=np.uint8)
+    chars[:, :int_chars] = _digits(whole, int_chars)
+    chars[:, int_chars] = POINT
+    if decimals:
+        chars[:, int_chars + 1:] = _digits(fraction, decimals, pad=True)
+    if negative.any():
+        rows = np.nonzero(negative)[0]
+        chars[rows, int_chars - _ndigits(whole[rows]) - 1] = MINUS
+    return chars
+
+
+def _split(a):
+    """ Dekker's split of doubles into halves of 26 bits """
+    c = 134217729.0 * a
+    high = c - (c - a)
+    return high, a - high
+
+
+def _scaled(magnitude, exponent):
+    """
+    magnitude * 10**(16 - exponent) as the sum of two doubles
+
+    The error is within a few units of 2**-104 of the result, far below
+    the rounding decisions made on it.
+    """
+    k = 16 - exponent - _SCALE_MIN
+    scale_hi, scale_lo = _SCALE_HI[k], _SCALE_LO[k]
+    product = magnitude * scale_hi
+    a_hi, a_lo = _split(magnitude)
+    b_hi, b_lo = _split(scale_hi)
+    error = ((a_hi * b_hi - product) + a_hi * b_lo + a_lo * b_hi) + \
+        a_lo * b_lo
+    low = error + magnitude * scale_lo
+    high = product + low
+    return high, low - (high - product)
+
+
+def _candidates(nearest, base, low, above, below, k):
+    """
+    The rounding of 17 digit integers to 10**k that reads back
+
+    :returns (choice, inside, unsure): the candidate, rounded down or up,
+        closest to the scaled value, whether it lies within the half gaps
+        above and below, and whether either candidate is too close to a
+        tie for that to be told
+    """
+    unit = _UNITS[k]
+    lower = nearest - nearest % unit
+    # Distances of the candidates below and above the scaled value
+    down = low - (lower - base)
+    up = unit - down
+    down_in = down < below * (1 - _TIE)
+    up_in = up < above * (1 - _TIE)
+    choice = np.where(up_in & (~down_in | (up < down)), lower + unit, lower)
+    unsure = (np.abs(down - below) <= below * _TIE) | \
+        (np.abs(up - above) <= above * _TIE) | \
+        (down_in & up_in & (np.abs(up - down) <= up * _TIE))
+    return choice, down_in | up_in, unsure
+
+
+def _shortest(magnitude):
+    """
+    Shortest decimal digits reading back as each of the magnitudes
+
+    The magnitude is scaled to 17 significant digits in double-double
+    arithmetic, which always read back. Shorter roundings are accepted
+    when they lie strictly within half a unit in the last place of the
+    value, the round to nearest parse of any such decimal, the nearer of
+    the two when both do, as repr does. A rounding to p digits that reads
+    back makes one to p + 1 digits read back too, so the length is
+    searched down from 17 a digit at a time while full precision values,
+    which need 16 or 17, are told apart, then bisected.
+
+    :param magnitude: 1D array of positive normal floats in
+        _SHORTEST_RANGE
+
+    :returns (digits, power, found): the value is digits * 10**power;
+        where found is False a decision was too close to a tie to make
+        and the value must be formatted otherwise
+    """
+    exponent = np.floor(np.log10(magnitude)).astype(np.int64)
+    high, low = _scaled(magnitude, exponent)
+    # log10 may be one off next to powers of ten
+    off = np.nonzero((high >= 1e17) | (high < 1e16))[0]
+    exponent[off] += np.where(high[off] >= 1e17, 1, -1)
+    high[off], low[off] = _scaled(magnitude[off], exponent[off])
+    rounded = np.rint(low)
+    found = (high >= 1e16) & (high < 1e17) & \
+        (np.abs(np.abs(low - rounded) - 0.5) > _TIE)
+    base = high.astype(np.int64)
+    nearest = base + rounded.astype(np.int64)
+    found &= nearest < 10 ** 17
+    # Half the gap to the neighbouring doubles, scaled like the value; the
+    # one below is half as far at powers of two
+    above = 0.5 * np.spacing(magnitude) * (high / magnitude)
+    below = np.where(np.frexp(magnitude)[0] == 0.5, 0.5 * above, above)
+
+    # Rounding to 0 digits never reads back, to 17 always does. Most full
+    # precision values need 16 or 17, which is told first on all of them
+    choice, inside, unsure = _candidates(nearest, base, low, above, below, 1)
+    found &= ~unsure
+    inside &= found
+    digits = np.where(inside, choice, nearest)
+    shortest = np.where(inside, 16, 17)
+    rows = np.nonzero(inside)[0]
+    longest_failing = np.zeros(len(rows), dtype=np.int64)
+    while len(rows):
+        length = np.where(shortest[rows] == 16, 15,
+                          (shortest[rows] + longest_failing) // 2)
+        choice, inside, unsure = _candidates(
+            nearest[rows], base[rows], low[rows], above[rows], below[rows],
+            17 - length)
+        found[rows[unsure]] = False
+        shortest[rows[inside]] = length[inside]
+        digits[rows[inside]] = choice[inside]
+        longest_failing = np.where(inside, longest_failing, length)
+        more = ~unsure & (shortest[rows] - longest_failing > 1)
+        rows, longest_failing = rows[more], longest_failing[more]
+
+    k = 17 - shortest
+    digits //= _UNITS[k]
+    power = exponent - 16 + k
+    # Rounding up may carry into trailing zeros, e.g. 10 for 9.99...
+    while True:
+        carry = found & (digits % 10 == 0)
+        if not carry.any():
+            break
+        digits[carry] //= 10
+        power[carry] += 1
+    return digits, power, found
+
+
+def _scientific(digits, exponent, negative):
+    """ Right aligned d.ddde+XX text of one digit count and exponent width
+    """
+    ndigits = int(_ndigits(digits[:1])[0])
+    exp_digits = max(2, int(_ndigits(np.abs(exponent).max(initial=0))))
+    point = 1 if ndigits > 1 else 0
+    width = 1 + ndigits + point + 2 + exp_digits
+    chars = np.full((len(digits), width), SPACE, dtype=np.uint8)
+    mantissa = _digits(digits, ndigits, pad=True)
+    start = width - exp_digits - 2 - ndigits - point
+    chars[:, start] = mantissa[:, 0]
+    if point:
+        chars[:, start + 1] = POINT
+        chars[:, start + 2:start + 1 + ndigits] = mantissa[:, 1:]
+    chars[:, width - exp_digits - 2] = EXPONENT
+    chars[:, width - exp_digits - 1] = np.where(exponent < 0, MINUS, PLUS)
+    chars[:, width - exp_digits:] = _digits(np.abs(exponent), exp_digits,
+                                            pad=True)
+    chars[negative, start - 1] = MINUS
+    return chars
+
+
+def format_exact(values):
+    """
+    Formats floats as right aligned text that parses back to the same bits
+
+    Each value gets its shortest round trip digits, those of repr, found
+    with array arithmetic by _shortest. They are written as fixed point
+    text when that takes at most 18 decimals and the value is below 1e17,
+    in exponent notation otherwise. Only negative zero, magnitudes outside
+    _SHORTEST_RANGE and near ties are rendered with repr.
+
+    :param values: 1D array of finite floats
+
+    :returns uint8 array of shape (n, width)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not np.isfinite(values).all():
+        raise ValueError("Only finite values can be formatted")
+    if len(values) <= _EXACT_BLOCK:
+        return _exact_block(values)
+    blocks = [_exact_block(values[start:start + _EXACT_BLOCK])
+              for start in range(0, len(values), _EXACT_BLOCK)]
+    width = max(block.shape[1] for block in blocks)
+    chars = np.empty((len(values), width), dtype=np.uint8)
+    for start, block in zip(range(0, len(values), _EXACT_BLOCK), blocks):
+        rows = slice(start, start + len(block))
+        chars[rows, :width - block.shape[1]] = SPACE
+        chars[rows, width - block.shape[1]:] = block
+    return chars
+
+
+def _exact_block(values):
+    """ format_exact of finite values, a block at a time """
+    magnitude = np.abs(values)
+    negative = values < 0
+    # Negative zero would lose its sign as "0.", repr keeps it
+    zero = values == 0
+    negative_zero = zero & np.signbit(values)
+    in_range = (magnitude >= _SHORTEST_RANGE[0]) & \
+        (magnitude < _SHORTEST_RANGE[1])
+    rows = np.nonzero(in_range)[0]
+    digits, power, found = _shortest(magnitude[rows])
+    remaining = np.concatenate([
+        np.nonzero(~in_range & ~zero | negative_zero)[0], rows[~found]])
+    rows, digits, power = rows[found], digits[found], power[found]
+    ndigits = _ndigits(digits)
+
+    groups = [(0, np.nonzero(zero & ~negative_zero)[0], 0)]
+    fixed = (power >= -18) & (power + ndigits <= 17)
+    for decimals in np.unique(-power[fixed]):
+        group = fixed & (power == -decimals)
+        decimals = max(int(decimals), 0)
+        groups.append((decimals, rows[group],
+                       digits[group] * 10 ** (power[group] + decimals)))
+    blocks = []
+    rows, digits, ndigits, power = (rows[~fixed], digits[~fixed],
+                                    ndigits[~fixed], power[~fixed])
+    exponent = power + ndigits - 1
+    # One block per digit count and exponent width
+    shape = ndigits * 1000 + _ndigits(np.abs(exponent))
+    for key in np.unique(shape):
+        group = shape == key
+        blocks.append((rows[group], _scientific(
+            digits[group], exponent[group], negative[rows[group]])))
+
+    widths = [float_width(magnitude[group].max(initial=0), decimals)
+              for decimals, group, _ in groups]
+    fallback = [repr(value) for value in values[remaining].tolist()]
+    width = max(widths + [block.shape[1] for _, block in blocks] +
+                [len(text) for text in fallback] + [1])
+    chars = np.empty((len(values), width), dtype=np.uint8)
+    for decimals, rows, scaled in groups:
+        chars[rows] = _fixed(np.broadcast_to(scaled, rows.shape), decimals,
+                             negative[rows], width)
+    for rows, block in blocks:
+        chars[rows, :width - block.shape[1]] = SPACE
+        chars[rows, width - block.shape[1]:] = block
+    if fallback:
+        chars[remaining] = np.frombuffer(
+            "".join(text.rjust(width) for text in fallback).encode(),
+            dtype=np.uint8).reshape(len(fallback), width)
+    return chars
+
+
+def join_fields(nrows, fields):
+    """
+    Joins fixed width fields into newline terminated rows
+
+    :param nrows: Number of rows
+    :param fields: Sequence of uint8 blocks of shape (nrows, width) or
+        bytes literals repeated on every row
+
+    :returns bytes of the formatted rows
+    """
+    blocks = []
+    for field in fields:
+        if isinstance(field, bytes):
+            field = np.broadcast_to(np.frombuffer(field, dtype=np.uint8),
+                                    (nrows, len(field)))
+        blocks.append(field)
+    blocks.append(np.full((nrows, 1), NEWLINE, dtype=np.uint8))
+    return np.hstack(blocks).tobytes()
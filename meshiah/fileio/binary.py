@@ -0,0 +1,339 @@
+#  Memory-mappable binary mesh format for the Meshiah package
+#
+#  Layout, all little-endian:
+#
+#    header   magic "MESHIAH\0", version, number of arrays, table crc32
+#    table    one entry per array: name, dtype, ndim, shape, offset, crc32
+#    arrays   raw C-ordered data, each aligned to 64 bytes
+#
+#  Array names are "points", "cells/<i>/<type>", "cell_data/<name>/<i>",
+#  "point_data/<name>", "field_data/<name>" and "meta/<name>".
+import logging
+import os
+import struct
+import tempfile
+import zlib
+
+import meshio
+import numpy as np
+
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "allocate_mbm",
+    "binary_extension",
+    "read_mbm",
+    "read_mbm_arrays",
+    "seal_mbm",
+    "write_mbm",
+]
+
+logger = logging.getLogger(__name__)
+
+binary_extension = "mbm"
+MAGIC = b"MESHIAH\0"
+VERSION = 1
+ALIGNMENT = 64
+_HEADER = struct.Struct("<8sIII4x")
+_ENTRY = struct.Struct("<64s8sI4xQQQI4x")
+_CHUNK = 1 << 24
+# Allocated files waiting for seal_mbm, by target to temporary file
+_PENDING = {}
+# Temporary files get the permissions a plain open would have given
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _crc32(array):
+    """ CRC32 of the raw bytes of an array, computed in chunks """
+    flat = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    crc = 0
+    for start in range(0, len(flat), _CHUNK):
+        crc = zlib.crc32(flat[start:start + _CHUNK], crc)
+    return crc
+
+
+def _compact_index(data, npoints):
+    """ Connectivity as int32 when the node ids fit """
+    dtype = '<i4' if npoints < 2 ** 31 else '<i8'
+    return np.asarray(data).astype(dtype, copy=False)
+
+
+def _temporary(filename):
+    """
+    A new file next to filename, to be renamed over it once complete
+
+    Files are never rewritten in place: readers may hold memory maps of
+    them, which would see the new bytes or lose their pages.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    fd, path = tempfile.mkstemp(dir=directory, prefix=f".{name}.",
+                                suffix=".tmp")
+    os.close(fd)
+    os.chmod(path, 0o666 & ~_UMASK)
+    return path
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _mesh_arrays(mesh, meta):
+    """ The named arrays stored for a mesh """
+    arrays = [("points", np.asarray(mesh.points, dtype='<f8'))]
+    for i, (cell_type, data) in enumerate(mesh.cells):
+        arrays.append((f"cells/{i}/{cell_type}",
+                       _compact_index(data, len(mesh.points))))
+    for name, blocks in mesh.cell_data.items():
+        for i, data in enumerate(blocks):
+            arrays.append((f"cell_data/{name}/{i}", np.asarray(data)))
+    for name, data in mesh.point_data.items():
+        arrays.append((f"point_data/{name}", np.asarray(data)))
+    for name, data in mesh.field_data.items():
+        arrays.append((f"field_data/{name}", np.asarray(data)))
+    for name, data in (meta or {}).items():
+        arrays.append((f"meta/{name}", np.asarray(data)))
+    return arrays
+
+
+def write_mbm(filename, mesh, meta=None):
+    """
+    Writes a mesh in the meshiah binary format
+
+    The file is written under a temporary name and renamed over filename,
+    so meshes memory mapped from an earlier version keep their data.
+
+    :param filename: The name of the file to write
+    :param mesh: The mesh to write
+    :type mesh: meshio.Mesh
+    :param meta: Optional dict of extra arrays stored under meta/
+    """
+    arrays = []
+    for name, data in _mesh_arrays(mesh, meta):
+        if data.ndim > 2:
+            raise ValueError(f"Array {name} has more than two dimensions")
+        data = data.astype(data.dtype.newbyteorder('<'), copy=False)
+        encoded = name.encode()
+        if len(encoded) > 64:
+            raise ValueError(f"Array name {name} is longer than 64 bytes")
+        arrays.append((encoded, data))
+
+    offset = _align(_HEADER.size + _ENTRY.size * len(arrays))
+    table = []
+    with phase("checksum", filename=filename):
+        for encoded, data in arrays:
+            shape = tuple(data.shape) + (1,) * (2 - data.ndim)
+            table.append(_ENTRY.pack(encoded, data.dtype.str.encode(),
+                                     data.ndim, shape[0], shape[1], offset,
+                                     _crc32(data)))
+            offset = _align(offset + data.nbytes)
+    table = b"".join(table)
+
+    with phase("write", filename=filename):
+        path = _temporary(filename)
+        try:
+            with open(path, 'wb') as ofile:
+                ofile.write(_HEADER.pack(MAGIC, VERSION, len(arrays),
+                                         zlib.crc32(table)))
+                ofile.write(table)
+                for (_, data), entry in zip(arrays, _entries(table)):
+                    ofile.seek(entry["offset"])
+                    ofile.write(np.ascontiguousarray(data).data)
+                ofile.truncate(offset)
+            os.replace(path, filename)
+        except BaseException:
+            _discard(path)
+            raise
+    count("bytes", offset)
+
+
+def allocate_mbm(filename, specs):
+    """
+    Creates a binary mesh file whose arrays are filled in place
+
+    This writes meshes too large for memory: the arrays are returned as
+    writable memory maps of a temporary file next to filename, to be
+    filled chunk by chunk, after which seal_mbm records their checksums
+    and renames it over filename. Until then filename is untouched.
+
+    :param filename: The name of the file to create
+    :param specs: List of (name, dtype, shape), names as in the format
+
+    :returns dict of array name to writable np.memmap
+    """
+    entries = []
+    offset = _align(_HEADER.size + _ENTRY.size * len(specs))
+    for name, dtype, shape in specs:
+        dtype = np.dtype(dtype).newbyteorder('<')
+        shape = tuple(int(n) for n in shape)
+        if len(shape) > 2:
+            raise ValueError(f"Array {name} has more than two dimensions")
+        if len(name.encode()) > 64:
+            raise ValueError(f"Array name {name} is longer than 64 bytes")
+        entries.append((name, dtype, shape, offset))
+        offset = _align(offset + dtype.itemsize * int(np.prod(shape)))
+    table = b"".join(
+        _ENTRY.pack(name.encode(), dtype.str.encode(), len(shape),
+                    *(shape + (1,) * (2 - len(shape))), start, 0)
+        for name, dtype, shape, start in entries)
+    path = _temporary(filename)
+    with open(path, 'wb') as ofile:
+        ofile.write(_HEADER.pack(MAGIC, VERSION, len(entries),
+                                 zlib.crc32(table)))
+        ofile.write(table)
+        ofile.truncate(offset)
+    _PENDING[os.path.abspath(filename)] = path
+    arrays = {}
+    for name, dtype, shape, start in entries:
+        if np.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r+',
+                                     offset=start, shape=shape)
+    return arrays
+
+
+def seal_mbm(filename):
+    """
+    Records the checksums of the arrays of an allocated binary mesh
+
+    A file from allocate_mbm is then renamed over filename.
+    """
+    path = _PENDING.pop(os.path.abspath(filename), filename)
+    with phase("checksum", filename=filename):
+        arrays = read_mbm_arrays(path)
+        with open(path, 'r+b') as ofile:
+            _, _, narrays, _ = _HEADER.unpack(ofile.read(_HEADER.size))
+            table = bytearray(ofile.read(_ENTRY.size * narrays))
+            for i, entry in enumerate(_entries(bytes(table))):
+                fields = list(_ENTRY.unpack_from(table, i * _ENTRY.size))
+                fields[-1] = _crc32(arrays[entry["name"]])
+                _ENTRY.pack_into(table, i * _ENTRY.size, *fields)
+            del arrays
+            ofile.seek(0)
+            ofile.write(_HEADER.pack(MAGIC, VERSION, narrays,
+                                     zlib.crc32(table)))
+            ofile.write(table)
+    if path != filename:
+        os.replace(path, filename)
+
+
+def _abandon_mbm(filename):
+    """ Removes the temporary file of an allocated mesh never sealed """
+    path = _PENDING.pop(os.path.abspath(filename), None)
+    if path is not None:
+        _discard(path)
+
+
+def _entries(table):
+    """ Decodes the table of contents """
+    entries = []
+    for i in range(len(table) // _ENTRY.size):
+        (name, dtype, ndim, rows, columns, offset,
+         crc) = _ENTRY.unpack_from(table, i * _ENTRY.size)
+        entries.append({
+            "name": name.rstrip(b"\0").decode(),
+            "dtype": np.dtype(dtype.rstrip(b"\0").decode()),
+            "shape": (rows, columns)[:ndim],
+            "offset": offset,
+            "crc32": crc,
+        })
+    return entries
+
+
+def read_mbm_arrays(filename, mmap=True, verify=False):
+    """
+    Reads the named arrays of a meshiah binary file
+
+    :param filename: The name of the file to read
+    :param mmap: Memory map the arrays instead of reading them
+    :param verify: Check the CRC32 of every array
+
+    :returns dict of array name to array
+    """
+    with open(filename, 'rb') as ifile:
+        magic, version, narrays, table_crc = _HEADER.unpack(
+            ifile.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a meshiah binary mesh")
+        if version > VERSION:
+            raise ValueError(f"{filename} has format version {version}, "
+                             f"this meshiah reads up to {VERSION}")
+        table = ifile.read(_ENTRY.size * narrays)
+    if zlib.crc32(table) != table_crc:
+        raise ValueError(f"Corrupt table of contents in {filename}")
+
+    size = os.path.getsize(filename)
+    arrays = {}
+    with phase("open", filename=filename, mmap=mmap):
+        for entry in _entries(table):
+            nbytes = entry["dtype"].itemsize * int(np.prod(entry["shape"]))
+            if entry["offset"] + nbytes > size:
+                raise ValueError(f"{filename} is truncated")
+            if nbytes == 0:
+                data = np.empty(entry["shape"], dtype=entry["dtype"])
+            elif mmap:
+                data = np.memmap(filename, dtype=entry["dtype"], mode='r',
+                                 offset=entry["offset"],
+                                 shape=entry["shape"])
+            else:
+                data = np.fromfile(filename, dtype=entry["dtype"],
+                                   count=nbytes // entry["dtype"].itemsize,
+                                   offset=entry["offset"]).reshape(
+                                       entry["shape"])
+            arrays[entry["name"]] = data
+    if verify:
+        with phase("checksum", filename=filename):
+            for entry in _entries(table):
+                if _crc32(arrays[entry["name"]]) != entry["crc32"]:
+                    raise ValueError(f"Checksum mismatch for "
+                                     f"{entry['name']} in {filename}")
+    return arrays
+
+
+def read_mbm(filename, mmap=True, verify=False):
+    """
+    Reads a meshiah binary mesh
+
+    With mmap the points, connectivity and data are read-only np.memmap
+    views of the file, so loading costs only the table of contents.
+
+    :param filename: The name of the file to read
+    :param mmap: Memory map the arrays instead of reading them
+    :param verify: Check the CRC32 of every array
+
+    :returns mesh
+    """
+    logger.info("Reading in binary mesh %s", filename)
+    arrays = read_mbm_arrays(filename, mmap=mmap, verify=verify)
+    with phase("build_mesh", filename=filename):
+        cells = []
+        cell_data = {}
+        point_data = {}
+        field_data = {}
+        for name, data in arrays.items():
+            kind, _, rest = name.partition("/")
+            if kind == "cells":
+                _, cell_type = rest.split("/", 1)
+                cells.append(meshio.CellBlock(cell_type, data))
+            elif kind == "cell_data":
+                key, index = rest.rsplit("/", 1)
+                cell_data.setdefault(key, []).append((int(index), data))
+            elif kind == "point_data":
+                point_data[rest] = data
+            elif kind == "field_data":
+                field_data[rest] = data
+        cell_data = {key: [data for _, data in sorted(blocks)]
+                     for key, blocks in cell_data.items()}
+        mesh = meshio.Mesh(arrays["points"], cells, point_data=point_data,
+                           cell_data=cell_data, field_data=field_data)
+    count("points", len(mesh.points))
+    count("cells", sum(len(data) for _, data in mesh.cells))
+    return mesh
@@ -1,9 +1,22 @@
 #  File IO for the Meshiah package
+import logging
 import meshiah
 import meshio
 import numpy as np
 import os
+import struct
 import sys
+from meshiah.instrument import count, phase
+from . import _cards, _format
+from .binary import binary_extension, read_mbm, read_mbm_arrays, write_mbm
+from .index import index_from_lines, write_index
+from .parallel import _executor
+from .select import compact, in_bbox, select_mesh
+
+logger = logging.getLogger(__name__)
+
+# The data types that are currently supported
+data_extension_types = ["fsd", "bin"]
 
 
 def get_ext(filename):
@@ -12,7 +25,8 @@ def get_ext(filename):
     return ext.split('.')[-1]
 
 
-def read(filename):
+def read(filename, cache=False, nodes=True, elements=True, regions=None,
+         bbox=None, index=False, geometry=False):
     """ Read in Mesh
 
     This should determine what reader to use to read the meshio
@@ -22,107 +36,214 @@ def read(filename):
     ----------
     :param filename: The name of the mesh file to be read
     :type filename: str
+    :param cache: Keep a binary copy of 2dm/3dm files next to them and
+        memory map it on later reads while the source is unchanged
+    :type cache: bool
+    :param nodes: Read the nodes, False returns only the elements
+    :param elements: Read the elements, False returns only the nodes
+    :param regions: Only read the elements with these Region ids
+    :param bbox: Only read the elements and nodes inside
+        (xmin, ymin, zmin, xmax, ymax, zmax)
+    :param index: Write the byte offset index of 2dm/3dm files while
+        reading them, see build_index
+    :param geometry: Add element areas, normals, centroids and volumes as
+        cell data, kept in the binary cache along with the mesh
+
+    A selection returns a submesh with renumbered nodes, see select_mesh.
 
     :returns mesh{2,3}d 
     """
+    selection = dict(nodes=nodes, elements=elements, regions=regions,
+                     bbox=bbox)
 
     meshio_extensions = [ext[1:]
                          for ext in meshio.extension_to_filetype.keys()]
-    erdc_extensions = ["2dm", "3dm"]
+    erdc_extensions = ["2dm", "3dm", binary_extension]
 
     ext = get_ext(filename)
-    print(f" Extension is {ext} ")
+    logger.debug("Extension is %s", ext)
     if ext in meshio_extensions:
-        mesh = meshio.read(filename)
+        mesh = select_mesh(meshio.read(filename), **selection)
     elif ext in erdc_extensions:
-        if ext == "2dm":
-            mesh = read_2dm(filename)
+        if ext == binary_extension:
+            mesh = select_mesh(read_mbm(filename), **selection)
+        elif cache:
+            mesh = select_mesh(read_cached(filename, geometry), **selection)
+        elif ext == "2dm":
+            mesh = read_2dm(filename, index=index, **selection)
         elif ext == "3dm":
-            mesh = read_3dm(filename)
+            mesh = read_3dm(filename, index=index, **selection)
     else:
-        print(f"Unable to read file {filename} - It has an unknown extension")
+        logger.error("Unable to read file %s - It has an unknown extension",
+                     filename)
         sys.exit()
 
+    if geometry and "geometry_key" not in mesh.field_data:
+        from meshiah.geometry import add_cell_properties
+        add_cell_properties(mesh)
+    return mesh
+
+
+def cache_filename(filename):
+    """ The binary cache file kept next to an ERDC mesh file """
+    return f"{filename}.{binary_extension}"
+
+
+def _source_stamp(filename):
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def read_cached(filename, geometry=False):
+    """
+    Reads a 2dm/3dm file through its binary cache
+
+    The cache records the size and modification time of the source and
+    is rebuilt when either changes.
+
+    :param filename: The name of the 2dm or 3dm file
+    :type filename: str
+    :param geometry: Keep the element geometry, see add_cell_properties,
+        in the cache, rebuilding a cache written without it. The rebuilt
+        cache replaces the old file, meshes mapped from it are unaffected
+
+    :returns mesh
+    """
+    cached = cache_filename(filename)
+    stamp = _source_stamp(filename)
+    if os.path.exists(cached):
+        try:
+            source = read_mbm_arrays(cached).get("meta/source")
+            if source is not None and np.array_equal(source, stamp):
+                mesh = read_mbm(cached)
+                # Caches from before the key covered the cells lack it
+                if not geometry or np.shape(
+                        mesh.field_data.get("geometry_key")) == (2,):
+                    return mesh
+        except ValueError as error:
+            logger.warning("Ignoring binary cache %s: %s", cached, error)
+    if get_ext(filename) == "2dm":
+        mesh = read_2dm(filename)
+    else:
+        mesh = read_3dm(filename)
+    if geometry:
+        from meshiah.geometry import add_cell_properties
+        add_cell_properties(mesh)
+    try:
+        write_mbm(cached, mesh, meta={"source": stamp})
+    except OSError as error:
+        logger.warning("Unable to write binary cache %s: %s", cached, error)
     return mesh
 
 
-def read_2dm(filename):
+def read_2dm(filename, **selection):
     """
     Reads a 2dm ERDC file format and returns a Meshio format Mesh object
 
     :param filename: The name of the 2dm file
     :type filename: str
+    :param selection: nodes, elements, regions, bbox and index as for read
 
     :returns mesh2d
     """
-    print(f"Reading in 2dm file { filename }")
-    points = []
-    facets = []
-    mats = []
-
-    # Read in the 2dm file line by line
-    with open(filename) as ofile:
-        for line in ofile.readlines():
-            split = line.split()
-            if split[0] == "E3T":
-                # Triangle
-                data = [int(x) for x in split[2:]]
-                facets.append(data[0:3])
-                mats.append(data[3])
-            elif split[0] == "ND":
-                # Point
-                points.append([float(x) for x in split[2:]])
-            else:
-                continue
-    # Convert mesh parameters for Meshio class
-    cells = []
-    points = np.array(points)
-    facets = np.array(facets)
-    mats = np.array(mats, dtype=np.int32)
-    cell_data = {}
-    cell_data['Region'] = []
-    cell_data['Region'].append(mats)
-    cells.append(meshio.CellBlock("triangle", facets-1))
-    return meshio.Mesh(points, cells, cell_data=cell_data)
+    logger.info("Reading in 2dm file %s", filename)
+    return _read_erdc(filename, "E3T", "triangle", 3, **selection)
 
 
-def read_3dm(filename):
+def read_3dm(filename, **selection):
     """
     Reads a 3dm ERDC file format and returns a Meshio format Mesh object
 
-    :param filename: The name of the 2dm file
+    :param filename: The name of the 3dm file
     :type filename: str
+    :param selection: nodes, elements, regions, bbox and index as for read
 
     :returns mesh3d
     """
-    points = []
-    tets = []
-    mats = []
-
-    with open(filename) as ofile:
-        for line in ofile.readlines():
-            split = line.split()
-            if split[0] == "E4T":
-                # Tetrahedron
-                data = [int(x) for x in split[2:]]
-                tets.append(data[0:3])
-                mats.append(data[3])
-            elif split[0] == "ND":
-                # Point
-                points.append([float(x) for x in split[2:]])
-            else:
-                continue
-    # Conversions for meshio format
-    cells = []
-    points = np.array(points)
-    tets = np.array(tets)
-    cells.append(meshio.CellBlock("tetrahedra", tets-1))
-    mats = np.array(mats, dtype=np.int32)
-    cell_data = {}
-    cell_data['Region'] = []
-    cell_data['Region'].append(mats)
-
-    return meshio.Mesh(points, cells, cell_data=cell_data)
+    logger.info("Reading in 3dm file %s", filename)
+    return _read_erdc(filename, "E4T", "tetra", 4, **selection)
+
+
+def _read_erdc(filename, element_card, cell_type, nnodes, nodes=True,
+               elements=True, regions=None, bbox=None, index=False):
+    """
+    Reads the ND and element cards of an ERDC mesh file
+
+    Cards that the selection does not need are never converted: element
+    lines of other regions are dropped by their last field and, without
+    a bounding box, only the ND lines of the used nodes are parsed.
+
+    :param element_card: The element card to read, E3T or E4T
+    :param cell_type: The meshio cell type of the elements
+    :param nnodes: The number of nodes per element
+    :param index: Also write the byte offset index, see build_index
+    """
+    selective = regions is not None or bbox is not None
+    with phase("open", filename=filename):
+        with open(filename, 'rb') as ofile:
+            lines = ofile.readlines()
+    count("bytes", os.path.getsize(filename))
+
+    # Split out the node and element cards
+    with phase("tokenize", filename=filename):
+        element_lines = []
+        point_lines = []
+        masks = {}
+        if elements or regions is not None or index:
+            masks[element_card] = _cards.card_mask(lines, element_card)
+            element_lines = _cards.card_lines(lines, element_card,
+                                              masks[element_card])
+        if regions is not None:
+            element_lines = _cards.region_lines(element_lines, regions)
+        if nodes or selective or index:
+            masks["ND"] = _cards.card_mask(lines, "ND")
+            point_lines = _cards.card_lines(lines, "ND", masks["ND"])
+    if index:
+        # The masks are already at hand, leaving only the line lengths
+        with phase("index", filename=filename):
+            write_index(filename, index_from_lines(filename, lines, masks))
+    del lines, masks
+
+    # Convert mesh parameters for Meshio class
+    with phase("convert", filename=filename):
+        data = _cards.parse_cards(element_lines, element_card, nnodes + 2)
+        ids = data[:, 0].astype(np.int64) - 1
+        conn = data[:, 1:nnodes + 1].astype(np.int64) - 1
+        mats = data[:, nnodes + 1].astype(np.int32)
+        del data
+        points = np.empty((0, 3))
+        if nodes and not selective or bbox is not None:
+            points = _cards.parse_cards(point_lines, "ND")[:, 1:]
+        if bbox is not None:
+            inside = in_bbox(points, bbox)
+            keep = inside[conn].all(axis=1)
+            ids, conn, mats = ids[keep], conn[keep], mats[keep]
+    count("points", len(points))
+    count("cells", len(conn))
+
+    with phase("build_mesh", filename=filename):
+        if selective:
+            if bbox is None:
+                # Parse only the ND lines of the nodes that are used
+                def points(used):
+                    return _cards.parse_cards([point_lines[i] for i in used],
+                                              "ND")[:, 1:]
+            blocks = [(cell_type, conn, {'Region': mats}, ids)]
+            if not elements:
+                used = (np.nonzero(inside)[0] if regions is None
+                        else np.unique(conn))
+                return compact(points, [], used)
+            elif nodes:
+                return compact(points, blocks)
+        cell_data = {}
+        cells = []
+        if elements:
+            cell_data['Region'] = []
+            cell_data['Region'].append(mats)
+            cells.append(meshio.CellBlock(cell_type, conn))
+        mesh = meshio.Mesh(points if nodes else np.empty((0, 3)), cells,
+                           cell_data=cell_data)
+    return mesh
 
 
 def read_data_from_file(filename):
@@ -130,32 +251,185 @@ def read_data_from_file(filename):
     Using this function to arrange methods to call the right data
 
     """
-    # The data types that are currently supported
-
-    data_extension_types = ["fsd"]
     ext = get_ext(filename)
 
     if ext not in data_extension_types:
-        print(f"Data type {ext} not supported by Meshiah")
+        logger.error("Data type %s not supported by Meshiah", ext)
         sys.exit()
 
     if ext == "fsd":
         return read_fsd_file(filename)
+    elif ext == "bin":
+        return read_flux_file(filename)
 
 
 def read_fsd_file(filename):
     """ Reads in a fsd file into a numpy array """
 
-    with open(filename) as ifile:
-        fsd_data = []
-        for line in ifile.readlines():
-            # Check to see if it has any header information
-            if isinstance(line, str):
-                # Throw this away for now - but later will need node/facet/TS information
-                for i in range(6):
-                    ifile.readline()
-            fsd_data.append(float(line))
-    return np.array(fsd_data, dtype=np.float64)
+    with phase("open", filename=filename):
+        with open(filename, 'rb') as ifile:
+            text = ifile.read()
+    count("bytes", len(text))
+
+    # One value per line. Header information (node/facet/TS) is not
+    # written by the solver yet, so every line is a value
+    with phase("convert", filename=filename):
+        fsd_data = _cards.parse_text(text, f"fsd file {filename}")
+    count("values", len(fsd_data))
+    return fsd_data
+
+
+FSD_CHUNK = 1 << 20
+
+
+def _write_fsd_file(filename, values, decimals, chunk_size):
+    with phase("write", filename=filename):
+        nbytes = 0
+        with open(filename, 'wb') as ofile:
+            for start in range(0, len(values), chunk_size):
+                chunk = values[start:start + chunk_size]
+                if decimals is None:
+                    chars = _format.format_exact(chunk)
+                else:
+                    width = _format.float_width(
+                        np.abs(chunk).max(), decimals) + 1
+                    chars = _format.format_float(chunk, width, decimals)
+                nbytes += ofile.write(_format.join_fields(len(chunk),
+                                                          [chars]))
+    count("bytes", nbytes)
+    return filename
+
+
+def write_fsd(filename, values, decimals=None, max_workers=None,
+              processes=False, chunk_size=FSD_CHUNK):
+    """
+    Writes values as fsd files, one value per line
+
+    Without decimals every value is written with just enough digits to
+    read back bit for bit, the digits of repr. Full precision values take
+    about four times as long to format that way as with decimals, which
+    is the choice for bulk output that does not need to read back
+    exactly. Like read_fsd_file no header is written.
+
+    :param filename: The fsd file for one array of values, or for a
+        (time, entity) stack either a prefix, giving prefix_00000.fsd,
+        ..., or a list with one file name per step
+    :param values: 1D array or 2D stack of steps
+    :param decimals: Fixed number of decimals instead, faster but rounded
+    :param max_workers: Number of files written at a time
+    :param processes: Use a process pool instead of threads
+    :param chunk_size: Values formatted per buffered write
+
+    :returns the file name, or the list of file names of a stack
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return _write_fsd_file(filename, values, decimals, chunk_size)
+    if values.ndim != 2:
+        raise ValueError(f"Expected one or two dimensions, "
+                         f"got {values.ndim}")
+    if isinstance(filename, str):
+        filenames = [f"{filename}_{step:05d}.fsd"
+                     for step in range(len(values))]
+    else:
+        filenames = list(filename)
+        if len(filenames) != len(values):
+            raise ValueError(f"{len(filenames)} file names for "
+                             f"{len(values)} steps")
+    with phase("write_fsd", files=len(filenames)):
+        if (max_workers or 1) == 1:
+            for name, step in zip(filenames, values):
+                _write_fsd_file(name, step, decimals, chunk_size)
+        else:
+            with _executor(max_workers, processes) as pool:
+                list(pool.map(_write_fsd_file, filenames, values,
+                              [decimals] * len(values),
+                              [chunk_size] * len(values)))
+    return filenames
+
+
+def read_flux_header(filename):
+    """
+    Reads the header of a binary flux file
+
+    The header is two little-endian 32 bit integers, the number of lights
+    followed by the number of doubles in the file.
+
+    :param filename: The name of the flux file
+    :type filename: str
+
+    :returns (number_of_lights, number_of_values)
+    """
+    with open(filename, 'rb') as ifile:
+        header = ifile.read(8)
+    if len(header) != 8:
+        raise ValueError(f"Flux file {filename} is missing its header")
+    return struct.unpack('<ii', header)
+
+
+def read_flux_file(filename):
+    """
+    Reads a binary flux file into a numpy array with one value per facet
+
+    :param filename: The name of the flux file
+    :type filename: str
+
+    :returns flux values as float64
+    """
+    number_of_lights, num_doubles = read_flux_header(filename)
+    with phase("open", filename=filename):
+        data = np.fromfile(filename, dtype='<f8', count=num_doubles,
+                           offset=8)
+    count("values", len(data))
+    if len(data) != num_doubles:
+        raise ValueError(f"Flux file {filename} is truncated: expected "
+                         f"{num_doubles} values, found {len(data)}")
+    return data
+
+
+def _checked_flux_header(filename):
+    """ The header of a flux file once its size is known to match it """
+    number_of_lights, num_doubles = read_flux_header(filename)
+    if num_doubles < 0:
+        raise ValueError(f"Flux file {filename} has a negative value count")
+    size = os.path.getsize(filename)
+    if size < 8 + 8 * num_doubles:
+        raise ValueError(f"Flux file {filename} is truncated: expected "
+                         f"{num_doubles} values, found {(size - 8) // 8}")
+    return number_of_lights, num_doubles
+
+
+def open_flux_file(filename):
+    """
+    Memory maps the values of a binary flux file after checking its size
+
+    :param filename: The name of the flux file
+    :type filename: str
+
+    :returns (number_of_lights, read-only float64 np.memmap)
+    """
+    number_of_lights, num_doubles = _checked_flux_header(filename)
+    if num_doubles == 0:
+        return number_of_lights, np.empty(0)
+    return number_of_lights, np.memmap(filename, dtype='<f8', mode='r',
+                                       offset=8, shape=(num_doubles,))
+
+
+def write_flux_file(filename, values, number_of_lights=1):
+    """
+    Writes a binary flux file, the header followed by the values
+
+    :param filename: The name of the flux file
+    :type filename: str
+    :param values: One value per facet
+    :param number_of_lights: Number of lights recorded in the header
+    """
+    values = np.asarray(values, dtype='<f8').reshape(-1)
+    with phase("write", filename=filename):
+        with open(filename, 'wb') as ofile:
+            ofile.write(struct.pack('<ii', number_of_lights, len(values)))
+            ofile.write(values.data)
+    count("bytes", 8 + values.nbytes)
 
 
 def write():
@@ -0,0 +1,155 @@
+#  Tail-following reader for result files written by a running solver
+#
+#  Files are polled with os.stat, no inotify, so this works on any
+#  filesystem. Each file remembers the byte offset consumed so far and
+#  only what was appended since is read. Incomplete trailing data, a line
+#  without its newline or a flux record missing values, is left for the
+#  next poll.
+import glob
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+from . import _cards
+from .fileio import get_ext
+
+__all__ = [
+    "TailReader",
+    "follow",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class _Tail:
+    """ Read state of one file """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.steps = 0
+        self.pending = np.empty(0)
+
+
+class TailReader:
+    """
+    Incrementally reads the timesteps appended to fsd and flux files
+
+    An fsd step is nvalues consecutive values, so one file may hold one
+    step or many appended ones; values of an incomplete step are kept
+    until the rest arrives. A flux file holds one or more records, each
+    its header followed by its values, and a record is read once
+    complete. Files matching the pattern that appear later are picked up
+    in name order.
+
+    :param pattern: A glob pattern, e.g. "run/T_*.fsd", or a list of files
+    :param nvalues: Values per fsd step, e.g. the number of nodes; without
+        it every complete line so far is returned as a step
+    """
+
+    def __init__(self, pattern, nvalues=None):
+        self.pattern = pattern
+        self.nvalues = nvalues
+        self._tails = {}
+
+    def _paths(self):
+        if isinstance(self.pattern, str):
+            return sorted(glob.glob(self.pattern))
+        return [path for path in self.pattern if os.path.exists(path)]
+
+    def poll(self):
+        """
+        Reads what was appended since the last poll
+
+        :returns list of (path, step index within the file, values)
+        """
+        steps = []
+        for path in self._paths():
+            tail = self._tails.setdefault(path, _Tail(path))
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            if size < tail.offset:
+                logger.warning("%s was truncated, reading it again", path)
+                self._tails[path] = tail = _Tail(path)
+            if size == tail.offset:
+                continue
+            with phase("tail", filename=path):
+                with open(path, 'rb') as ifile:
+                    ifile.seek(tail.offset)
+                    data = ifile.read(size - tail.offset)
+                if get_ext(path) == "bin":
+                    new = self._flux_steps(tail, data)
+                else:
+                    new = self._fsd_steps(tail, data)
+            for values in new:
+                steps.append((path, tail.steps, values))
+                tail.steps += 1
+        count("steps", len(steps))
+        return steps
+
+    def _fsd_steps(self, tail, data):
+        # Only whole lines, the last one may still be being written
+        end = data.rfind(b"\n") + 1
+        tail.offset += end
+        values = _cards.parse_text(data[:end], f"fsd file {tail.path}")
+        if self.nvalues is None:
+            return [values] if len(values) else []
+        values = np.concatenate([tail.pending, values])
+        nsteps = len(values) // self.nvalues
+        tail.pending = values[nsteps * self.nvalues:]
+        return list(values[:nsteps * self.nvalues].reshape(
+            nsteps, self.nvalues)) if nsteps else []
+
+    def _flux_steps(self, tail, data):
+        steps = []
+        at = 0
+        while len(data) - at >= 8:
+            _, nvalues = struct.unpack_from('<ii', data, at)
+            if nvalues < 0:
+                raise ValueError(f"Flux file {tail.path} has a negative "
+                                 f"value count at byte {tail.offset + at}")
+            end = at + 8 + 8 * nvalues
+            if end > len(data):
+                break
+            steps.append(np.frombuffer(data, dtype='<f8', count=nvalues,
+                                       offset=at + 8).copy())
+            at = end
+        tail.offset += at
+        return steps
+
+
+def follow(pattern, callback, nvalues=None, interval=1.0, timeout=None,
+           stop=None):
+    """
+    Polls result files and passes every new step to a callback
+
+    :param pattern: A glob pattern or a list of files, see TailReader
+    :param callback: Called with (path, step index within the file,
+        values) for each step, in the order read
+    :param nvalues: Values per fsd step
+    :param interval: Seconds between polls
+    :param timeout: Stop after this many seconds without a new step
+    :param stop: Optional callable, polling stops once it returns True
+
+    :returns number of steps passed to the callback
+    """
+    reader = TailReader(pattern, nvalues)
+    nsteps = 0
+    last = time.monotonic()
+    while stop is None or not stop():
+        steps = reader.poll()
+        for step in steps:
+            callback(*step)
+        if steps:
+            nsteps += len(steps)
+            last = time.monotonic()
+        elif timeout is not None and time.monotonic() - last >= timeout:
+            break
+        time.sleep(interval)
+    return nsteps
@@ -0,0 +1,372 @@
+#  Byte offset index for random access into 2dm/3dm files
+#
+#  The sidecar file <mesh>.idx records, for each card kind, the number of
+#  cards and the byte offset of every stride-th card, along with the size
+#  and modification time of the mesh file it was built from.
+import logging
+import os
+import zipfile
+
+import meshio
+import numpy as np
+
+from meshiah.instrument import count, phase
+from . import _cards
+from .binary import _discard, _temporary
+from .parallel import _executor
+from .select import compact
+
+__all__ = [
+    "DEFAULT_BLOCK_SIZE",
+    "DEFAULT_STRIDE",
+    "build_index",
+    "get_index",
+    "index_filename",
+    "load_index",
+    "read_card_range",
+    "read_element_range",
+    "read_indexed",
+    "read_node_range",
+    "read_nodes",
+    "read_piece",
+    "split_range",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRIDE = 4096
+DEFAULT_BLOCK_SIZE = 16 << 20
+ELEMENT_CARDS = {"E3T": "triangle", "E4T": "tetra"}
+
+
+def index_filename(filename):
+    """ The sidecar index file kept next to an ERDC mesh file """
+    return f"{filename}.idx"
+
+
+def _stamp(filename):
+    stat = os.stat(filename)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class _IndexBuilder:
+    """ Accumulates the index of a file fed to it batch of lines by batch """
+
+    def __init__(self, filename, stride):
+        self.stamp = _stamp(filename)
+        self.stride = stride
+        self.position = 0
+        self.counts = {}
+        self.offsets = {}
+        self.ends = {}
+
+    def add(self, lines, masks):
+        lengths = np.fromiter(map(len, lines), dtype=np.int64,
+                              count=len(lines))
+        ends = self.position + np.cumsum(lengths)
+        starts = ends - lengths
+        for card, mask in masks.items():
+            rows = np.flatnonzero(mask)
+            seen = self.counts.get(card, 0)
+            # Rows whose card number is a multiple of stride
+            self.offsets.setdefault(card, []).append(
+                starts[rows[-seen % self.stride::self.stride]])
+            self.counts[card] = seen + len(rows)
+            if len(rows):
+                self.ends[card] = ends[rows[-1]]
+        self.position = int(ends[-1]) if len(ends) else self.position
+
+    def finish(self):
+        index = {
+            "stamp": self.stamp,
+            "stride": np.int64(self.stride),
+            "cards": np.array(sorted(self.counts)),
+        }
+        for card, total in self.counts.items():
+            index[f"{card}_count"] = np.int64(total)
+            index[f"{card}_offsets"] = np.concatenate(self.offsets[card])
+            index[f"{card}_end"] = np.int64(self.ends.get(card, 0))
+        return index
+
+
+def index_from_lines(filename, lines, masks, stride=DEFAULT_STRIDE):
+    """
+    Builds the index of a file from its lines
+
+    :param filename: The mesh file the lines were read from
+    :param lines: All lines of the file as bytes
+    :param masks: dict of card to the boolean mask of its lines
+    :param stride: Record the offset of every stride-th card
+
+    :returns index dict
+    """
+    builder = _IndexBuilder(filename, stride)
+    builder.add(lines, masks)
+    return builder.finish()
+
+
+def write_index(filename, index):
+    """
+    Writes the sidecar index, warning when that is not possible
+
+    The index is written under a temporary name and renamed into place,
+    so processes building it at once never see each other's partial file.
+    """
+    path = None
+    try:
+        path = _temporary(index_filename(filename))
+        with open(path, 'wb') as ofile:
+            np.savez(ofile, **index)
+        os.replace(path, index_filename(filename))
+    except OSError as error:
+        logger.warning("Unable to write index for %s: %s", filename, error)
+        if path is not None:
+            _discard(path)
+
+
+def build_index(filename, stride=DEFAULT_STRIDE, write=True,
+                block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Scans a 2dm/3dm file and builds its byte offset index
+
+    The file is read block_size bytes of lines at a time, so memory does
+    not grow with the file.
+
+    :param filename: The name of the mesh file
+    :param stride: Record the offset of every stride-th card
+    :param write: Write the sidecar index file
+    :param block_size: Bytes of lines read at a time
+
+    :returns index dict
+    """
+    with phase("index", filename=filename):
+        builder = _IndexBuilder(filename, stride)
+        with open(filename, 'rb') as ifile:
+            while True:
+                lines = ifile.readlines(block_size)
+                if not lines:
+                    break
+                masks = {card: _cards.card_mask(lines, card)
+                         for card in ("ND",) + tuple(ELEMENT_CARDS)}
+                builder.add(lines, masks)
+        # Only the cards the file holds
+        for card in [card for card, total in builder.counts.items()
+                     if not total]:
+            del builder.counts[card]
+        index = builder.finish()
+    if write:
+        write_index(filename, index)
+    return index
+
+
+def load_index(filename):
+    """
+    Loads the sidecar index of a mesh file
+
+    :returns index dict, or None when it is missing, unreadable or the
+        mesh file has changed size or modification time since it was built
+    """
+    path = index_filename(filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            index = {key: data[key] for key in data.files}
+        stamp = index["stamp"]
+    except (OSError, ValueError, EOFError, KeyError,
+            zipfile.BadZipFile) as error:
+        logger.warning("Ignoring unreadable index %s: %s", path, error)
+        return None
+    if not np.array_equal(stamp, _stamp(filename)):
+        logger.info("Index %s is stale", path)
+        return None
+    return index
+
+
+def get_index(filename, stride=DEFAULT_STRIDE):
+    """
+    Loads the index of a mesh file, building it when needed
+
+    Processes reading pieces of a new file at once, e.g. pvserver ranks,
+    may each build it; write_index replaces the sidecar atomically so
+    every one of them reads either no index or a whole one.
+    """
+    index = load_index(filename)
+    if index is None:
+        index = build_index(filename, stride)
+    return index
+
+
+def _element_card(index):
+    for card in ELEMENT_CARDS:
+        if card in index["cards"]:
+            return card
+    raise ValueError("The mesh file has no E3T or E4T cards")
+
+
+def read_card_range(filename, card, start=0, stop=None, index=None):
+    """
+    Parses cards [start:stop) of one kind with a single seek and read
+
+    :param filename: The name of the mesh file
+    :param card: ND, E3T or E4T
+    :param start: Index of the first card, counting cards of this kind
+    :param stop: Index past the last card, defaults to all
+    :param index: The index, loaded or built when None
+
+    :returns float64 array of the numeric fields, one row per card
+    """
+    index = get_index(filename) if index is None else index
+    total = int(index.get(f"{card}_count", 0))
+    stop = total if stop is None else min(stop, total)
+    start = max(0, min(start, stop))
+    if start == stop:
+        return np.empty((0, _cards.CARD_COLUMNS[card]))
+    stride = int(index["stride"])
+    offsets = index[f"{card}_offsets"]
+    first = start // stride
+    last = -(-stop // stride)
+    begin = int(offsets[first])
+    end = int(offsets[last] if last < len(offsets)
+              else index[f"{card}_end"])
+    with phase("open", filename=filename, card=card):
+        with open(filename, 'rb') as ifile:
+            ifile.seek(begin)
+            chunk = ifile.read(end - begin)
+    count("bytes", len(chunk))
+    with phase("tokenize", filename=filename, card=card):
+        skip = start - first * stride
+        lines = _cards.card_lines(chunk.splitlines(True), card)
+        lines = lines[skip:skip + stop - start]
+    with phase("convert", filename=filename, card=card):
+        return _cards.parse_cards(lines, card)
+
+
+def read_node_range(filename, start=0, stop=None, index=None):
+    """
+    Reads the coordinates of nodes [start:stop)
+
+    :returns float64 array of shape (stop - start, 3)
+    """
+    return read_card_range(filename, "ND", start, stop, index)[:, 1:]
+
+
+def read_nodes(filename, ids, index=None):
+    """
+    Reads the coordinates of arbitrary nodes
+
+    Only the indexed blocks of stride nodes holding one of the ids are
+    read, one seek per run of consecutive blocks.
+
+    :param ids: Sorted unique 0-based node ids
+
+    :returns float64 array of shape (len(ids), 3)
+    """
+    index = get_index(filename) if index is None else index
+    ids = np.asarray(ids, dtype=np.int64)
+    stride = int(index["stride"])
+    coords = np.empty((len(ids), 3))
+    blocks = np.unique(ids // stride)
+    # Runs of consecutive blocks
+    breaks = np.flatnonzero(np.diff(blocks) > 1) + 1
+    for run in np.split(blocks, breaks) if len(blocks) else []:
+        start = int(run[0]) * stride
+        stop = (int(run[-1]) + 1) * stride
+        lo, hi = np.searchsorted(ids, [start, stop])
+        coords[lo:hi] = read_node_range(filename, start, stop,
+                                        index)[ids[lo:hi] - start]
+    count("nodes", len(ids))
+    return coords
+
+
+def read_element_range(filename, start=0, stop=None, index=None):
+    """
+    Reads elements [start:stop)
+
+    :returns (connectivity with 0-based node ids, Region ids)
+    """
+    index = get_index(filename) if index is None else index
+    card = _element_card(index)
+    data = read_card_range(filename, card, start, stop, index)
+    nnodes = _cards.CARD_COLUMNS[card] - 2
+    conn = data[:, 1:nnodes + 1].astype(np.int64) - 1
+    return conn, data[:, nnodes + 1].astype(np.int32)
+
+
+def split_range(total, nparts, stride=1):
+    """
+    Splits range(total) into nparts contiguous (start, stop) pairs
+
+    Inner boundaries are rounded to multiples of stride so each part
+    starts at an indexed offset.
+    """
+    nparts = max(1, nparts)
+    bounds = [0]
+    for part in range(1, nparts):
+        bound = int(round(total * part / nparts / stride)) * stride
+        bounds.append(min(max(bound, bounds[-1]), total))
+    bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_piece(filename, piece, npieces, index=None):
+    """
+    Reads one of npieces contiguous partitions of the elements
+
+    Each element belongs to exactly one piece, the nodes it uses are read
+    into every piece that needs them, so memory is proportional to the
+    piece. The original ids are kept as vtkOriginalPointIds and
+    vtkOriginalCellIds.
+
+    :param filename: The name of the mesh file
+    :param piece: 0-based piece number, e.g. UPDATE_PIECE_NUMBER
+    :param npieces: Number of pieces, e.g. UPDATE_NUMBER_OF_PIECES
+    :param index: The index, loaded or built when None
+
+    :returns mesh
+    """
+    if not 0 <= piece < npieces:
+        raise ValueError(f"Piece {piece} out of range for {npieces} pieces")
+    index = get_index(filename) if index is None else index
+    card = _element_card(index)
+    start, stop = split_range(int(index[f"{card}_count"]), npieces)[piece]
+    with phase("read_piece", filename=filename, piece=piece):
+        conn, mats = read_element_range(filename, start, stop, index)
+        mesh = compact(lambda ids: read_nodes(filename, ids, index),
+                       [(ELEMENT_CARDS[card], conn, {"Region": mats},
+                         np.arange(start, stop))])
+    count("cells", stop - start)
+    return mesh
+
+
+def read_indexed(filename, max_workers=None, processes=True):
+    """
+    Reads a 2dm/3dm file by parsing disjoint card ranges in parallel
+
+    :param filename: The name of the mesh file
+    :param max_workers: Number of workers, defaults to the CPU count
+    :param processes: Use processes, parsing holds the GIL
+
+    :returns mesh
+    """
+    index = get_index(filename)
+    card = _element_card(index)
+    max_workers = max_workers or os.cpu_count() or 1
+    stride = int(index["stride"])
+    with _executor(max_workers, processes) as pool:
+        node_parts = [pool.submit(read_node_range, filename, start, stop,
+                                  index)
+                      for start, stop in split_range(
+                          int(index["ND_count"]), max_workers, stride)]
+        element_parts = [pool.submit(read_element_range, filename, start,
+                                     stop, index)
+                         for start, stop in split_range(
+                             int(index[f"{card}_count"]), max_workers,
+                             stride)]
+        points = np.concatenate([part.result() for part in node_parts])
+        elements = [part.result() for part in element_parts]
+    with phase("build_mesh", filename=filename):
+        conn = np.concatenate([conn for conn, _ in elements])
+        mats = np.concatenate([mats for _, mats in elements])
+        return meshio.Mesh(points, [(ELEMENT_CARDS[card], conn)],
+                           cell_data={'Region': [mats]})
@@ -0,0 +1,333 @@
+#  Out-of-core meshes backed by memory mapped files
+#
+#  Points, connectivity, Region and fields live in binary mesh files that
+#  are memory mapped, never loaded. Every operation here walks its inputs
+#  in chunks sized from a memory limit and writes its outputs straight
+#  into memory mapped files, so the memory it allocates stays within a
+#  small multiple of the limit however large the mesh.
+import functools
+import os
+import tempfile
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+from . import _cards
+from .binary import (allocate_mbm, read_mbm, read_mbm_arrays, seal_mbm,
+                     _abandon_mbm)
+from .fileio import cache_filename, get_ext, open_flux_file, _source_stamp
+from .select import ORIGINAL_CELL_IDS, ORIGINAL_POINT_IDS, in_bbox
+from .vtk import vtk_cell_arrays
+
+__all__ = [
+    "DEFAULT_MEMORY_LIMIT",
+    "convert_out_of_core",
+    "read_out_of_core",
+    "scratch_array",
+    "select_out_of_core",
+    "split_regions_out_of_core",
+    "vtk_cell_arrays_out_of_core",
+]
+
+DEFAULT_MEMORY_LIMIT = 64 << 20
+_ELEMENTS = {"2dm": ("E3T", "triangle", 3), "3dm": ("E4T", "tetra", 4)}
+
+
+def scratch_array(shape, dtype=np.float64, directory=None):
+    """
+    A writable array backed by an anonymous temporary file
+
+    The file is deleted when created and its space freed with the array.
+    """
+    dtype = np.dtype(dtype)
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    with tempfile.TemporaryFile(dir=directory) as ofile:
+        ofile.truncate(int(np.prod(shape)) * dtype.itemsize)
+        return np.memmap(ofile, dtype=dtype, mode='r+', shape=shape)
+
+
+def _rows(memory_limit, row_bytes):
+    """ Rows per chunk keeping a chunk and its temporaries in the limit """
+    return max(1, memory_limit // (4 * max(row_bytes, 1)))
+
+
+def _line_batches(filename, memory_limit):
+    """ The lines of a file in batches of about a quarter of the limit """
+    with open(filename, 'rb') as ifile:
+        while True:
+            lines = ifile.readlines(max(memory_limit // 4, 1 << 12))
+            if not lines:
+                return
+            yield lines
+
+
+def _field_spec(path, memory_limit):
+    """ Number of values of an fsd or flux field file """
+    if get_ext(path) == "bin":
+        return len(open_flux_file(path)[1])
+    return sum(len(_cards.parse_text(b"".join(lines), f"fsd file {path}"))
+               for lines in _line_batches(path, memory_limit))
+
+
+def _fill_field(path, out, memory_limit):
+    if get_ext(path) == "bin":
+        values = open_flux_file(path)[1]
+        step = _rows(memory_limit, 8)
+        for start in range(0, len(values), step):
+            out[start:start + step] = values[start:start + step]
+        return
+    start = 0
+    for lines in _line_batches(path, memory_limit):
+        values = _cards.parse_text(b"".join(lines), f"fsd file {path}")
+        out[start:start + len(values)] = values
+        start += len(values)
+
+
+def convert_out_of_core(filename, output=None, fields=None,
+                        memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Converts a 2dm/3dm file to the binary format a chunk at a time
+
+    The file is scanned twice, once to count the cards and once to parse
+    them into the memory mapped output. The output records the size and
+    modification time of the source, like the binary cache of read, and
+    of each field file.
+
+    :param filename: The 2dm or 3dm file
+    :param output: The binary file, defaults to the binary cache file
+    :param fields: Optional dict of name to fsd or flux file, stored as
+        point data when they hold one value per node, else as cell data
+    :param memory_limit: Bytes of memory to work in
+
+    :returns the output file name
+    """
+    card, cell_type, nnodes = _ELEMENTS[get_ext(filename)]
+    output = output or cache_filename(filename)
+    with phase("count", filename=filename):
+        npoints = ncells = 0
+        for lines in _line_batches(filename, memory_limit):
+            npoints += int(_cards.card_mask(lines, "ND").sum())
+            ncells += int(_cards.card_mask(lines, card).sum())
+        sizes = {name: _field_spec(path, memory_limit)
+                 for name, path in (fields or {}).items()}
+
+    index_dtype = '<i4' if npoints < 2 ** 31 else '<i8'
+    conn_name = f"cells/0/{cell_type}"
+    specs = [("points", '<f8', (npoints, 3)),
+             (conn_name, index_dtype, (ncells, nnodes)),
+             ("cell_data/Region/0", '<i4', (ncells,)),
+             ("meta/source", '<i8', (2,))]
+    field_names = {}
+    for name, size in sizes.items():
+        if size == npoints:
+            field_names[name] = f"point_data/{name}"
+        elif size == ncells:
+            field_names[name] = f"cell_data/{name}/0"
+        else:
+            raise ValueError(f"Field {name} has {size} values for a mesh "
+                             f"with {npoints} nodes and {ncells} elements")
+        specs.append((field_names[name], '<f8', (size,)))
+        specs.append((f"meta/field/{name}", '<i8', (2,)))
+    arrays = allocate_mbm(output, specs)
+    # The output is renamed over the old file only once sealed, so meshes
+    # still mapping it keep their data
+    try:
+        with phase("convert", filename=filename):
+            point = cell = 0
+            for lines in _line_batches(filename, memory_limit):
+                data = _cards.parse_cards(_cards.card_lines(lines, card), card)
+                arrays[conn_name][cell:cell + len(data)] = \
+                    data[:, 1:nnodes + 1] - 1
+                arrays["cell_data/Region/0"][cell:cell + len(data)] = \
+                    data[:, nnodes + 1]
+                cell += len(data)
+                data = _cards.parse_cards(_cards.card_lines(lines, "ND"),
+                                          "ND")
+                arrays["points"][point:point + len(data)] = data[:, 1:]
+                point += len(data)
+            for name, path in (fields or {}).items():
+                _fill_field(path, arrays[field_names[name]], memory_limit)
+                arrays[f"meta/field/{name}"][:] = _source_stamp(path)
+            arrays["meta/source"][:] = _source_stamp(filename)
+        count("points", npoints)
+        count("cells", ncells)
+    except BaseException:
+        _abandon_mbm(output)
+        raise
+    del arrays
+    seal_mbm(output)
+    return output
+
+
+def read_out_of_core(filename, fields=None,
+                     memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Reads a mesh as memory mapped arrays without loading it
+
+    2dm/3dm files go through their binary cache, which is (re)built a
+    chunk at a time by convert_out_of_core when missing or stale, or when
+    a requested field is missing or its file has changed.
+
+    :param filename: A 2dm, 3dm or binary mesh file
+    :param fields: Optional dict of name to fsd or flux file
+    :param memory_limit: Bytes of memory to work in
+
+    :returns meshio.Mesh of read-only np.memmap arrays
+    """
+    if get_ext(filename) not in _ELEMENTS:
+        return read_mbm(filename, mmap=True)
+    cached = cache_filename(filename)
+    if os.path.exists(cached):
+        try:
+            arrays = read_mbm_arrays(cached)
+            fresh = np.array_equal(arrays.get("meta/source"),
+                                   _source_stamp(filename)) and \
+                all(np.array_equal(arrays.get(f"meta/field/{name}"),
+                                   _source_stamp(path))
+                    for name, path in (fields or {}).items())
+            if fresh:
+                return read_mbm(cached, mmap=True)
+        except ValueError:
+            pass
+        finally:
+            arrays = None
+    convert_out_of_core(filename, cached, fields, memory_limit)
+    return read_mbm(cached, mmap=True)
+
+
+def _keep_mask(mesh, i, conn, start, stop, regions, bbox):
+    keep = np.ones(stop - start, dtype=bool)
+    if regions is not None:
+        region = mesh.cell_data.get('Region')
+        if region is None:
+            keep[:] = False
+        else:
+            keep &= np.isin(region[i][start:stop], list(regions))
+    if bbox is not None:
+        chunk = np.asarray(conn[start:stop])
+        inside = in_bbox(mesh.points[chunk.reshape(-1)], bbox)
+        keep &= inside.reshape(chunk.shape).all(axis=1)
+    return keep
+
+
+def select_out_of_core(mesh, output, regions=None, bbox=None,
+                       memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Writes the elements in regions and bbox, and their nodes, to a file
+
+    The out-of-core counterpart of select_mesh: the cells are walked in
+    chunks twice, first to count the selection and mark the used nodes in
+    a scratch file, then to write the renumbered submesh.
+
+    :param mesh: The mesh, typically from read_out_of_core
+    :param output: The binary file of the submesh
+    :param regions: Optional set of Region ids to keep
+    :param bbox: Optional (xmin, ymin, zmin, xmax, ymax, zmax)
+    :param memory_limit: Bytes of memory to work in
+
+    :returns the submesh, memory mapped from output
+    """
+    npoints = len(mesh.points)
+    point_rows = _rows(memory_limit, 8 * 4)
+    with phase("select", filename=output):
+        used = scratch_array(npoints, np.bool_)
+        kept = []
+        for i, (_, conn) in enumerate(mesh.cells):
+            rows = _rows(memory_limit, 8 * (conn.shape[1] + 4))
+            nkept = 0
+            for start in range(0, len(conn), rows):
+                stop = min(start + rows, len(conn))
+                keep = _keep_mask(mesh, i, conn, start, stop, regions, bbox)
+                used[np.asarray(conn[start:stop])[keep].reshape(-1)] = True
+                nkept += int(keep.sum())
+            kept.append(nkept)
+
+        # New node ids, a running count of the used nodes
+        new_ids = scratch_array(npoints, np.int64)
+        nused = 0
+        for start in range(0, npoints, point_rows):
+            chunk = used[start:start + point_rows]
+            new_ids[start:start + point_rows] = nused + np.cumsum(chunk) - 1
+            nused += int(chunk.sum())
+
+        index_dtype = '<i4' if nused < 2 ** 31 else '<i8'
+        specs = [("points", '<f8', (nused, 3))]
+        for name, data in mesh.point_data.items():
+            specs.append((f"point_data/{name}", data.dtype,
+                          (nused,) + data.shape[1:]))
+        specs.append((f"point_data/{ORIGINAL_POINT_IDS}", '<i8', (nused,)))
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            specs.append((f"cells/{i}/{cell_type}", index_dtype,
+                          (kept[i], conn.shape[1])))
+            for name, blocks in mesh.cell_data.items():
+                specs.append((f"cell_data/{name}/{i}", blocks[i].dtype,
+                              (kept[i],) + blocks[i].shape[1:]))
+            specs.append((f"cell_data/{ORIGINAL_CELL_IDS}/{i}", '<i8',
+                          (kept[i],)))
+        arrays = allocate_mbm(output, specs)
+
+        at = 0
+        for start in range(0, npoints, point_rows):
+            stop = min(start + point_rows, npoints)
+            ids = start + np.flatnonzero(used[start:stop])
+            arrays["points"][at:at + len(ids)] = mesh.points[ids]
+            for name, data in mesh.point_data.items():
+                arrays[f"point_data/{name}"][at:at + len(ids)] = data[ids]
+            arrays[f"point_data/{ORIGINAL_POINT_IDS}"][at:at + len(ids)] = \
+                ids
+            at += len(ids)
+
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            rows = _rows(memory_limit, 8 * (conn.shape[1] + 4))
+            at = 0
+            for start in range(0, len(conn), rows):
+                stop = min(start + rows, len(conn))
+                keep = _keep_mask(mesh, i, conn, start, stop, regions, bbox)
+                ids = start + np.flatnonzero(keep)
+                end = at + len(ids)
+                arrays[f"cells/{i}/{cell_type}"][at:end] = \
+                    new_ids[np.asarray(conn[ids])]
+                for name, blocks in mesh.cell_data.items():
+                    arrays[f"cell_data/{name}/{i}"][at:end] = blocks[i][ids]
+                arrays[f"cell_data/{ORIGINAL_CELL_IDS}/{i}"][at:end] = ids
+                at = end
+        del arrays, used, new_ids
+    seal_mbm(output)
+    return read_mbm(output, mmap=True)
+
+
+def split_regions_out_of_core(mesh, prefix, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Writes each Region of a mesh to its own binary file
+
+    :param mesh: The mesh, typically from read_out_of_core
+    :param prefix: Path prefix, files are named prefix_<region>.mbm
+
+    :returns dict of Region id to file name
+    """
+    regions = set()
+    for blocks in mesh.cell_data.get('Region', []):
+        rows = _rows(memory_limit, 4)
+        for start in range(0, len(blocks), rows):
+            regions.update(np.unique(blocks[start:start + rows]).tolist())
+    filenames = {}
+    for region in sorted(regions):
+        filenames[region] = f"{prefix}_{region}.mbm"
+        select_out_of_core(mesh, filenames[region], regions=[region],
+                           memory_limit=memory_limit)
+    return filenames
+
+
+def vtk_cell_arrays_out_of_core(mesh, directory=None,
+                                memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    VTK legacy cell arrays placed in scratch files, see vtk_cell_arrays
+
+    :param directory: Where to keep the scratch files, defaults to the
+        temp directory
+    """
+    width = max((conn.shape[1] for _, conn in mesh.cells), default=1)
+    return vtk_cell_arrays(
+        mesh, allocate=functools.partial(scratch_array, directory=directory),
+        chunk_size=_rows(memory_limit, 8 * (width + 2)))
@@ -0,0 +1,158 @@
+#  Concurrent reading of many mesh and result files
+import asyncio
+import concurrent.futures
+import os
+
+from meshiah.instrument import count, phase
+from . import fileio
+
+__all__ = [
+    "aread_many",
+    "iread_many",
+    "read_many",
+    "read_many_async",
+]
+
+
+def read_one(filename):
+    """
+    Reads a mesh or a data file, dispatching on the extension
+
+    Data files (fsd, bin) go through read_data_from_file, everything else
+    through read.
+    """
+    if fileio.get_ext(filename) in fileio.data_extension_types:
+        return fileio.read_data_from_file(filename)
+    return fileio.read(filename)
+
+
+def _executor(max_workers, processes):
+    if processes:
+        return concurrent.futures.ProcessPoolExecutor(max_workers)
+    return concurrent.futures.ThreadPoolExecutor(max_workers)
+
+
+def _limits(max_workers, max_in_flight):
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    max_in_flight = max(1, max_in_flight or 2 * max_workers)
+    return max_workers, max_in_flight
+
+
+def iread_many(paths, max_workers=None, processes=False, max_in_flight=None,
+               ordered=False):
+    """
+    Reads files concurrently, yielding results as they become available
+
+    At most max_in_flight files are being read or waiting to be consumed
+    at any time, which bounds the memory held by finished results.
+
+    :param paths: The files to read, meshes or data files
+    :param max_workers: Number of threads or processes
+    :param processes: Use a process pool instead of threads
+    :param max_in_flight: Maximum number of outstanding results,
+        defaults to twice the number of workers
+    :param ordered: Yield in input order rather than completion order
+
+    :returns generator of (index, filename, result)
+    """
+    paths = list(paths)
+    max_workers, max_in_flight = _limits(max_workers, max_in_flight)
+    pending = {}
+    finished = {}
+    next_submit = 0
+    next_yield = 0
+    with _executor(max_workers, processes) as pool:
+        try:
+            while next_submit < len(paths) or pending or finished:
+                while (next_submit < len(paths) and
+                       len(pending) + len(finished) < max_in_flight):
+                    future = pool.submit(read_one, paths[next_submit])
+                    pending[future] = next_submit
+                    next_submit += 1
+                if pending:
+                    done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        finished[pending.pop(future)] = future.result()
+                        count("files")
+                if ordered:
+                    while next_yield in finished:
+                        yield (next_yield, paths[next_yield],
+                               finished.pop(next_yield))
+                        next_yield += 1
+                else:
+                    for index in sorted(finished):
+                        yield index, paths[index], finished.pop(index)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def read_many(paths, max_workers=None, processes=False, max_in_flight=None):
+    """
+    Reads files concurrently and returns the results in input order
+
+    :param paths: The files to read, meshes or data files
+    :param max_workers: Number of threads or processes
+    :param processes: Use a process pool instead of threads
+    :param max_in_flight: Maximum number of files read at once
+
+    :returns list of meshes or data arrays
+    """
+    paths = list(paths)
+    results = [None] * len(paths)
+    with phase("read_many", files=len(paths)):
+        for index, _, result in iread_many(paths, max_workers, processes,
+                                           max_in_flight):
+            results[index] = result
+    return results
+
+
+async def aread_many(paths, max_workers=None, processes=False,
+                     max_in_flight=None):
+    """
+    Asynchronously reads files, yielding results as they complete
+
+    The reads run in a thread or process pool so the event loop stays
+    responsive. At most max_in_flight reads are outstanding.
+
+    :returns async generator of (index, filename, result)
+    """
+    paths = list(paths)
+    max_workers, max_in_flight = _limits(max_workers, max_in_flight)
+    loop = asyncio.get_running_loop()
+    pending = {}
+    next_submit = 0
+    pool = _executor(max_workers, processes)
+    try:
+        while next_submit < len(paths) or pending:
+            while next_submit < len(paths) and len(pending) < max_in_flight:
+                future = loop.run_in_executor(pool, read_one,
+                                              paths[next_submit])
+                pending[future] = next_submit
+                next_submit += 1
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in sorted(done, key=pending.get):
+                index = pending.pop(future)
+                count("files")
+                yield index, paths[index], future.result()
+    finally:
+        # A consumer stopping early must not wait for the reads in flight,
+        # that would block the event loop. Every submitted read is pending;
+        # cancelling it cancels its pool future, so queued reads never run.
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+async def read_many_async(paths, max_workers=None, processes=False,
+                          max_in_flight=None):
+    """ Asynchronously reads files and returns the results in input order """
+    paths = list(paths)
+    results = [None] * len(paths)
+    async for index, _, result in aread_many(paths, max_workers, processes,
+                                             max_in_flight):
+        results[index] = result
+    return results
@@ -0,0 +1,222 @@
+#  Level of detail previews of large meshes
+#
+#  A preview is either the boundary of the mesh, the surface triangles of
+#  a tetrahedral mesh or the outline of a triangular one, or a subsample
+#  of its elements. Previews are built from the binary cache when it is
+#  fresh, otherwise from evenly spaced blocks of a prebuilt byte offset
+#  index, so only a bounded part of the mesh file is parsed. The result is
+#  stored in a small binary file next to the mesh and reused while the
+#  mesh is unchanged.
+import logging
+import os
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+from meshiah.topology import LOCAL_EDGES, LOCAL_FACES, unique_entities
+from .binary import binary_extension, read_mbm, read_mbm_arrays, write_mbm
+from .fileio import _source_stamp, cache_filename, get_ext
+from .index import (ELEMENT_CARDS, index_filename, load_index,
+                    read_element_range, read_nodes)
+from .select import ORIGINAL_CELL_IDS, ORIGINAL_POINT_IDS, compact
+
+__all__ = [
+    "DEFAULT_PREVIEW_CELLS",
+    "PREVIEW_MODES",
+    "boundary_mesh",
+    "preview_filename",
+    "read_preview",
+    "subsample_mesh",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_CELLS = 500_000
+PREVIEW_MODES = ("surface", "subsample")
+
+# Boundary cell type and local node numbers of the faces of each cell type
+_FACES = {
+    "tetra": ("triangle", LOCAL_FACES["tetra"]),
+    "triangle": ("line", LOCAL_EDGES["triangle"]),
+}
+
+
+def preview_filename(filename):
+    """ The preview file kept next to a mesh file """
+    return f"{filename}.preview.{binary_extension}"
+
+
+def _cell_ids(mesh, i, offset, ids):
+    """ Ids of cells of block i across all blocks of the original mesh """
+    if ORIGINAL_CELL_IDS in mesh.cell_data:
+        return np.asarray(mesh.cell_data[ORIGINAL_CELL_IDS][i])[ids]
+    return offset + ids
+
+
+def _compact(mesh, blocks):
+    """ compact, mapping the point ids back through a previous selection """
+    selected = compact(mesh.points, blocks)
+    if ORIGINAL_POINT_IDS in mesh.point_data:
+        used = selected.point_data[ORIGINAL_POINT_IDS]
+        selected.point_data[ORIGINAL_POINT_IDS] = np.asarray(
+            mesh.point_data[ORIGINAL_POINT_IDS])[used]
+    return selected
+
+
+def boundary_mesh(mesh):
+    """
+    The boundary of a mesh, the faces used by only one cell
+
+    Tetrahedra give triangles, triangles give lines, oriented as in
+    their cell. The Region of the cell is kept and vtkOriginalCellIds
+    holds the id of the cell across all blocks.
+
+    :returns meshio.Mesh
+    """
+    blocks = []
+    offset = 0
+    with phase("boundary"):
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            conn = np.asarray(conn)
+            if cell_type not in _FACES:
+                raise ValueError(f"No boundary for {cell_type} cells")
+            face_type, local = _FACES[cell_type]
+            faces = conn[:, local].reshape(-1, local.shape[1])
+            _, uses, maps = unique_entities(len(mesh.points),
+                                            [(cell_type, conn)],
+                                            {cell_type: local})
+            single = np.flatnonzero(uses[maps[0]].reshape(-1) == 1)
+            cells = single // len(local)
+            data = {name: np.asarray(values[i])[cells]
+                    for name, values in mesh.cell_data.items()
+                    if name != ORIGINAL_CELL_IDS}
+            blocks.append((face_type, faces[single], data,
+                           _cell_ids(mesh, i, offset, cells)))
+            offset += len(conn)
+        boundary = _compact(mesh, blocks)
+    count("faces", sum(len(block[1]) for block in blocks))
+    return boundary
+
+
+def subsample_mesh(mesh, max_cells=DEFAULT_PREVIEW_CELLS):
+    """
+    Every k-th cell of a mesh, keeping at most max_cells
+
+    :returns meshio.Mesh with vtkOriginalPointIds and vtkOriginalCellIds
+    """
+    total = sum(len(conn) for _, conn in mesh.cells)
+    step = max(1, -(-total // max(1, max_cells)))
+    blocks = []
+    offset = 0
+    with phase("subsample", step=step):
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            # Continue the stride across blocks
+            ids = np.arange((-offset) % step, len(conn), step)
+            data = {name: np.asarray(values[i])[ids]
+                    for name, values in mesh.cell_data.items()
+                    if name != ORIGINAL_CELL_IDS}
+            blocks.append((cell_type, np.asarray(conn)[ids], data,
+                           _cell_ids(mesh, i, offset, ids)))
+            offset += len(conn)
+        return _compact(mesh, blocks)
+
+
+def _sample_indexed(filename, index, max_cells):
+    """ Evenly spaced indexed blocks of elements of a 2dm/3dm file """
+    card = next(card for card in ELEMENT_CARDS if card in index["cards"])
+    total = int(index[f"{card}_count"])
+    stride = int(index["stride"])
+    nblocks = -(-total // stride)
+    wanted = max(1, max_cells // stride)
+    starts = stride * np.unique(
+        np.linspace(0, nblocks - 1, min(wanted, nblocks)).astype(np.int64))
+    conn, regions, ids = [], [], []
+    for start in starts.tolist():
+        block_conn, block_regions = read_element_range(
+            filename, start, start + stride, index)
+        conn.append(block_conn)
+        regions.append(block_regions)
+        ids.append(np.arange(start, start + len(block_conn)))
+    return compact(lambda used: read_nodes(filename, used, index),
+                   [(ELEMENT_CARDS[card], np.concatenate(conn),
+                     {"Region": np.concatenate(regions)},
+                     np.concatenate(ids))])
+
+
+def _fresh_cache(filename, stamp):
+    """ The memory mapped binary cache when it matches the source """
+    cached = cache_filename(filename)
+    if not os.path.exists(cached):
+        return None
+    try:
+        source = read_mbm_arrays(cached).get("meta/source")
+        if source is not None and np.array_equal(source, stamp):
+            return read_mbm(cached)
+    except ValueError as error:
+        logger.warning("Ignoring binary cache %s: %s", cached, error)
+    return None
+
+
+def read_preview(filename, mode="surface", max_cells=DEFAULT_PREVIEW_CELLS):
+    """
+    Reads a cheap preview of a large 2dm/3dm mesh
+
+    The surface preview needs every element, so it is built from the
+    binary cache, see read(cache=True). Without a fresh cache a subsample
+    is returned instead, read from evenly spaced blocks of the byte
+    offset index. That index must already exist, see build_index: a
+    preview never parses the whole mesh file, so it does not build one.
+    Either preview is stored in the preview file and later calls only
+    read that.
+
+    :param filename: The name of the 2dm or 3dm file
+    :param mode: "surface" for the boundary, "subsample" for a subset of
+        the elements
+    :param max_cells: Upper bound on the preview cells; a surface larger
+        than that is subsampled too
+
+    :returns meshio.Mesh with vtkOriginalPointIds and vtkOriginalCellIds
+    :raises ValueError: when there is neither a fresh binary cache nor a
+        fresh index
+    """
+    if mode not in PREVIEW_MODES:
+        raise ValueError(f"Unknown preview mode {mode}, "
+                         f"expected one of {PREVIEW_MODES}")
+    if get_ext(filename) not in ("2dm", "3dm"):
+        raise ValueError(f"No preview for {filename}, expected 2dm or 3dm")
+    stamp = _source_stamp(filename)
+    key = [PREVIEW_MODES.index(mode), max_cells]
+    path = preview_filename(filename)
+    if os.path.exists(path):
+        try:
+            arrays = read_mbm_arrays(path)
+            if (np.array_equal(arrays.get("meta/source"), stamp) and
+                    np.array_equal(arrays.get("meta/preview"), key)):
+                return read_mbm(path)
+        except ValueError as error:
+            logger.warning("Ignoring preview %s: %s", path, error)
+
+    with phase("preview", filename=filename, mode=mode):
+        mesh = _fresh_cache(filename, stamp)
+        if mesh is None:
+            index = load_index(filename)
+            if index is None:
+                raise ValueError(
+                    f"No preview of {filename} without its binary cache "
+                    f"or its index {index_filename(filename)}, see "
+                    f"read(cache=True) and build_index")
+            if mode == "surface":
+                logger.info("No binary cache for %s, previewing a "
+                            "subsample instead of the surface", filename)
+                # Recorded as what it is, so a later cache replaces it
+                key[0] = PREVIEW_MODES.index("subsample")
+            preview = _sample_indexed(filename, index, max_cells)
+        else:
+            if mode == "surface":
+                mesh = boundary_mesh(mesh)
+            preview = subsample_mesh(mesh, max_cells)
+    try:
+        write_mbm(path, preview, meta={"source": stamp, "preview": key})
+    except OSError as error:
+        logger.warning("Unable to write preview %s: %s", path, error)
+    return preview
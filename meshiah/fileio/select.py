@@ -0,0 +1,159 @@
+#  Selective reads: submeshes by region, bounding box or entity kind
+import meshio
+import numpy as np
+
+from meshiah.instrument import phase
+
+__all__ = [
+    "ORIGINAL_CELL_IDS",
+    "ORIGINAL_POINT_IDS",
+    "in_bbox",
+    "select_mesh",
+    "select_piece",
+]
+
+# Index maps back to the full mesh, named as ParaView's extraction filters
+ORIGINAL_POINT_IDS = "vtkOriginalPointIds"
+ORIGINAL_CELL_IDS = "vtkOriginalCellIds"
+
+
+def in_bbox(points, bbox):
+    """
+    Mask of the points inside a bounding box
+
+    :param points: Array of shape (n, 3)
+    :param bbox: (xmin, ymin, zmin, xmax, ymax, zmax), bounds inclusive
+    """
+    bbox = np.asarray(bbox, dtype=np.float64).reshape(2, 3)
+    points = np.asarray(points)
+    return ((points >= bbox[0]) & (points <= bbox[1])).all(axis=1)
+
+
+def compact(points, blocks, point_ids=None, point_data=None):
+    """
+    Builds a submesh from selected cells, renumbering the nodes
+
+    :param points: Coordinates of the points referenced by the blocks, or
+        a callable returning the coordinates of given original node ids
+    :param blocks: List of (cell_type, connectivity, cell_data dict,
+        original cell ids) using original node ids
+    :param point_ids: Nodes to keep even when no cell uses them
+    :param point_data: Point data of the original nodes, kept for the
+        selected ones
+
+    :returns meshio.Mesh with vtkOriginalPointIds and vtkOriginalCellIds
+    """
+    used = [np.unique(conn) for _, conn, _, _ in blocks]
+    if point_ids is not None:
+        used.append(np.asarray(point_ids, dtype=np.int64))
+    used = (np.unique(np.concatenate(used)) if used
+            else np.empty(0, dtype=np.int64))
+    coords = points(used) if callable(points) else np.asarray(points)[used]
+    cells = []
+    cell_data = {ORIGINAL_CELL_IDS: []}
+    for cell_type, conn, data, ids in blocks:
+        cells.append(meshio.CellBlock(cell_type,
+                                      np.searchsorted(used, conn)))
+        cell_data[ORIGINAL_CELL_IDS].append(np.asarray(ids, np.int64))
+        for name, values in data.items():
+            cell_data.setdefault(name, []).append(values)
+    if not cells:
+        cell_data = {}
+    selected = {ORIGINAL_POINT_IDS: used}
+    for name, values in (point_data or {}).items():
+        selected[name] = np.asarray(values)[used]
+    return meshio.Mesh(coords, cells, cell_data=cell_data,
+                       point_data=selected)
+
+
+def select_mesh(mesh, nodes=True, elements=True, regions=None, bbox=None):
+    """
+    Selects part of a mesh
+
+    An element is selected when its Region is in regions and all of its
+    nodes lie inside bbox. Nodes are renumbered to the selected ones and
+    the original ids are kept as vtkOriginalPointIds and
+    vtkOriginalCellIds. Point data is kept for the selected nodes.
+
+    :param mesh: The full mesh
+    :param nodes: Keep the nodes, False returns only the connectivity in
+        original node ids
+    :param elements: Keep the elements, False returns only the nodes
+    :param regions: Optional set of Region ids to keep
+    :param bbox: Optional (xmin, ymin, zmin, xmax, ymax, zmax)
+
+    :returns meshio.Mesh
+    """
+    with phase("select"):
+        if regions is None and bbox is None:
+            if not elements:
+                return meshio.Mesh(mesh.points, [])
+            if not nodes:
+                return meshio.Mesh(np.empty((0, 3)), mesh.cells,
+                                   cell_data=mesh.cell_data)
+            return mesh
+
+        inside = None if bbox is None else in_bbox(mesh.points, bbox)
+        blocks = []
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            keep = np.ones(len(conn), dtype=bool)
+            if regions is not None:
+                region = mesh.cell_data.get('Region')
+                if region is not None:
+                    keep &= np.isin(region[i], list(regions))
+                else:
+                    keep[:] = False
+            if inside is not None:
+                keep &= inside[conn].all(axis=1)
+            ids = np.nonzero(keep)[0]
+            data = {name: np.asarray(values[i])[ids]
+                    for name, values in mesh.cell_data.items()}
+            blocks.append((cell_type, np.asarray(conn)[ids], data, ids))
+
+        if not elements:
+            point_ids = (np.nonzero(inside)[0] if regions is None
+                         else np.unique(np.concatenate(
+                             [conn for _, conn, _, _ in blocks])))
+            return compact(mesh.points, [], point_ids, mesh.point_data)
+        if not nodes:
+            return meshio.Mesh(np.empty((0, 3)),
+                               [(t, c) for t, c, _, _ in blocks],
+                               cell_data={name: [d[name] for _, _, d, _ in
+                                                 blocks]
+                                          for name in mesh.cell_data})
+        return compact(mesh.points, blocks, point_data=mesh.point_data)
+
+
+def select_piece(mesh, piece, npieces):
+    """
+    Selects one of npieces contiguous partitions of the cells of a mesh
+
+    Cells are numbered across all blocks, so vtkOriginalCellIds are
+    global and every cell lands in exactly one piece. Point data is kept
+    for the nodes of the piece.
+
+    :param mesh: The full mesh
+    :param piece: 0-based piece number
+    :param npieces: Number of pieces
+
+    :returns meshio.Mesh
+    """
+    from .index import split_range
+
+    if not 0 <= piece < npieces:
+        raise ValueError(f"Piece {piece} out of range for {npieces} pieces")
+    sizes = [len(conn) for _, conn in mesh.cells]
+    start, stop = split_range(sum(sizes), npieces)[piece]
+    with phase("select_piece", piece=piece):
+        blocks = []
+        offset = 0
+        for i, (cell_type, conn) in enumerate(mesh.cells):
+            lo = min(max(start - offset, 0), sizes[i])
+            hi = min(max(stop - offset, 0), sizes[i])
+            if hi > lo:
+                data = {name: np.asarray(values[i])[lo:hi]
+                        for name, values in mesh.cell_data.items()}
+                blocks.append((cell_type, np.asarray(conn)[lo:hi], data,
+                               np.arange(offset + lo, offset + hi)))
+            offset += sizes[i]
+        return compact(mesh.points, blocks, point_data=mesh.point_data)
@@ -0,0 +1,145 @@
+#  Meshes shared between processes without copying
+#
+#  A shared mesh is written once in the binary format to a temporary file,
+#  in /dev/shm when available so it never touches the disk. Workers receive
+#  a small picklable handle and memory map the file, so every process reads
+#  the same physical pages through read-only views.
+import logging
+import os
+import tempfile
+import weakref
+
+from .binary import binary_extension, read_mbm, write_mbm
+
+__all__ = [
+    "MeshHandle",
+    "SharedMesh",
+    "share_mesh",
+]
+
+logger = logging.getLogger(__name__)
+
+# Meshes opened by this process, by file name, with the stamp of the file
+# they were mapped from so that a reused name is mapped again
+_opened = {}
+
+
+def _shared_dir():
+    """ RAM backed /dev/shm when available, the temp directory otherwise """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _forget_removed():
+    """ Drops the meshes whose files were removed, e.g. by another process """
+    for filename in [name for name in _opened if not os.path.exists(name)]:
+        del _opened[filename]
+
+
+def _remove(filename):
+    logger.debug("Removing shared mesh %s", filename)
+    _opened.pop(filename, None)
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+class MeshHandle:
+    """
+    Picklable reference to a shared mesh, cheap to send to workers
+
+    :param filename: The binary file backing the shared mesh
+    """
+
+    __slots__ = ("filename",)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __getstate__(self):
+        return self.filename
+
+    def __setstate__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return f"MeshHandle({self.filename!r})"
+
+    def open(self):
+        """
+        The shared mesh as read-only memory mapped views
+
+        The mesh is mapped once per process and reused by later calls
+        while the file is the same; a new file under the same name is
+        mapped again. Meshes of removed files are released here, the views
+        already handed out stay valid.
+        """
+        stamp = _stamp(self.filename)
+        opened = _opened.get(self.filename)
+        if opened is not None and opened[0] == stamp:
+            return opened[1]
+        _forget_removed()
+        mesh = read_mbm(self.filename, mmap=True)
+        _opened[self.filename] = (stamp, mesh)
+        return mesh
+
+
+class SharedMesh:
+    """
+    A mesh published for other processes
+
+    The backing file is removed by close, on leaving a with block, when
+    the SharedMesh is garbage collected or at interpreter exit, whichever
+    comes first. Workers that already mapped it keep their views.
+
+    :param mesh: The mesh to share
+    :param directory: Where to keep the backing file, defaults to /dev/shm
+    """
+
+    def __init__(self, mesh, directory=None):
+        fd, self.filename = tempfile.mkstemp(
+            prefix="meshiah-", suffix=f".{binary_extension}",
+            dir=directory or _shared_dir())
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove, self.filename)
+        try:
+            write_mbm(self.filename, mesh)
+        except BaseException:
+            self.close()
+            raise
+        self.handle = MeshHandle(self.filename)
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def close(self):
+        """ Removes the backing file """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def share_mesh(mesh, directory=None):
+    """
+    Publishes a mesh for worker processes
+
+    >>> with share_mesh(mesh) as shared:
+    ...     pool.map(work, [shared.handle] * nworkers)
+
+    where work calls handle.open() to get zero-copy read-only views.
+
+    :returns SharedMesh
+    """
+    return SharedMesh(mesh, directory)
@@ -0,0 +1,61 @@
+#  VTK conversion for the Meshiah package
+import numpy as np
+from meshiah.instrument import phase
+
+__all__ = [
+    "meshio_to_vtk_type",
+    "vtk_cell_arrays",
+]
+
+try:
+    from meshio._vtk_common import meshio_to_vtk_type
+except ImportError:
+    from meshio.vtk._vtk import meshio_to_vtk_type
+
+
+def vtk_cell_arrays(mesh, allocate=np.empty, chunk_size=None):
+    """
+    Converts the cell blocks of a mesh into VTK legacy cell arrays
+
+    The connectivity holds the point count before each cell as
+    expected by vtkUnstructuredGrid.SetCells.
+
+    :param mesh: The mesh to convert
+    :type mesh: meshio.Mesh
+    :param allocate: Creates the output arrays given shape and dtype,
+        e.g. to place them in memory mapped files
+    :param chunk_size: Number of cells converted at a time, bounding the
+        temporary memory, defaults to whole blocks
+
+    :returns (cell_types, cell_offsets, cell_conn)
+    """
+    with phase("vtk_conversion"):
+        return _vtk_cell_arrays(mesh, allocate, chunk_size)
+
+
+def _vtk_cell_arrays(mesh, allocate, chunk_size):
+    ncells_total = sum(len(data) for _, data in mesh.cells)
+    nconn_total = sum(data.size + len(data) for _, data in mesh.cells)
+    cell_types = allocate(ncells_total, dtype=np.ubyte)
+    cell_offsets = allocate(ncells_total, dtype=np.int64)
+    cell_conn = allocate(nconn_total, dtype=np.int64)
+
+    cell_start = 0
+    conn_start = 0
+    for cell_type, data in mesh.cells:
+        ncells, npoints = data.shape
+        cell_end = cell_start + ncells
+        conn_end = conn_start + ncells * (npoints + 1)
+        cell_types[cell_start:cell_end] = meshio_to_vtk_type[cell_type]
+        block = cell_conn[conn_start:conn_end].reshape(ncells, npoints + 1)
+        step = chunk_size or max(ncells, 1)
+        for start in range(0, ncells, step):
+            stop = min(start + step, ncells)
+            cell_offsets[cell_start + start:cell_start + stop] = (
+                conn_start + (npoints + 1) *
+                np.arange(start, stop, dtype=np.int64))
+            block[start:stop, 0] = npoints
+            block[start:stop, 1:] = data[start:stop]
+        cell_start = cell_end
+        conn_start = conn_end
+    return cell_types, cell_offsets, cell_conn
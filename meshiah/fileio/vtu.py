@@ -0,0 +1,317 @@
+#  Direct VTU writer with raw appended binary data
+#
+#  The XML header is written first with blank padded offsets, then every
+#  array is streamed in chunks straight from its NumPy buffer into the
+#  appended section, optionally zlib compressed per block in a thread
+#  pool, and finally the offsets are patched into the header. Nothing is
+#  base64 encoded and no array is copied whole.
+import collections
+import concurrent.futures
+import os
+import struct
+import zlib
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+from .vtk import meshio_to_vtk_type
+
+__all__ = [
+    "write_pvd",
+    "write_vtu",
+    "write_vtu_series",
+]
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+_CHUNK = 1 << 22
+# Room for a quoted offset, padded with the blanks allowed before "/>"
+_OFFSET_WIDTH = 22
+_VTK_TYPES = {
+    np.dtype(np.int8): "Int8",
+    np.dtype(np.uint8): "UInt8",
+    np.dtype(np.int16): "Int16",
+    np.dtype(np.uint16): "UInt16",
+    np.dtype(np.int32): "Int32",
+    np.dtype(np.uint32): "UInt32",
+    np.dtype(np.int64): "Int64",
+    np.dtype(np.uint64): "UInt64",
+    np.dtype(np.float32): "Float32",
+    np.dtype(np.float64): "Float64",
+}
+
+
+def _vtk_type(dtype):
+    dtype = np.dtype(dtype)
+    if dtype == np.bool_:
+        return "UInt8", np.dtype(np.uint8)
+    dtype = dtype.newbyteorder('=')
+    if dtype not in _VTK_TYPES:
+        raise ValueError(f"Cannot write arrays of type {dtype} to VTU")
+    return _VTK_TYPES[dtype], dtype
+
+
+def _chunks(arrays, dtype):
+    """ Contiguous little-endian chunks of arrays, at most _CHUNK bytes """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    for array in arrays:
+        rows = max(1, _CHUNK // max(1, array[:1].nbytes))
+        for start in range(0, len(array), rows):
+            yield np.ascontiguousarray(array[start:start + rows],
+                                       dtype=dtype)
+
+
+def _blocks(chunks, block_size):
+    """ Regroups chunks into blocks of block_size bytes for compression """
+    pending = bytearray()
+    for chunk in chunks:
+        view = memoryview(chunk).cast('B')
+        while len(pending) + len(view) >= block_size:
+            take = block_size - len(pending)
+            if pending:
+                pending += view[:take]
+                yield bytes(pending)
+                pending = bytearray()
+            else:
+                yield view[:take]
+            view = view[take:]
+        pending += view
+    if pending:
+        yield bytes(pending)
+
+
+class _AppendedData:
+    """ Streams arrays into the appended section of an open VTU file """
+
+    def __init__(self, ofile, compression, block_size, max_workers):
+        self.ofile = ofile
+        self.start = ofile.tell()
+        self.compression = compression
+        self.block_size = block_size
+        self.pool = None
+        if compression is not None:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+            self.window = 2 * (max_workers or os.cpu_count() or 1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def write(self, chunks, nbytes):
+        """ Appends nbytes given in chunks, returning its offset """
+        offset = self.ofile.tell() - self.start
+        if self.compression is None:
+            self.ofile.write(struct.pack('<Q', nbytes))
+            for chunk in chunks:
+                self.ofile.write(chunk.data)
+            return offset
+
+        nblocks = -(-nbytes // self.block_size)
+        last = nbytes - (nblocks - 1) * self.block_size if nblocks else 0
+        header_at = self.ofile.tell()
+        self.ofile.write(bytes(8 * (3 + nblocks)))
+        sizes = []
+        futures = collections.deque()
+        for block in _blocks(chunks, self.block_size):
+            futures.append(self.pool.submit(zlib.compress, block,
+                                            self.compression))
+            if len(futures) >= self.window:
+                sizes.append(self.ofile.write(futures.popleft().result()))
+        while futures:
+            sizes.append(self.ofile.write(futures.popleft().result()))
+        end = self.ofile.tell()
+        self.ofile.seek(header_at)
+        self.ofile.write(struct.pack(f'<{3 + nblocks}Q', nblocks,
+                                     self.block_size, last, *sizes))
+        self.ofile.seek(end)
+        return offset
+
+
+def _data_arrays(mesh, point_data, cell_data):
+    """ (section, name, list of arrays, number of components) to write """
+    arrays = []
+    for name, data in {**mesh.point_data, **(point_data or {})}.items():
+        data = np.asarray(data)
+        arrays.append(("PointData", name, [data],
+                       data.shape[1] if data.ndim > 1 else 1))
+    sizes = [len(conn) for _, conn in mesh.cells]
+    for name, data in {**mesh.cell_data, **(cell_data or {})}.items():
+        if isinstance(data, (list, tuple)):
+            blocks = [np.asarray(block) for block in data]
+        else:
+            # One value per cell over all blocks, e.g. flux per facet
+            data = np.asarray(data)
+            if len(data) != sum(sizes):
+                raise ValueError(f"Cell data {name} has {len(data)} values "
+                                 f"for {sum(sizes)} cells")
+            blocks = np.split(data, np.cumsum(sizes)[:-1])
+        arrays.append(("CellData", name, blocks,
+                       blocks[0].shape[1] if blocks[0].ndim > 1 else 1))
+    return arrays
+
+
+def write_vtu(filename, mesh, point_data=None, cell_data=None,
+              compression=None, block_size=DEFAULT_BLOCK_SIZE,
+              max_workers=None):
+    """
+    Writes a mesh as a VTK XML unstructured grid with raw appended data
+
+    :param filename: The name of the .vtu file
+    :param mesh: The mesh, its point and cell data are written too
+    :type mesh: meshio.Mesh
+    :param point_data: Extra dict of name to one value per node, e.g. FSD
+    :param cell_data: Extra dict of name to one value per cell over all
+        blocks, e.g. flux, or to a list with one array per block
+    :param compression: zlib level 1-9 to compress the arrays, default None
+    :param block_size: Uncompressed bytes per compressed block
+    :param max_workers: Threads compressing blocks
+    """
+    points = np.asarray(mesh.points)
+    ncells = sum(len(conn) for _, conn in mesh.cells)
+    npoints_per_cell = [conn.shape[1] for _, conn in mesh.cells]
+    conn_dtype = np.dtype(np.int32 if len(points) < 2 ** 31 else np.int64)
+    data_arrays = _data_arrays(mesh, point_data, cell_data)
+
+    def point_chunks():
+        rows = max(1, _CHUNK // 24)
+        for start in range(0, len(points), rows):
+            chunk = points[start:start + rows]
+            if chunk.shape[1] < 3:
+                chunk = np.hstack([chunk, np.zeros((len(chunk),
+                                                    3 - chunk.shape[1]))])
+            yield np.ascontiguousarray(chunk, dtype='<f8')
+
+    def offset_chunks():
+        end = 0
+        for (_, conn), width in zip(mesh.cells, npoints_per_cell):
+            rows = max(1, _CHUNK // 8)
+            for start in range(0, len(conn), rows):
+                stop = min(start + rows, len(conn))
+                yield (end + width * np.arange(start + 1, stop + 1,
+                                               dtype='<i8'))
+            end += width * len(conn)
+
+    def type_chunks():
+        for cell_type, conn in mesh.cells:
+            for start in range(0, len(conn), _CHUNK):
+                yield np.full(min(_CHUNK, len(conn) - start),
+                              meshio_to_vtk_type[cell_type], dtype=np.uint8)
+
+    # (section, xml attributes, chunks generator, nbytes) of each array
+    conn_size = sum(np.asarray(conn).size for _, conn in mesh.cells)
+    arrays = [
+        ("Points", 'type="Float64" NumberOfComponents="3"', point_chunks(),
+         24 * len(points)),
+        ("Cells", f'type="{_VTK_TYPES[conn_dtype]}" Name="connectivity"',
+         _chunks([np.asarray(conn) for _, conn in mesh.cells], conn_dtype),
+         conn_dtype.itemsize * conn_size),
+        ("Cells", 'type="Int64" Name="offsets"', offset_chunks(),
+         8 * ncells),
+        ("Cells", 'type="UInt8" Name="types"', type_chunks(), ncells),
+    ]
+    for section, name, blocks, components in data_arrays:
+        type_name, dtype = _vtk_type(blocks[0].dtype)
+        attributes = f'type="{type_name}" Name={quoteattr(name)}'
+        if components > 1:
+            attributes += f' NumberOfComponents="{components}"'
+        arrays.append((section, attributes,
+                       _chunks(blocks, dtype),
+                       dtype.itemsize * sum(block.size for block in blocks)))
+
+    compressor = ('' if compression is None
+                  else ' compressor="vtkZLibDataCompressor"')
+    header = [f'<?xml version="1.0"?>\n'
+              f'<VTKFile type="UnstructuredGrid" version="1.0" '
+              f'byte_order="LittleEndian" header_type="UInt64"'
+              f'{compressor}>\n'
+              f'<UnstructuredGrid>\n'
+              f'<Piece NumberOfPoints="{len(points)}" '
+              f'NumberOfCells="{ncells}">\n']
+    placeholders = []
+    section = None
+    for name, attributes, _, _ in arrays:
+        if name != section:
+            if section is not None:
+                header.append(f'</{section}>\n')
+            header.append(f'<{name}>\n')
+            section = name
+        header.append(f'<DataArray {attributes} format="appended" offset=')
+        placeholders.append(len("".join(header).encode()))
+        header.append('"0"'.ljust(_OFFSET_WIDTH) + '/>\n')
+    header.append(f'</{section}>\n</Piece>\n</UnstructuredGrid>\n'
+                  f'<AppendedData encoding="raw">\n_')
+
+    with phase("write_vtu", filename=filename):
+        with open(filename, 'wb') as ofile:
+            ofile.write("".join(header).encode())
+            appended = _AppendedData(ofile, compression, block_size,
+                                     max_workers)
+            try:
+                offsets = [appended.write(chunks, nbytes)
+                           for _, _, chunks, nbytes in arrays]
+            finally:
+                appended.close()
+            ofile.write(b'\n</AppendedData>\n</VTKFile>\n')
+            nbytes = ofile.tell()
+            for at, offset in zip(placeholders, offsets):
+                ofile.seek(at)
+                ofile.write(f'"{offset}"'.ljust(_OFFSET_WIDTH).encode())
+    count("bytes", nbytes)
+    count("cells", ncells)
+
+
+def write_pvd(filename, entries):
+    """
+    Writes a ParaView collection of a time series
+
+    :param filename: The name of the .pvd file
+    :param entries: (time, file name) pairs, file names are written
+        relative to the collection
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    lines = ['<?xml version="1.0"?>',
+             '<VTKFile type="Collection" version="0.1" '
+             'byte_order="LittleEndian">',
+             '<Collection>']
+    for time, path in entries:
+        path = os.path.relpath(os.path.abspath(path), directory)
+        lines.append(f'<DataSet timestep="{float(time)!r}" part="0" '
+                     f'file={quoteattr(path)}/>')
+    lines += ['</Collection>', '</VTKFile>', '']
+    with open(filename, 'w') as ofile:
+        ofile.write("\n".join(lines))
+
+
+def write_vtu_series(prefix, mesh, data_files, name, times=None, **kwargs):
+    """
+    Writes one VTU per fsd or flux file and a .pvd collection of them
+
+    A data file holding one value per node is written as point data,
+    otherwise as cell data.
+
+    :param prefix: Path prefix, files are prefix_00000.vtu, ... and
+        prefix.pvd
+    :param mesh: The mesh the data belongs to
+    :param data_files: fsd or flux files, one per timestep
+    :param name: Name of the data array
+    :param times: Time of each step, defaults to 0, 1, ...
+    :param kwargs: compression, block_size and max_workers as for
+        write_vtu
+
+    :returns the .pvd file name
+    """
+    from .fileio import read_data_from_file
+
+    data_files = list(data_files)
+    times = list(range(len(data_files))) if times is None else list(times)
+    entries = []
+    for index, (time, path) in enumerate(zip(times, data_files)):
+        values = read_data_from_file(path)
+        filename = f"{prefix}_{index:05d}.vtu"
+        if len(values) == len(mesh.points):
+            write_vtu(filename, mesh, point_data={name: values}, **kwargs)
+        else:
+            write_vtu(filename, mesh, cell_data={name: values}, **kwargs)
+        entries.append((time, filename))
+    write_pvd(f"{prefix}.pvd", entries)
+    return f"{prefix}.pvd"
@@ -0,0 +1,2 @@
+from .flux import *
+from .series import *
@@ -0,0 +1,126 @@
+#  Aggregation of binary flux files over many lights
+#
+#  Every flux file holds one value per facet summed over the lights named
+#  in its header. Files of several light batches add up facet by facet,
+#  and the per light flux is the total divided by the total light count.
+import os
+
+import numpy as np
+
+from meshiah.fileio import fileio
+from meshiah.fileio.parallel import _executor
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "aggregate_flux",
+    "check_flux_headers",
+    "flux_cell_data",
+    "sum_flux",
+]
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def check_flux_headers(paths):
+    """
+    Checks that flux files can be summed
+
+    :param paths: The flux files
+    :returns (total number of lights, number of values per file)
+    :raises ValueError: when a file is truncated, has no lights or holds a
+        different number of values than the others
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No flux files to aggregate")
+    number_of_lights = 0
+    nvalues = None
+    for path in paths:
+        lights, size = fileio._checked_flux_header(path)
+        if lights <= 0:
+            raise ValueError(f"Flux file {path} has {lights} lights")
+        if nvalues is not None and size != nvalues:
+            raise ValueError(f"Flux file {path} has {size} values, "
+                             f"expected {nvalues} as in {paths[0]}")
+        number_of_lights += lights
+        nvalues = size
+    return number_of_lights, nvalues
+
+
+def sum_flux(paths, start=0, stop=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Sums facets [start:stop) over flux files
+
+    One file is open at a time and read chunk_size values at a time, so
+    any number of files can be summed within the descriptor and memory
+    map limits.
+
+    :returns float64 array of the facet totals
+    """
+    paths = list(paths)
+    stop = fileio._checked_flux_header(paths[0])[1] if stop is None \
+        else stop
+    total = np.zeros(stop - start)
+    for path in paths:
+        with open(path, 'rb') as ifile:
+            for lo in range(start, stop, chunk_size):
+                hi = min(lo + chunk_size, stop)
+                out = total[lo - start:hi - start]
+                ifile.seek(8 + 8 * lo)
+                values = np.fromfile(ifile, dtype='<f8', count=hi - lo)
+                if len(values) != hi - lo:
+                    raise ValueError(f"Flux file {path} is truncated")
+                np.add(out, values, out=out)
+    return total
+
+
+def aggregate_flux(paths, normalize=True, chunk_size=DEFAULT_CHUNK_SIZE,
+                   max_workers=None, processes=False):
+    """
+    Accumulates any number of flux files into per facet values
+
+    The facets are split into one contiguous range per worker, and each
+    worker sums its range over all files.
+
+    :param paths: The flux files, all with the same number of values
+    :param normalize: Divide the totals by the total number of lights
+    :param chunk_size: Number of facets summed at a time
+    :param max_workers: Number of workers, one runs in the caller
+    :param processes: Use a process pool instead of threads
+
+    :returns (values, total number of lights)
+    """
+    paths = list(paths)
+    with phase("aggregate_flux", files=len(paths)):
+        number_of_lights, nvalues = check_flux_headers(paths)
+        max_workers = max_workers or 1
+        if max_workers == 1 or nvalues < 2 * chunk_size:
+            total = sum_flux(paths, chunk_size=chunk_size)
+        else:
+            bounds = np.linspace(0, nvalues, max_workers + 1).astype(int)
+            with _executor(max_workers, processes) as pool:
+                parts = [pool.submit(sum_flux, paths, lo, hi, chunk_size)
+                         for lo, hi in zip(bounds[:-1], bounds[1:])]
+                total = np.concatenate([part.result() for part in parts])
+        if normalize:
+            total /= number_of_lights
+    count("values", nvalues * len(paths))
+    count("bytes", sum(os.path.getsize(path) for path in paths))
+    return total, number_of_lights
+
+
+def flux_cell_data(mesh, values, name="FluxData"):
+    """
+    Attaches one value per facet to a mesh as cell data
+
+    Facets run over the cells of all blocks in order.
+
+    :returns the mesh
+    """
+    values = np.asarray(values)
+    sizes = [len(data) for _, data in mesh.cells]
+    if len(values) != sum(sizes):
+        raise ValueError(f"{len(values)} flux values for a mesh with "
+                         f"{sum(sizes)} cells")
+    mesh.cell_data[name] = np.split(values, np.cumsum(sizes)[:-1])
+    return mesh
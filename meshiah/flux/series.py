@@ -0,0 +1,126 @@
+#  Numbered series of flux files played back as timesteps
+import collections
+import glob
+import logging
+import re
+
+import numpy as np
+
+from meshiah.fileio import fileio
+
+__all__ = [
+    "DEFAULT_CACHE_BYTES",
+    "FluxSeries",
+    "series_paths",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 1 << 30
+_NUMBERED = re.compile(r"(.*)_(\d+)\.([^.]+)")
+
+
+def series_paths(filename):
+    """
+    Finds the numbered series a file belongs to
+
+    prefix_00003.bin belongs to prefix_<digits>.bin, ordered by number.
+
+    :returns (list of file names, list of their numbers), the file alone
+        numbered 0 when its name carries no number
+    """
+    match = _NUMBERED.fullmatch(filename)
+    if match is None:
+        return [filename], [0]
+    prefix, _, ext = match.groups()
+    numbered = []
+    for path in glob.glob(f"{glob.escape(prefix)}_*.{glob.escape(ext)}"):
+        other = _NUMBERED.fullmatch(path)
+        if other and other.group(1) == prefix:
+            numbered.append((int(other.group(2)), path))
+    numbered.sort()
+    return [path for _, path in numbered], [number for number, _ in numbered]
+
+
+class FluxSeries:
+    """
+    Random access to the steps of a flux file series
+
+    Steps are memory mapped rather than read. Normalized steps (divided by
+    their light count) are computed once and kept in an LRU cache holding
+    at most max_bytes, so replaying recent steps costs nothing. Without
+    normalize the cached arrays are the read-only maps themselves.
+
+    :param paths: The flux files, one per step
+    :param times: Time value of each step, defaults to 0, 1, ...
+    :param number_of_lights: Required light count of every file
+    :param normalize: Divide the values by the light count of their file
+    :param max_bytes: Memory cap of the cache
+    """
+
+    def __init__(self, paths, times=None, number_of_lights=None,
+                 normalize=True, max_bytes=DEFAULT_CACHE_BYTES):
+        self.paths = list(paths)
+        if not self.paths:
+            raise ValueError("A flux series needs at least one file")
+        self.times = np.asarray(range(len(self.paths)) if times is None
+                                else times, dtype=np.float64)
+        if len(self.times) != len(self.paths):
+            raise ValueError(f"{len(self.times)} times for "
+                             f"{len(self.paths)} flux files")
+        self.number_of_lights = number_of_lights
+        self.normalize = normalize
+        self.max_bytes = max_bytes
+        self.nvalues = None
+        self.cached_bytes = 0
+        self._cache = collections.OrderedDict()
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        """ The series of the numbered siblings of a flux file """
+        paths, numbers = series_paths(filename)
+        return cls(paths, times=numbers, **kwargs)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def index_at(self, time):
+        """ The step whose time is nearest to the given time """
+        return int(np.abs(self.times - time).argmin())
+
+    def __getitem__(self, index):
+        values = self._cache.get(index)
+        if values is not None:
+            self._cache.move_to_end(index)
+            return values
+        values = self._load(index)
+        self._cache[index] = values
+        self.cached_bytes += values.nbytes
+        while self.cached_bytes > self.max_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+        return values
+
+    def _load(self, index):
+        path = self.paths[index]
+        logger.debug("Loading flux step %d from %s", index, path)
+        lights, values = fileio.open_flux_file(path)
+        if self.number_of_lights is not None and \
+                lights != self.number_of_lights:
+            raise ValueError(f"{path} has {lights} lights, expected "
+                             f"{self.number_of_lights}")
+        if self.nvalues is None:
+            self.nvalues = len(values)
+        elif len(values) != self.nvalues:
+            raise ValueError(f"{path} has {len(values)} values, expected "
+                             f"{self.nvalues}")
+        if self.normalize:
+            if lights <= 0:
+                raise ValueError(f"{path} has {lights} lights")
+            values = values / lights
+        return values
+
+    def clear(self):
+        """ Empties the cache """
+        self._cache.clear()
+        self.cached_bytes = 0
@@ -0,0 +1 @@
+from .generate import *
@@ -0,0 +1,296 @@
+#  Synthetic ERDC meshes and results for load testing
+import math
+import os
+
+import numpy as np
+
+from meshiah.fileio import _format
+
+__all__ = [
+    "generate",
+    "generate_2dm",
+    "generate_3dm",
+    "generate_flux_series",
+    "generate_fsd_series",
+    "series_filename",
+]
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+# Kuhn subdivision of a cube into six positively oriented tetrahedra.
+# Corner v of the cube is offset (v >> 2 & 1, v >> 1 & 1, v & 1).
+KUHN_TETS = np.array([[0, 4, 6, 7], [0, 5, 4, 7], [0, 6, 2, 7],
+                      [0, 2, 3, 7], [0, 1, 5, 7], [0, 3, 1, 7]])
+
+
+class _Permutation:
+    """
+    Affine permutation i -> (a * i + b) % n
+
+    Used to scramble node and element numbering of randomized meshes
+    without holding a permutation array of the full mesh size.
+    """
+
+    def __init__(self, n, rng=None):
+        self.n = n
+        if rng is None or n < 2:
+            self.a, self.b, self.a_inv = 1, 0, 1
+            return
+        a = int(rng.integers(n // 3, 2 * n // 3 + 1)) | 1
+        while math.gcd(a, n) != 1:
+            a += 2
+        self.a = a % n
+        self.b = int(rng.integers(0, n))
+        self.a_inv = _mod_inverse(self.a, n)
+
+    def forward(self, index):
+        return (self.a * index + self.b) % self.n
+
+    def inverse(self, index):
+        return (self.a_inv * (index - self.b)) % self.n
+
+
+def _mod_inverse(a, n):
+    """ Modular inverse of a modulo n by the extended Euclidean algorithm """
+    r0, r1, s0, s1 = n, a % n, 0, 1
+    while r1:
+        q = r0 // r1
+        r0, r1 = r1, r0 - q * r1
+        s0, s1 = s1, s0 - q * s1
+    return s0 % n
+
+
+def series_filename(prefix, index, ext):
+    """ Name of the index-th file of a numbered result series """
+    return f"{prefix}_{index:05d}.{ext}"
+
+
+def _grid_shape(ncells, dim):
+    """ Number of grid intervals per axis giving about ncells elements """
+    if dim == 2:
+        nx = max(1, int(math.ceil(math.sqrt(ncells / 2))))
+        ny = max(1, int(math.ceil(ncells / (2 * nx))))
+        return nx, ny
+    n = max(1, int(round((ncells / 6) ** (1 / 3))))
+    nz = max(1, int(math.ceil(ncells / (6 * n * n))))
+    return n, n, nz
+
+
+def _write_erdc(filename, card, element_card, npoints, ncells, nregions,
+                node_chunk, element_chunk, chunk_size):
+    """
+    Writes an ERDC mesh file chunk by chunk
+
+    node_chunk(start, stop) returns the coordinates of nodes start:stop
+    and element_chunk(start, stop) returns their 1-based connectivity and
+    region ids, so no more than chunk_size rows are ever held in memory.
+    """
+    id_width = _format.int_width(max(npoints, ncells)) + 1
+    node_width = _format.int_width(npoints) + 1
+    region_width = _format.int_width(nregions) + 1
+    element_card = element_card.encode()
+    with open(filename, 'wb') as ofile:
+        ofile.write(card.encode() + b"\n")
+        for start in range(0, ncells, chunk_size):
+            stop = min(start + chunk_size, ncells)
+            conn, regions = element_chunk(start, stop)
+            fields = [element_card,
+                      _format.format_int(np.arange(start + 1, stop + 1),
+                                         id_width)]
+            fields += [_format.format_int(column, node_width)
+                       for column in conn.T]
+            fields.append(_format.format_int(regions, region_width))
+            ofile.write(_format.join_fields(stop - start, fields))
+        for start in range(0, npoints, chunk_size):
+            stop = min(start + chunk_size, npoints)
+            points = node_chunk(start, stop)
+            width = _format.float_width(np.abs(points).max(), 6) + 1
+            fields = [b"ND",
+                      _format.format_int(np.arange(start + 1, stop + 1),
+                                         id_width)]
+            fields += [_format.format_float(column, width, 6)
+                       for column in points.T]
+            ofile.write(_format.join_fields(stop - start, fields))
+
+
+def generate_2dm(filename, ncells, regions=1, randomize=False, seed=0,
+                 spacing=1.0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes a synthetic triangle surface mesh as a 2dm file
+
+    The mesh is a grid of squares split into two triangles each, with a
+    gentle terrain height. Regions are bands along x. A randomized mesh
+    jitters the interior nodes and scrambles the node and element
+    numbering.
+
+    :param filename: The name of the 2dm file to write
+    :param ncells: Approximate number of triangles
+    :param regions: Number of Region ids
+    :param randomize: Jitter nodes and scramble the numbering
+    :param seed: Seed of the random generator
+    :param spacing: Grid spacing
+    :param chunk_size: Number of lines formatted at a time
+
+    :returns (number_of_points, number_of_cells)
+    """
+    nx, ny = _grid_shape(ncells, 2)
+    npoints = (nx + 1) * (ny + 1)
+    ncells = 2 * nx * ny
+    rng = np.random.default_rng(seed) if randomize else None
+    node_perm = _Permutation(npoints, rng)
+    cell_perm = _Permutation(ncells, rng)
+
+    def node_chunk(start, stop):
+        node = node_perm.inverse(np.arange(start, stop, dtype=np.int64))
+        i, j = np.divmod(node, ny + 1)
+        x = i * spacing
+        y = j * spacing
+        if randomize:
+            jitter = np.random.default_rng([seed, start]).uniform(
+                -0.2 * spacing, 0.2 * spacing, (2, stop - start))
+            x = x + jitter[0] * ((i > 0) & (i < nx))
+            y = y + jitter[1] * ((j > 0) & (j < ny))
+        z = (0.05 * nx * spacing * np.sin(2 * np.pi * x / (nx * spacing))
+             * np.cos(2 * np.pi * y / (ny * spacing)))
+        return np.column_stack([x, y, z])
+
+    def element_chunk(start, stop):
+        cell = cell_perm.inverse(np.arange(start, stop, dtype=np.int64))
+        square, half = np.divmod(cell, 2)
+        i, j = np.divmod(square, ny)
+        a = i * (ny + 1) + j
+        b = a + ny + 1
+        c = b + 1
+        d = a + 1
+        conn = np.column_stack([a, np.where(half, c, b), np.where(half, d, c)])
+        return node_perm.forward(conn) + 1, 1 + i * regions // nx
+
+    _write_erdc(filename, "MESH2D", "E3T", npoints, ncells, regions,
+                node_chunk, element_chunk, chunk_size)
+    return npoints, ncells
+
+
+def generate_3dm(filename, ncells, regions=1, randomize=False, seed=0,
+                 spacing=1.0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes a synthetic tetrahedral mesh as a 3dm file
+
+    The mesh is a block of cubes split into six tetrahedra each. Regions
+    are layers along z. A randomized mesh jitters the interior nodes and
+    scrambles the node and element numbering.
+
+    :param filename: The name of the 3dm file to write
+    :param ncells: Approximate number of tetrahedra
+    :param regions: Number of Region ids
+    :param randomize: Jitter nodes and scramble the numbering
+    :param seed: Seed of the random generator
+    :param spacing: Grid spacing
+    :param chunk_size: Number of lines formatted at a time
+
+    :returns (number_of_points, number_of_cells)
+    """
+    nx, ny, nz = _grid_shape(ncells, 3)
+    npoints = (nx + 1) * (ny + 1) * (nz + 1)
+    ncells = 6 * nx * ny * nz
+    rng = np.random.default_rng(seed) if randomize else None
+    node_perm = _Permutation(npoints, rng)
+    cell_perm = _Permutation(ncells, rng)
+    offsets = np.array([((v >> 2) & 1) * (ny + 1) * (nz + 1) +
+                        ((v >> 1) & 1) * (nz + 1) + (v & 1)
+                        for v in range(8)])
+    tet_offsets = offsets[KUHN_TETS]
+
+    def node_chunk(start, stop):
+        node = node_perm.inverse(np.arange(start, stop, dtype=np.int64))
+        ij, k = np.divmod(node, nz + 1)
+        i, j = np.divmod(ij, ny + 1)
+        points = np.column_stack([i, j, k]) * spacing
+        if randomize:
+            jitter = np.random.default_rng([seed, start]).uniform(
+                -0.2 * spacing, 0.2 * spacing, (stop - start, 3))
+            interior = ((i > 0) & (i < nx) & (j > 0) & (j < ny) &
+                        (k > 0) & (k < nz))
+            points += jitter * interior[:, None]
+        return points
+
+    def element_chunk(start, stop):
+        cell = cell_perm.inverse(np.arange(start, stop, dtype=np.int64))
+        cube, tet = np.divmod(cell, 6)
+        ij, k = np.divmod(cube, nz)
+        i, j = np.divmod(ij, ny)
+        base = (i * (ny + 1) + j) * (nz + 1) + k
+        conn = base[:, None] + tet_offsets[tet]
+        return node_perm.forward(conn) + 1, 1 + k * regions // nz
+
+    _write_erdc(filename, "MESH3D", "E4T", npoints, ncells, regions,
+                node_chunk, element_chunk, chunk_size)
+    return npoints, ncells
+
+
+def generate(filename, ncells, **kwargs):
+    """ Writes a synthetic 2dm or 3dm mesh depending on the extension """
+    ext = os.path.splitext(filename)[-1].lower()
+    if ext == ".2dm":
+        return generate_2dm(filename, ncells, **kwargs)
+    elif ext == ".3dm":
+        return generate_3dm(filename, ncells, **kwargs)
+    raise ValueError(f"Cannot generate a mesh with extension {ext}")
+
+
+def generate_fsd_series(prefix, nvalues, ntimesteps, seed=0,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes a numbered series of synthetic fsd files
+
+    Each file holds one value per line, e.g. one temperature per node,
+    following a diurnal cycle over the series.
+
+    :param prefix: Path prefix, files are named prefix_00000.fsd, ...
+    :param nvalues: Number of values per file
+    :param ntimesteps: Number of files in the series
+    :param seed: Seed of the random generator
+
+    :returns list of file names
+    """
+    filenames = []
+    for step in range(ntimesteps):
+        filename = series_filename(prefix, step, "fsd")
+        phase = np.sin(2 * np.pi * step / max(ntimesteps, 1))
+        with open(filename, 'wb') as ofile:
+            for start in range(0, nvalues, chunk_size):
+                stop = min(start + chunk_size, nvalues)
+                base = np.random.default_rng([seed, start]).uniform(
+                    -5.0, 5.0, stop - start)
+                values = 290.0 + 10.0 * phase + base
+                ofile.write(_format.join_fields(
+                    stop - start, [_format.format_float(values, 12, 6)]))
+        filenames.append(filename)
+    return filenames
+
+
+def generate_flux_series(prefix, nvalues, nfiles, number_of_lights=1,
+                         seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes a numbered series of synthetic binary flux files
+
+    :param prefix: Path prefix, files are named prefix_00000.bin, ...
+    :param nvalues: Number of facet values per file
+    :param nfiles: Number of files in the series
+    :param number_of_lights: Number of lights recorded in the header
+    :param seed: Seed of the random generator
+
+    :returns list of file names
+    """
+    filenames = []
+    for index in range(nfiles):
+        filename = series_filename(prefix, index, "bin")
+        with open(filename, 'wb') as ofile:
+            ofile.write(np.array([number_of_lights, nvalues],
+                                 dtype='<i4').tobytes())
+            for start in range(0, nvalues, chunk_size):
+                stop = min(start + chunk_size, nvalues)
+                values = np.random.default_rng([seed, index, start]).uniform(
+                    0.0, 1000.0 * number_of_lights, stop - start)
+                ofile.write(values.astype('<f8').tobytes())
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1 @@
+from .geometry import *
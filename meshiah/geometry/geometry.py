@@ -0,0 +1,189 @@
+#  Geometric properties of mesh elements
+#
+#  Triangle areas, unit normals and centroids, and tetrahedron volumes and
+#  centroids, computed in bulk for every cell block and laid out as meshio
+#  cell data: one array per block for each property name.
+import zlib
+
+import numpy as np
+
+from meshiah._cache import ArrayKey, mesh_arrays
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "GEOMETRY_NAMES",
+    "add_cell_properties",
+    "cell_properties",
+    "invalidate",
+    "tetra_properties",
+    "triangle_properties",
+]
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+GEOMETRY_NAMES = ("Area", "Normal", "Centroid", "Volume")
+_WIDTH = {"Area": 1, "Normal": 3, "Centroid": 3, "Volume": 1}
+_CACHE = "_meshiah_geometry"
+
+
+def triangle_properties(points, conn, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Areas, unit normals and centroids of triangles
+
+    :param points: Array of shape (n, 3)
+    :param conn: Array of shape (m, 3) of node ids
+    :param chunk_size: Number of triangles processed at a time
+
+    :returns dict with Area (m,), Normal (m, 3) and Centroid (m, 3)
+    """
+    points = np.asarray(points)
+    conn = np.asarray(conn)
+    area = np.empty(len(conn))
+    normal = np.empty((len(conn), 3))
+    centroid = np.empty((len(conn), 3))
+    for start in range(0, len(conn), chunk_size):
+        stop = min(start + chunk_size, len(conn))
+        corners = points[conn[start:stop]]
+        cross = np.cross(corners[:, 1] - corners[:, 0],
+                         corners[:, 2] - corners[:, 0])
+        length = np.sqrt(np.einsum('ij,ij->i', cross, cross))
+        area[start:stop] = 0.5 * length
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normal[start:stop] = cross / length[:, None]
+        centroid[start:stop] = corners.mean(axis=1)
+    return {"Area": area, "Normal": normal, "Centroid": centroid}
+
+
+def tetra_properties(points, conn, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Signed volumes and centroids of tetrahedra
+
+    The volume is negative for inverted elements, whose fourth node lies
+    below the plane of the first three.
+
+    :param points: Array of shape (n, 3)
+    :param conn: Array of shape (m, 4) of node ids
+    :param chunk_size: Number of tetrahedra processed at a time
+
+    :returns dict with Volume (m,) and Centroid (m, 3)
+    """
+    points = np.asarray(points)
+    conn = np.asarray(conn)
+    volume = np.empty(len(conn))
+    centroid = np.empty((len(conn), 3))
+    for start in range(0, len(conn), chunk_size):
+        stop = min(start + chunk_size, len(conn))
+        corners = points[conn[start:stop]]
+        edges = corners[:, 1:] - corners[:, :1]
+        volume[start:stop] = np.einsum(
+            'ij,ij->i', edges[:, 0], np.cross(edges[:, 1], edges[:, 2])) / 6
+        centroid[start:stop] = corners.mean(axis=1)
+    return {"Volume": volume, "Centroid": centroid}
+
+
+def _block_properties(points, cell_type, conn, chunk_size):
+    if cell_type == "triangle":
+        return triangle_properties(points, conn, chunk_size)
+    elif cell_type == "tetra":
+        return tetra_properties(points, conn, chunk_size)
+    return {"Centroid": np.asarray(points)[conn].mean(axis=1)}
+
+
+def _nan(name, ncells):
+    shape = (ncells,) if _WIDTH[name] == 1 else (ncells, _WIDTH[name])
+    return np.full(shape, np.nan)
+
+
+def _checksum(mesh):
+    """ CRC32 of the points and of the connectivity, the persisted key """
+    points = np.ascontiguousarray(mesh.points, dtype='<f8')
+    cells = 0
+    for cell_type, data in mesh.cells:
+        cells = zlib.crc32(cell_type.encode(), cells)
+        data = np.ascontiguousarray(data, dtype='<i8')
+        cells = zlib.crc32(data.reshape(-1).view(np.uint8), cells)
+    return np.array([zlib.crc32(points.reshape(-1).view(np.uint8)), cells],
+                    dtype=np.int64)
+
+
+def _read_only(mesh):
+    """ Whether the points and cells cannot have been changed in place """
+    return not np.asarray(mesh.points).flags.writeable and \
+        not any(np.asarray(data).flags.writeable for _, data in mesh.cells)
+
+
+def cell_properties(mesh, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Geometric properties of all cells of a mesh
+
+    The result is cached on the mesh and recomputed when its points or
+    cell blocks are replaced or changed in place. Properties stored as
+    cell data by a previous add_cell_properties, e.g. read back from the
+    binary cache, are reused when the geometry_key stored with them
+    matches the points and cells.
+    For read-only arrays, such as memory maps of that cache, the key
+    written with them is trusted rather than recomputed.
+
+    :param mesh: The mesh
+    :param chunk_size: Number of cells processed at a time
+
+    :returns dict of Area, Normal, Centroid and/or Volume, those that
+        apply to some block, to a list with one array per cell block
+    """
+    arrays, cell_types = mesh_arrays(mesh)
+    cached = getattr(mesh, _CACHE, None)
+    if cached is not None and cached[0].matches(arrays, cell_types):
+        return cached[1]
+    stored = mesh.field_data.get("geometry_key")
+    checksum = None
+    if stored is not None and np.shape(stored) == (2,):
+        checksum = np.asarray(stored) if _read_only(mesh) \
+            else _checksum(mesh)
+    if checksum is not None and np.array_equal(stored, checksum):
+        props = {name: list(mesh.cell_data[name])
+                 for name in GEOMETRY_NAMES if name in mesh.cell_data}
+    else:
+        with phase("geometry"):
+            blocks = [_block_properties(mesh.points, cell_type, conn,
+                                        chunk_size)
+                      for cell_type, conn in mesh.cells]
+            # Properties that apply to some blocks only are NaN elsewhere
+            props = {name: [block[name] if name in block
+                            else _nan(name, len(conn))
+                            for block, (_, conn) in zip(blocks, mesh.cells)]
+                     for name in GEOMETRY_NAMES
+                     if any(name in block for block in blocks)}
+        count("cells", sum(len(conn) for _, conn in mesh.cells))
+    setattr(mesh, _CACHE, (ArrayKey(arrays, cell_types), props, checksum))
+    return props
+
+
+def invalidate(mesh):
+    """ Drops the cached properties of a mesh """
+    if hasattr(mesh, _CACHE):
+        delattr(mesh, _CACHE)
+
+
+def add_cell_properties(mesh, names=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stores geometric properties as cell data, ready for ParaView
+
+    A checksum of the points and cells is kept as the geometry_key field
+    data so that a mesh written with the properties, e.g. to the binary
+    cache, reuses them when read back. It is computed here, once, not on
+    every lookup.
+
+    :param names: The properties to store, defaults to all that apply
+
+    :returns the mesh
+    """
+    props = cell_properties(mesh, chunk_size)
+    for name in props if names is None else names:
+        mesh.cell_data[name] = props[name]
+    if names is None:
+        key, _, checksum = getattr(mesh, _CACHE)
+        if checksum is None:
+            checksum = _checksum(mesh)
+            setattr(mesh, _CACHE, (key, props, checksum))
+        mesh.field_data["geometry_key"] = checksum
+    return mesh
@@ -0,0 +1,181 @@
+#  Timing and counting hooks for the Meshiah I/O paths
+#
+#  The readers and writers wrap their phases in `phase(...)` and report
+#  sizes through `count(...)`. Nothing is recorded unless a recorder is
+#  active, in which case every active recorder receives the events:
+#
+#      with meshiah.instrument.record(trace_file="read.json") as rec:
+#          mesh = meshiah.read("Scenario1.3dm")
+#      print(rec.summary())
+import contextlib
+import json
+import os
+import threading
+import time
+
+__all__ = [
+    "Recorder",
+    "count",
+    "enabled",
+    "phase",
+    "record",
+]
+
+_recorders = []
+
+
+class Recorder:
+    """
+    Collects the phases and counters reported while it is active
+
+    :param callback: Optional callable receiving each event dict as it
+        is recorded
+    """
+
+    def __init__(self, callback=None):
+        self.events = []
+        self.counters = {}
+        self.callback = callback
+        self._origin = time.perf_counter()
+        # Phases and counts are reported from worker threads too
+        self._lock = threading.Lock()
+
+    def add_event(self, name, start, duration, args):
+        event = {
+            "name": name,
+            "start": start - self._origin,
+            "duration": duration,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """ Totals per phase name and the counters """
+        phases = {}
+        for event in self.events:
+            stats = phases.setdefault(event["name"], {
+                "count": 0, "total": 0.0,
+                "min": float("inf"), "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += event["duration"]
+            stats["min"] = min(stats["min"], event["duration"])
+            stats["max"] = max(stats["max"], event["duration"])
+        return {"phases": phases, "counters": dict(self.counters)}
+
+    def to_json(self, filename):
+        """ Writes the events, summary and counters as JSON """
+        with open(filename, 'w') as ofile:
+            json.dump({"events": self.events, **self.summary()}, ofile,
+                      indent=1, default=str)
+
+    def to_chrome_trace(self, filename):
+        """ Writes the events in the Chrome trace event format """
+        trace = [{
+            "name": event["name"],
+            "ph": "X",
+            "ts": event["start"] * 1e6,
+            "dur": event["duration"] * 1e6,
+            "pid": event["pid"],
+            "tid": event["tid"],
+            "args": event["args"],
+        } for event in self.events]
+        end = max((e["start"] + e["duration"] for e in self.events),
+                  default=0.0)
+        trace += [{
+            "name": name,
+            "ph": "C",
+            "ts": end * 1e6,
+            "pid": os.getpid(),
+            "args": {name: value},
+        } for name, value in self.counters.items()]
+        with open(filename, 'w') as ofile:
+            json.dump({"traceEvents": trace}, ofile, default=str)
+
+
+class _Phase:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        for recorder in list(_recorders):
+            recorder.add_event(self.name, self.start, duration, self.args)
+        return False
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def enabled():
+    """ True when at least one recorder is active """
+    return bool(_recorders)
+
+
+def phase(name, **args):
+    """
+    Context manager timing one phase of an operation
+
+    Returns a shared no-op context when no recorder is active.
+
+    :param name: Name of the phase, e.g. "tokenize"
+    :param args: Extra values stored with the event, e.g. the file name
+    """
+    if not _recorders:
+        return _NULL_PHASE
+    return _Phase(name, args)
+
+
+def count(name, value=1):
+    """ Adds value to the named counter of every active recorder """
+    if _recorders:
+        for recorder in list(_recorders):
+            recorder.add_count(name, value)
+
+
+@contextlib.contextmanager
+def record(callback=None, json_file=None, trace_file=None):
+    """
+    Records phases and counters for the duration of the block
+
+    :param callback: Optional callable receiving each event as recorded
+    :param json_file: Optional file the summary and events are written to
+    :param trace_file: Optional file a Chrome trace is written to
+
+    :returns the Recorder
+    """
+    recorder = Recorder(callback)
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+        if json_file:
+            recorder.to_json(json_file)
+        if trace_file:
+            recorder.to_chrome_trace(trace_file)
@@ -0,0 +1 @@
+from .refine import *
@@ -0,0 +1,121 @@
+#  Uniform refinement of triangle and tetrahedron meshes
+#
+#  Every edge gets a midpoint node and every cell is split into children
+#  through those midpoints: a triangle into 4, a tetrahedron into 8. Edges
+#  shared by neighbouring cells come from the unique edge table, so each
+#  midpoint is created once and the refined mesh stays conforming.
+import logging
+
+import meshio
+import numpy as np
+
+from meshiah.instrument import count, phase
+from meshiah.topology import LOCAL_EDGES, unique_entities
+
+__all__ = [
+    "refine_mesh",
+    "refine_uniform",
+]
+
+logger = logging.getLogger(__name__)
+
+# Children of each cell type, numbering the corners first and then the
+# midpoints of its edges in LOCAL_EDGES order
+_CHILDREN = {
+    "triangle": np.array([[0, 3, 5], [3, 1, 4], [5, 4, 2], [3, 4, 5]]),
+    # Corner tetrahedra, then the inner octahedron split along 6-8
+    "tetra": np.array([[0, 4, 6, 7], [4, 1, 5, 8], [6, 5, 2, 9],
+                       [7, 8, 9, 3], [4, 6, 7, 8], [4, 5, 6, 8],
+                       [6, 7, 8, 9], [5, 6, 8, 9]]),
+}
+
+
+def refine_uniform(points, cells, point_data=None):
+    """
+    One level of uniform refinement
+
+    :param points: Array of shape (n, dim)
+    :param cells: List of (cell_type, connectivity), triangle or tetra
+    :param point_data: Optional dict of name to float values per node,
+        linearly interpolated to the midpoints
+
+    :returns (points, cells, point_data, children) where children is the
+        number of children of each cell of each block
+    """
+    points = np.asarray(points)
+    for cell_type, _ in cells:
+        if cell_type not in _CHILDREN:
+            raise ValueError(f"Cannot refine {cell_type} cells, only "
+                             f"{', '.join(_CHILDREN)}")
+    npoints = len(points)
+    with phase("edges"):
+        edges, _, edge_ids = unique_entities(npoints, cells, LOCAL_EDGES)
+    with phase("midpoints"):
+        new_points = np.concatenate(
+            [points, 0.5 * (points[edges[:, 0]] + points[edges[:, 1]])])
+        new_data = {}
+        for name, values in (point_data or {}).items():
+            values = np.asarray(values)
+            new_data[name] = np.concatenate(
+                [values, 0.5 * (values[edges[:, 0]] + values[edges[:, 1]])])
+    new_cells = []
+    children = []
+    with phase("children"):
+        for (cell_type, conn), ids in zip(cells, edge_ids):
+            # Corners keep their ids, midpoint e becomes node npoints + e
+            nodes = np.hstack([np.asarray(conn, dtype=np.int64),
+                               npoints + ids])
+            template = _CHILDREN[cell_type]
+            new_cells.append((cell_type,
+                              nodes[:, template].reshape(-1,
+                                                         template.shape[1])))
+            children.append(len(template))
+    count("edges", len(edges))
+    return new_points, new_cells, new_data, children
+
+
+def refine_mesh(mesh, levels=1):
+    """
+    Uniformly refines a triangle or tetrahedron mesh
+
+    Each level splits triangles into 4 and tetrahedra into 8. Children
+    take the cell data of their parent, Region included, and float point
+    data is linearly interpolated to the new nodes. Other point data
+    cannot be interpolated and is dropped. Element geometry is recomputed
+    when the mesh carried it.
+
+    :param mesh: The mesh to refine
+    :type mesh: meshio.Mesh
+    :param levels: Number of times to refine
+
+    :returns meshio.Mesh
+    """
+    from meshiah.geometry import GEOMETRY_NAMES, add_cell_properties
+
+    point_data = {}
+    for name, values in mesh.point_data.items():
+        if np.issubdtype(np.asarray(values).dtype, np.floating):
+            point_data[name] = values
+        else:
+            logger.info("Dropping point data %s, it cannot be "
+                        "interpolated", name)
+    cell_data = {name: [np.asarray(block) for block in blocks]
+                 for name, blocks in mesh.cell_data.items()
+                 if name not in GEOMETRY_NAMES}
+    points = mesh.points
+    cells = [(cell_type, conn) for cell_type, conn in mesh.cells]
+    with phase("refine", levels=levels):
+        for _ in range(levels):
+            points, cells, point_data, children = refine_uniform(
+                points, cells, point_data)
+            cell_data = {name: [np.repeat(block, n, axis=0)
+                                for block, n in zip(blocks, children)]
+                         for name, blocks in cell_data.items()}
+    field_data = {name: values for name, values in mesh.field_data.items()
+                  if name != "geometry_key"}
+    refined = meshio.Mesh(points, cells, point_data=point_data,
+                          cell_data=cell_data, field_data=field_data)
+    if "geometry_key" in mesh.field_data:
+        add_cell_properties(refined)
+    count("cells", sum(len(conn) for _, conn in cells))
+    return refined
@@ -0,0 +1,2 @@
+from .remap import *
+from .probe import *
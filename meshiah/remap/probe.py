@@ -0,0 +1,146 @@
+#  Result profiles along a line
+#
+#  Evenly spaced samples along a segment are located in the mesh once,
+#  through remap_weights, and the weights are cached on the mesh. A whole
+#  (time, node) stack is then sampled in one gather and weighted sum, so
+#  scrubbing through time or adding steps costs no further search.
+import numpy as np
+
+from meshiah._cache import ArrayKey, mesh_arrays
+from meshiah.fileio import fileio
+from meshiah.instrument import phase
+from .remap import DEFAULT_CHUNK_SIZE, remap_weights
+
+__all__ = [
+    "DEFAULT_STEPS",
+    "LineProbe",
+    "line_points",
+    "line_probe",
+    "sample_line",
+]
+
+DEFAULT_STEPS = 256
+_CACHE = "_meshiah_probes"
+# Lines kept per mesh, the oldest is dropped first
+_CACHED_LINES = 8
+
+
+class LineProbe:
+    """
+    Interpolation from the nodes of a mesh to samples along a segment
+
+    :param p0: Start of the segment
+    :param p1: End of the segment
+    :param npoints: Number of samples, both ends included
+    :param remap: Remap from the mesh nodes to the samples
+
+    :ivar points: Sample points of shape (npoints, 3)
+    :ivar distance: Distance of each sample from p0
+    :ivar outside: Mask of the samples outside every element, they are
+        sampled as NaN
+    """
+
+    def __init__(self, p0, p1, npoints, remap):
+        self.p0 = p0
+        self.p1 = p1
+        self.points = line_points(p0, p1, npoints)
+        self.distance = np.linspace(0, np.linalg.norm(p1 - p0), npoints)
+        self.remap = remap
+        self.outside = remap.outside
+
+    def __call__(self, values, axis=-1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Samples values given per mesh node
+
+        :param values: One value per node, or a (time, node) stack
+        :param axis: The node axis
+        :param chunk_size: Samples computed at a time
+
+        :returns array with the node axis replaced by the samples
+        """
+        result = self.remap(values, axis=axis, chunk_size=chunk_size)
+        np.moveaxis(result, axis, 0)[self.outside] = np.nan
+        return result
+
+
+def line_points(p0, p1, npoints):
+    """ npoints evenly spaced points from p0 to p1, both included """
+    return p0 + np.linspace(0, 1, npoints)[:, None] * (p1 - p0)
+
+
+def _endpoint(point):
+    """ A point of 2 or 3 coordinates as 3, z = 0 when left out """
+    point = np.asarray(point, dtype=np.float64)
+    if point.ndim != 1 or len(point) not in (2, 3):
+        raise ValueError(f"Expected a point of 2 or 3 coordinates, got "
+                         f"shape {point.shape}")
+    return np.r_[point, np.zeros(3 - len(point))]
+
+
+def line_probe(mesh, p0, p1, npoints):
+    """
+    Locates samples along a segment, cached on the mesh
+
+    Triangle meshes are located in the xy plane, so a line across a
+    terrain samples the ground beneath it; tetrahedron meshes in space,
+    e.g. down through a soil column. The weights are reused until the
+    cells or nodes of the mesh change.
+
+    :param mesh: Triangle or tetrahedron mesh
+    :type mesh: meshio.Mesh
+    :param p0: Start of the line, 2 or 3 coordinates
+    :param p1: End of the line
+    :param npoints: Number of samples, both ends included
+
+    :returns LineProbe
+    """
+    p0, p1 = _endpoint(p0), _endpoint(p1)
+    if npoints < 2:
+        raise ValueError(f"A line needs at least 2 samples, got {npoints}")
+    arrays, cell_types = mesh_arrays(mesh)
+    cached = getattr(mesh, _CACHE, None)
+    if cached is None or not cached[0].matches(arrays, cell_types):
+        cached = (ArrayKey(arrays, cell_types), {})
+        setattr(mesh, _CACHE, cached)
+    lines = cached[1]
+    key = (tuple(p0), tuple(p1), int(npoints))
+    if key not in lines:
+        with phase("line_probe", samples=npoints):
+            remap = remap_weights(mesh, line_points(p0, p1, npoints))
+        if len(lines) >= _CACHED_LINES:
+            del lines[next(iter(lines))]
+        lines[key] = LineProbe(p0, p1, npoints, remap)
+    return lines[key]
+
+
+def sample_line(mesh, field_series, p0, p1, npoints,
+                chunk_size=DEFAULT_STEPS):
+    """
+    Profile of a result series along a line
+
+    :param mesh: Triangle or tetrahedron mesh, see line_probe
+    :param field_series: Values per node of shape (nnodes,) or
+        (ntime, nnodes), or a list of fsd files, one per step
+    :param p0: Start of the line
+    :param p1: End of the line
+    :param npoints: Number of samples, both ends included
+    :param chunk_size: Files read and sampled at a time
+
+    :returns array of shape (ntime, npoints), or (npoints,) for a single
+        field; samples outside the mesh are NaN
+    """
+    probe = line_probe(mesh, p0, p1, npoints)
+    if isinstance(field_series, (list, tuple)) and field_series and \
+            isinstance(field_series[0], str):
+        paths = list(field_series)
+        result = np.empty((len(paths), npoints))
+        with phase("sample_line", files=len(paths)):
+            for start in range(0, len(paths), chunk_size):
+                chunk = paths[start:start + chunk_size]
+                steps = np.stack([fileio.read_data_from_file(path)
+                                  for path in chunk])
+                result[start:start + len(steps)] = probe(steps)
+        return result
+    values = np.asarray(field_series)
+    with phase("sample_line", steps=len(values) if values.ndim > 1 else 1):
+        return probe(values)
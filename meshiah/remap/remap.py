@@ -0,0 +1,269 @@
+#  Field transfer between meshes
+#
+#  The target nodes are located in the source elements once, through a
+#  uniform grid of element bounding boxes, and the barycentric weights of
+#  the corners of the containing element are kept as a fixed width sparse
+#  matrix: node ids and weights of shape (ntarget, corners). Transferring a
+#  field, or a whole (time, node) stack, is then a single gather and
+#  weighted sum. Targets outside the source take the value of the nearest
+#  source node, found by searching grid rings outwards.
+import logging
+
+import numpy as np
+
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "Remap",
+    "remap_mesh_data",
+    "remap_weights",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+# Elements are located in the plane for triangles, in space for tetra
+_DIMENSION = {"triangle": 2, "tetra": 3}
+_TOLERANCE = 1e-10
+
+
+class _Grid:
+    """ Uniform grid binning boxes, each listed in every bin it overlaps """
+
+    def __init__(self, box_lo, box_hi, per_bin=2):
+        self.lo = box_lo.min(axis=0)
+        extent = np.maximum(box_hi.max(axis=0) - self.lo, 1e-300)
+        dim = box_lo.shape[1]
+        volume = np.prod(extent) * per_bin / max(len(box_lo), 1)
+        self.size = max(volume ** (1 / dim),
+                        np.mean(box_hi - box_lo, axis=0).max(), 1e-300)
+        self.shape = np.maximum(np.ceil(extent / self.size), 1).astype(
+            np.int64)
+        first = self.bins(box_lo)
+        span = self.bins(box_hi) - first + 1
+        counts = span.prod(axis=1)
+        items = np.repeat(np.arange(len(box_lo)), counts)
+        local = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+        bins = np.repeat(first, counts, axis=0)
+        for axis in range(dim):
+            bins[:, axis] += local % span[items, axis]
+            local //= span[items, axis]
+        keys = np.ravel_multi_index(bins.T, self.shape)
+        order = np.argsort(keys, kind='stable')
+        self.items = items[order]
+        self.starts = np.searchsorted(keys[order],
+                                      np.arange(np.prod(self.shape) + 1))
+
+    def bins(self, points):
+        """ Grid coordinates of points, clamped to the grid """
+        return np.clip(np.floor((points - self.lo) / self.size),
+                       0, self.shape - 1).astype(np.int64)
+
+    def pairs(self, bins, queries):
+        """ (query, item) pairs of the items listed in the given bins """
+        keys = np.ravel_multi_index(bins.T, self.shape)
+        counts = self.starts[keys + 1] - self.starts[keys]
+        query = np.repeat(queries, counts)
+        local = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+        return query, self.items[np.repeat(self.starts[keys], counts) + local]
+
+
+def _first(query, key):
+    """ Index of the smallest key of each query, queries in sorted order """
+    if not len(query):
+        return np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+    sizes = np.diff(np.r_[starts, len(query)])
+    smallest = np.repeat(np.minimum.reduceat(key, starts), sizes)
+    hits = np.flatnonzero(key == smallest)
+    groups = query[hits]
+    return hits[np.r_[True, groups[1:] != groups[:-1]]]
+
+
+def _ring(radius, dim):
+    """ Grid offsets at Chebyshev distance radius """
+    axes = np.arange(-radius, radius + 1)
+    offsets = np.stack(np.meshgrid(*[axes] * dim, indexing='ij'),
+                       axis=-1).reshape(-1, dim)
+    return offsets[np.abs(offsets).max(axis=1) == radius]
+
+
+def _nearest(points, queries):
+    """ Id of the nearest point to each query """
+    grid = _Grid(points, points, per_bin=4)
+    # Any point is at least as far as the query's distance to the grid
+    # box plus the distance from its clamped position
+    clamped = np.clip(queries, grid.lo, grid.lo + grid.shape * grid.size)
+    outside = ((queries - clamped) ** 2).sum(axis=1)
+    home = grid.bins(clamped)
+    best = np.full(len(queries), np.inf)
+    nearest = np.full(len(queries), -1, dtype=np.int64)
+    todo = np.arange(len(queries))
+    radius = 0
+    while len(todo):
+        offsets = _ring(radius, points.shape[1])
+        bins = (home[todo, None, :] + offsets).reshape(-1, points.shape[1])
+        queries_of = np.repeat(todo, len(offsets))
+        valid = ((bins >= 0) & (bins < grid.shape)).all(axis=1)
+        query, item = grid.pairs(bins[valid], queries_of[valid])
+        if len(query):
+            distance = ((queries[query] - points[item]) ** 2).sum(axis=1)
+            first = _first(query, distance)
+            closer = distance[first] < best[query[first]]
+            best[query[first[closer]]] = distance[first[closer]]
+            nearest[query[first[closer]]] = item[first[closer]]
+        # Points beyond this ring are at least radius bins away
+        bound = outside[todo] + (radius * grid.size) ** 2
+        todo = todo[(best[todo] > bound) & (radius < grid.shape.max())]
+        radius += 1
+    return nearest
+
+
+class Remap:
+    """
+    Interpolation from the nodes of a source mesh to target points
+
+    A sparse matrix with a fixed number of entries per row: row i of the
+    result is sum(weights[i] * values[index[i]]).
+
+    :param index: Source node ids of shape (ntarget, corners)
+    :param weights: Their weights, rows summing to 1
+    :param outside: Mask of the targets set from the nearest source node
+    :param nsource: Number of source nodes
+    """
+
+    def __init__(self, index, weights, outside, nsource):
+        self.index = index
+        self.weights = weights
+        self.outside = outside
+        self.nsource = nsource
+
+    @property
+    def shape(self):
+        return (len(self.index), self.nsource)
+
+    def __call__(self, values, axis=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Transfers values given per source node
+
+        :param values: Array with one entry per source node along axis,
+            e.g. point data of shape (nsource, ...) or a (time, node)
+            stack with axis=1
+        :param axis: The node axis
+        :param chunk_size: Target nodes computed at a time
+
+        :returns array with the node axis resized to the targets
+        """
+        values = np.moveaxis(np.asarray(values), axis, 0)
+        if len(values) != self.nsource:
+            raise ValueError(f"Expected {self.nsource} values along axis "
+                             f"{axis}, got {len(values)}")
+        result = np.empty((len(self.index),) + values.shape[1:],
+                          dtype=np.result_type(values, np.float64))
+        with phase("remap", targets=len(self.index)):
+            for start in range(0, len(self.index), chunk_size):
+                stop = start + chunk_size
+                result[start:stop] = np.einsum(
+                    'ij,ij...->i...', self.weights[start:stop],
+                    values[self.index[start:stop]])
+        return np.moveaxis(result, 0, axis)
+
+
+def _source_cells(mesh):
+    types = {cell_type for cell_type, _ in mesh.cells}
+    if len(types) != 1 or not types <= set(_DIMENSION):
+        raise ValueError(f"Can only remap from triangle or tetra meshes, "
+                         f"got {sorted(types)}")
+    cell_type = types.pop()
+    return cell_type, np.concatenate([np.asarray(conn)
+                                      for _, conn in mesh.cells])
+
+
+def remap_weights(source, points, nearest=True,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Locates points in a source mesh and computes interpolation weights
+
+    Triangle meshes are located in the xy plane, so a terrain surface
+    transfers by position along the ground.
+
+    :param source: Triangle or tetrahedron mesh the values are given on
+    :type source: meshio.Mesh
+    :param points: Target points of shape (n, 3), e.g. mesh.points
+    :param nearest: Use the nearest source node for points outside every
+        element, otherwise raise ValueError
+    :param chunk_size: Target points located at a time
+
+    :returns Remap
+    """
+    cell_type, conn = _source_cells(source)
+    dim = _DIMENSION[cell_type]
+    source_points = np.asarray(source.points)[:, :dim]
+    points = np.asarray(points)[:, :dim]
+    with phase("remap_index", cells=len(conn)):
+        corners = source_points[conn]
+        origin = corners[:, 0]
+        # Barycentric coordinates from the inverse of the edge matrix,
+        # degenerate elements never contain a point
+        edges = np.swapaxes(corners[:, 1:] - origin[:, None], 1, 2)
+        degenerate = np.abs(np.linalg.det(edges)) <= 1e-300
+        edges[degenerate] = np.eye(dim)
+        inverse = np.linalg.inv(edges)
+        inverse[degenerate] = np.nan
+        grid = _Grid(corners.min(axis=1), corners.max(axis=1))
+
+    index = np.empty((len(points), dim + 1), dtype=np.int64)
+    weights = np.zeros((len(points), dim + 1))
+    found = np.zeros(len(points), dtype=bool)
+    with phase("remap_locate", points=len(points)):
+        for start in range(0, len(points), chunk_size):
+            stop = min(start + chunk_size, len(points))
+            query, cell = grid.pairs(grid.bins(points[start:stop]),
+                                     np.arange(start, stop))
+            local = np.einsum('ijk,ik->ij', inverse[cell],
+                              points[query] - origin[cell])
+            bary = np.hstack([1 - local.sum(axis=1, keepdims=True), local])
+            inside = (bary >= -_TOLERANCE).all(axis=1)
+            query, cell, bary = query[inside], cell[inside], bary[inside]
+            first = _first(query, cell)
+            index[query[first]] = conn[cell[first]]
+            weights[query[first]] = bary[first]
+            found[query[first]] = True
+
+    outside = ~found
+    if outside.any():
+        if not nearest:
+            raise ValueError(f"{outside.sum()} points lie outside the "
+                             f"source mesh")
+        logger.info("%d points outside the source mesh take the nearest "
+                    "node", outside.sum())
+        with phase("remap_nearest", points=int(outside.sum())):
+            index[outside] = _nearest(source_points,
+                                      points[outside])[:, None]
+            weights[outside] = 0
+            weights[outside, 0] = 1
+    count("outside", int(outside.sum()))
+    return Remap(index, weights, outside, len(source_points))
+
+
+def remap_mesh_data(source, target, names=None, remap=None):
+    """
+    Transfers point data from a source mesh onto the nodes of a target
+
+    :param source: Mesh holding the point data
+    :param target: Mesh receiving it
+    :param names: Point data to transfer, defaults to all float arrays
+    :param remap: Weights from remap_weights, computed when None
+
+    :returns the target mesh
+    """
+    remap = remap_weights(source, target.points) if remap is None else remap
+    if names is None:
+        names = [name for name, values in source.point_data.items()
+                 if np.issubdtype(np.asarray(values).dtype, np.floating)]
+    for name in names:
+        target.point_data[name] = remap(source.point_data[name])
+    return target
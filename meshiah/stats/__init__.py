@@ -0,0 +1,2 @@
+from .stats import *
+from .compare import *
@@ -0,0 +1,179 @@
+#  Run to run comparison of result series
+#
+#  Two series of the same length are read one step of each at a time and
+#  compared entity by entity. Per step errors are kept, one row per step,
+#  and per entity the largest and the summed squared differences, so memory
+#  holds a few arrays of one value per entity however many steps there
+#  are. Disjoint runs of steps are compared by separate workers and their
+#  states merged, as for series_statistics.
+import numpy as np
+
+from meshiah.fileio import fileio
+from meshiah.fileio.parallel import _executor
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "SeriesComparison",
+    "add_differences",
+    "compare_series",
+]
+
+
+class SeriesComparison:
+    """
+    Mergeable comparison of a test series against a reference
+
+    :param nvalues: Number of entities, e.g. nodes, per step
+
+    :ivar steps: Step indices compared, in the order added
+    :ivar max_abs: Largest absolute difference of each step
+    :ivar rms: Root mean square difference of each step
+    :ivar relative: max_abs over the largest reference magnitude of
+        each step
+    :ivar worst: Entity with the largest difference of each step
+    :ivar entity_max: Largest absolute difference of each entity
+    :ivar entity_step: Step of that largest difference
+    :ivar entity_sumsq: Sum of squared differences of each entity
+    """
+
+    def __init__(self, nvalues):
+        self.nvalues = nvalues
+        self.steps = []
+        self.max_abs = []
+        self.rms = []
+        self.relative = []
+        self.worst = []
+        self.entity_max = np.zeros(nvalues)
+        self.entity_step = np.full(nvalues, -1, dtype=np.int64)
+        self.entity_sumsq = np.zeros(nvalues)
+
+    def update(self, reference, test, step):
+        """ Compares one step, each holding one value per entity """
+        reference = np.asarray(reference, dtype=np.float64)
+        test = np.asarray(test, dtype=np.float64)
+        if reference.shape != (self.nvalues,) or test.shape != (self.nvalues,):
+            raise ValueError(f"Step {step}: expected {self.nvalues} values, "
+                             f"got {reference.shape[0]} and {test.shape[0]}")
+        difference = np.abs(test - reference)
+        worst = int(np.argmax(difference)) if self.nvalues else -1
+        largest = difference[worst] if self.nvalues else 0.0
+        scale = np.abs(reference).max() if self.nvalues else 0.0
+        self.steps.append(step)
+        self.max_abs.append(largest)
+        self.rms.append(np.sqrt(np.mean(difference ** 2))
+                        if self.nvalues else 0.0)
+        self.relative.append(largest / scale if scale else
+                             (0.0 if largest == 0 else np.inf))
+        self.worst.append(worst)
+        # The first step of the largest difference is kept on ties
+        larger = difference > self.entity_max
+        self.entity_max[larger] = difference[larger]
+        self.entity_step[larger] = step
+        self.entity_sumsq += difference ** 2
+        return self
+
+    def merge(self, other):
+        """ Combines with the comparison of another, later, run of steps """
+        if other.nvalues != self.nvalues:
+            raise ValueError(f"Cannot merge comparisons of {other.nvalues} "
+                             f"and {self.nvalues} values")
+        for name in ("steps", "max_abs", "rms", "relative", "worst"):
+            getattr(self, name).extend(getattr(other, name))
+        larger = other.entity_max > self.entity_max
+        self.entity_max[larger] = other.entity_max[larger]
+        self.entity_step[larger] = other.entity_step[larger]
+        self.entity_sumsq += other.entity_sumsq
+        return self
+
+    @property
+    def entity_rms(self):
+        """ Root mean square difference of each entity over the steps """
+        return np.sqrt(self.entity_sumsq / max(len(self.steps), 1))
+
+    def worst_entities(self, n=10):
+        """ The n entities with the largest difference, largest first """
+        n = min(n, self.nvalues)
+        top = np.argpartition(-self.entity_max, n - 1)[:n] if n else []
+        return np.asarray(top, dtype=np.int64)[
+            np.argsort(-self.entity_max[top], kind='stable')]
+
+    def table(self):
+        """ dict of per step column name to array, ordered by step """
+        order = np.argsort(self.steps, kind='stable')
+        return {name: np.asarray(getattr(self, name))[order]
+                for name in ("steps", "max_abs", "rms", "relative",
+                             "worst")}
+
+
+def _compare(reference_paths, test_paths, steps):
+    comparison = None
+    for reference, test, step in zip(reference_paths, test_paths, steps):
+        values = fileio.read_data_from_file(reference)
+        if comparison is None:
+            comparison = SeriesComparison(len(values))
+        comparison.update(values, fileio.read_data_from_file(test), step)
+    return comparison
+
+
+def compare_series(reference_paths, test_paths, max_workers=None,
+                   processes=False):
+    """
+    Compares two fsd or flux series step by step
+
+    The steps are split into one contiguous run per worker, each reading
+    the two series in lockstep one step at a time, and the partial
+    comparisons are merged.
+
+    :param reference_paths: Files of the reference run, one per step
+    :param test_paths: Files of the run to check, in the same order
+    :param max_workers: Number of workers, one runs in the caller
+    :param processes: Use a process pool instead of threads
+
+    :returns SeriesComparison
+    """
+    reference_paths = list(reference_paths)
+    test_paths = list(test_paths)
+    if len(reference_paths) != len(test_paths):
+        raise ValueError(f"{len(reference_paths)} reference steps but "
+                         f"{len(test_paths)} test steps")
+    if not reference_paths:
+        raise ValueError("No files to compare")
+    steps = list(range(len(reference_paths)))
+    max_workers = min(max_workers or 1, len(steps))
+    with phase("compare_series", files=len(steps)):
+        if max_workers == 1:
+            comparison = _compare(reference_paths, test_paths, steps)
+        else:
+            bounds = np.linspace(0, len(steps), max_workers + 1).astype(int)
+            with _executor(max_workers, processes) as pool:
+                parts = [pool.submit(_compare, reference_paths[lo:hi],
+                                     test_paths[lo:hi], steps[lo:hi])
+                         for lo, hi in zip(bounds[:-1], bounds[1:])]
+                comparison = parts[0].result()
+                for part in parts[1:]:
+                    comparison.merge(part.result())
+    count("files", 2 * len(steps))
+    return comparison
+
+
+def add_differences(mesh, comparison, name):
+    """
+    Stores <name>_max_diff, <name>_rms_diff and <name>_step_of_max_diff
+
+    They become point data when there is one value per node, otherwise
+    cell data over all cell blocks.
+
+    :returns the mesh
+    """
+    from meshiah.flux import flux_cell_data
+
+    fields = {"max_diff": comparison.entity_max,
+              "rms_diff": comparison.entity_rms,
+              "step_of_max_diff": comparison.entity_step}
+    for field, values in fields.items():
+        key = f"{name}_{field}"
+        if comparison.nvalues == len(mesh.points):
+            mesh.point_data[key] = values
+        else:
+            flux_cell_data(mesh, values, key)
+    return mesh
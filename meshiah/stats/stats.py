@@ -0,0 +1,154 @@
+#  Streaming statistics over result series
+#
+#  A series (fsd or flux files, one per timestep) is reduced one step at
+#  a time with Welford's online mean and variance, so memory holds a few
+#  arrays of one value per entity however many steps there are. Partial
+#  states of disjoint runs of steps merge exactly (Chan et al.), which
+#  lets workers reduce chunks of the series in parallel.
+import numpy as np
+
+from meshiah.fileio import fileio
+from meshiah.fileio.parallel import _executor
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "STATISTICS",
+    "SeriesStats",
+    "add_statistics",
+    "series_statistics",
+]
+
+STATISTICS = ("min", "max", "mean", "std", "time_of_peak")
+
+
+class SeriesStats:
+    """
+    Mergeable per entity statistics of a series
+
+    :param nvalues: Number of entities, e.g. nodes, per step
+    """
+
+    def __init__(self, nvalues):
+        self.nvalues = nvalues
+        self.count = 0
+        self.mean = np.zeros(nvalues)
+        self.m2 = np.zeros(nvalues)
+        self.min = np.full(nvalues, np.inf)
+        self.max = np.full(nvalues, -np.inf)
+        self.time_of_peak = np.full(nvalues, np.nan)
+
+    def update(self, values, time):
+        """ Adds one step, values holding one value per entity """
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (self.nvalues,):
+            raise ValueError(f"Expected {self.nvalues} values, "
+                             f"got {values.shape[0]}")
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+        np.minimum(self.min, values, out=self.min)
+        # The first time of the peak is kept on ties
+        peak = values > self.max
+        self.max[peak] = values[peak]
+        self.time_of_peak[peak] = time
+        return self
+
+    def merge(self, other):
+        """ Combines with the state of another, disjoint, set of steps """
+        if other.nvalues != self.nvalues:
+            raise ValueError(f"Cannot merge statistics of {other.nvalues} "
+                             f"and {self.nvalues} values")
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * (other.count / total)
+        self.m2 += other.m2 + delta ** 2 * (self.count * other.count / total)
+        self.count = total
+        np.minimum(self.min, other.min, out=self.min)
+        later = other.max > self.max
+        tie = other.max == self.max
+        self.time_of_peak[later] = other.time_of_peak[later]
+        self.time_of_peak[tie] = np.fmin(self.time_of_peak[tie],
+                                         other.time_of_peak[tie])
+        np.maximum(self.max, other.max, out=self.max)
+        return self
+
+    def variance(self, ddof=0):
+        """ Variance over the steps, population variance by default """
+        if self.count - ddof <= 0:
+            return np.full(self.nvalues, np.nan)
+        return self.m2 / (self.count - ddof)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def as_dict(self):
+        """ dict of statistic name to one value per entity """
+        return {name: getattr(self, name) for name in STATISTICS}
+
+
+def _reduce(paths, times):
+    stats = None
+    for path, time in zip(paths, times):
+        values = fileio.read_data_from_file(path)
+        if stats is None:
+            stats = SeriesStats(len(values))
+        stats.update(values, time)
+    return stats
+
+
+def series_statistics(paths, times=None, max_workers=None, processes=False):
+    """
+    Per entity min, max, mean, std and time of peak of a result series
+
+    The steps are split into one contiguous run per worker, each reduced
+    one file at a time, and the partial states are merged.
+
+    :param paths: fsd or flux files, one per step
+    :param times: Time of each step, defaults to 0, 1, ...
+    :param max_workers: Number of workers, one runs in the caller
+    :param processes: Use a process pool instead of threads
+
+    :returns SeriesStats
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files to reduce")
+    times = list(range(len(paths))) if times is None else list(times)
+    max_workers = min(max_workers or 1, len(paths))
+    with phase("series_statistics", files=len(paths)):
+        if max_workers == 1:
+            stats = _reduce(paths, times)
+        else:
+            bounds = np.linspace(0, len(paths), max_workers + 1).astype(int)
+            with _executor(max_workers, processes) as pool:
+                parts = [pool.submit(_reduce, paths[lo:hi], times[lo:hi])
+                         for lo, hi in zip(bounds[:-1], bounds[1:])]
+                stats = parts[0].result()
+                for part in parts[1:]:
+                    stats.merge(part.result())
+    count("files", len(paths))
+    return stats
+
+
+def add_statistics(mesh, stats, name):
+    """
+    Stores statistics on a mesh as <name>_min, <name>_max, ...
+
+    They become point data when there is one value per node, otherwise
+    cell data over all cell blocks.
+
+    :returns the mesh
+    """
+    from meshiah.flux import flux_cell_data
+
+    for statistic, values in stats.as_dict().items():
+        key = f"{name}_{statistic}"
+        if stats.nvalues == len(mesh.points):
+            mesh.point_data[key] = values
+        else:
+            flux_cell_data(mesh, values, key)
+    return mesh
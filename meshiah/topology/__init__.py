@@ -0,0 +1 @@
+from .topology import *
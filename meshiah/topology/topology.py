@@ -0,0 +1,194 @@
+#  Unique edge and face tables of triangle and tetrahedron meshes
+#
+#  Every local edge or face of every cell is sorted into canonical node
+#  order and the rows are grouped by sorting them, packed into a single
+#  int64 key whenever the node ids allow it. For large meshes the rows are
+#  split by their smallest node id into ranges small enough for a memory
+#  budget, each range gathered from the connectivity in chunks and grouped
+#  on its own; the ranges are ordered, so the table comes out sorted as if
+#  it had been built in one go.
+import numpy as np
+
+from meshiah._cache import ArrayKey
+from meshiah.instrument import count, phase
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "LOCAL_EDGES",
+    "LOCAL_FACES",
+    "edge_table",
+    "face_table",
+    "invalidate",
+    "unique_entities",
+]
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# Local node numbers of the edges and faces of each cell type, faces
+# oriented outwards for positive tetrahedra
+LOCAL_EDGES = {
+    "line": np.array([[0, 1]]),
+    "triangle": np.array([[0, 1], [1, 2], [2, 0]]),
+    "tetra": np.array([[0, 1], [1, 2], [0, 2], [0, 3], [1, 3], [2, 3]]),
+}
+LOCAL_FACES = {
+    "triangle": np.array([[0, 1, 2]]),
+    "tetra": np.array([[0, 2, 1], [0, 1, 3], [1, 2, 3], [0, 3, 2]]),
+}
+_CACHE = "_meshiah_topology"
+# Bytes held per row while grouping: the row, its key, order and group
+_ROW_BYTES = 8 * 3
+
+
+def _group(rows, npoints):
+    """
+    Groups equal canonical rows
+
+    :returns (unique rows in lexicographic order, group of each row)
+    """
+    width = rows.shape[1]
+    if npoints ** width < 2 ** 63:
+        keys = rows[:, 0]
+        for column in range(1, width):
+            keys = keys * npoints + rows[:, column]
+        order = np.argsort(keys)
+        keys = keys[order]
+        new = np.r_[True, keys[1:] != keys[:-1]]
+    else:
+        order = np.lexsort(rows.T[::-1])
+        ordered = rows[order]
+        new = np.r_[True, (ordered[1:] != ordered[:-1]).any(axis=1)]
+    groups = np.empty(len(rows), dtype=np.int64)
+    groups[order] = np.cumsum(new) - 1
+    return rows[order[new]], groups
+
+
+def _canonical(conn, local):
+    rows = np.asarray(conn, dtype=np.int64)[:, local]
+    rows.sort(axis=2)
+    return rows.reshape(-1, local.shape[1])
+
+
+def _lo_ranges(blocks, npoints, nparts, chunk_size):
+    """ Splits the smallest node ids into ranges holding similar rows """
+    shift = max(0, int(npoints).bit_length() - 12)
+    histogram = np.zeros((npoints >> shift) + 1, dtype=np.int64)
+    for conn, local in blocks:
+        for start in range(0, len(conn), chunk_size):
+            rows = _canonical(conn[start:start + chunk_size], local)
+            histogram += np.bincount(rows[:, 0] >> shift,
+                                     minlength=len(histogram))
+    cumulative = np.cumsum(histogram)
+    targets = cumulative[-1] * np.arange(1, nparts) / nparts
+    bounds = (np.searchsorted(cumulative, targets) + 1) << shift
+    bounds = np.unique(np.r_[0, np.minimum(bounds, npoints), npoints])
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def unique_entities(npoints, cells, local, chunk_size=DEFAULT_CHUNK_SIZE,
+                    memory_limit=None):
+    """
+    Unique edges or faces of cell blocks and the map from cells to them
+
+    :param npoints: Number of nodes
+    :param cells: List of (cell_type, connectivity)
+    :param local: dict of cell type to its local entities, e.g.
+        LOCAL_EDGES; blocks of other types have none
+    :param chunk_size: Cells gathered at a time
+    :param memory_limit: Bytes allowed for grouping, above which the rows
+        are grouped range by range of their smallest node id
+
+    :returns (entities of shape (n, width) sorted lexicographically,
+        number of local entities using each, list with the entity ids of
+        each block of shape (ncells, nlocal))
+    """
+    blocks = [(np.asarray(conn), local[cell_type])
+              for cell_type, conn in cells if cell_type in local]
+    maps = [np.empty((len(conn), len(local[cell_type])
+                      if cell_type in local else 0), dtype=np.int64)
+            for cell_type, conn in cells]
+    mapped = [m for (cell_type, _), m in zip(cells, maps)
+              if cell_type in local]
+    total = sum(len(conn) * len(entities) for conn, entities in blocks)
+    if not total:
+        width = max([len(e[0]) for e in local.values()] or [2])
+        return (np.empty((0, width), dtype=np.int64),
+                np.empty(0, dtype=np.int64), maps)
+    nparts = 1
+    if memory_limit is not None:
+        nparts = max(1, -(-total * _ROW_BYTES // memory_limit))
+    ranges = ([(0, npoints)] if nparts == 1
+              else _lo_ranges(blocks, npoints, nparts, chunk_size))
+
+    entities, uses = [], []
+    offset = 0
+    for lo, hi in ranges:
+        rows, positions = [], []
+        for b, (conn, entities_of) in enumerate(blocks):
+            for start in range(0, len(conn), chunk_size):
+                chunk = _canonical(conn[start:start + chunk_size],
+                                   entities_of)
+                inside = np.flatnonzero((chunk[:, 0] >= lo) &
+                                        (chunk[:, 0] < hi))
+                rows.append(chunk[inside])
+                positions.append((b, start * len(entities_of) + inside))
+        unique, groups = _group(np.concatenate(rows), npoints)
+        at = 0
+        for (b, position), part in zip(positions, rows):
+            mapped[b].reshape(-1)[position] = \
+                offset + groups[at:at + len(part)]
+            at += len(part)
+        entities.append(unique)
+        uses.append(np.bincount(groups, minlength=len(unique)))
+        offset += len(unique)
+    count("entities", offset)
+    return np.concatenate(entities), np.concatenate(uses), maps
+
+
+def _table(mesh, name, local, chunk_size, memory_limit):
+    arrays = [data for _, data in mesh.cells]
+    cell_types = tuple(cell_type for cell_type, _ in mesh.cells)
+    cache = getattr(mesh, _CACHE, None)
+    if cache is None or not cache[0].matches(arrays, cell_types):
+        cache = (ArrayKey(arrays, cell_types), {})
+        setattr(mesh, _CACHE, cache)
+    if name not in cache[1]:
+        with phase(f"{name}_table"):
+            entities, uses, maps = unique_entities(
+                len(mesh.points), mesh.cells, local, chunk_size,
+                memory_limit)
+        cache[1][name] = {name: entities, "uses": uses,
+                          f"cell_{name}": maps}
+    return cache[1][name]
+
+
+def edge_table(mesh, chunk_size=DEFAULT_CHUNK_SIZE, memory_limit=None):
+    """
+    Unique edges of a mesh, cached on it until its cells change
+
+    :param mesh: The mesh
+    :param chunk_size: Cells gathered at a time
+    :param memory_limit: Bytes allowed for grouping, see unique_entities
+
+    :returns dict with edges of shape (nedges, 2), their smallest node id
+        first, uses, the number of cell edges on each, and cell_edges,
+        one array of shape (ncells, nlocal) of edge ids per block
+    """
+    return _table(mesh, "edges", LOCAL_EDGES, chunk_size, memory_limit)
+
+
+def face_table(mesh, chunk_size=DEFAULT_CHUNK_SIZE, memory_limit=None):
+    """
+    Unique faces of the triangle and tetrahedron blocks of a mesh
+
+    Faces used once are on the boundary.
+
+    :returns dict with faces of shape (nfaces, 3) in sorted node order,
+        uses and cell_faces as for edge_table
+    """
+    return _table(mesh, "faces", LOCAL_FACES, chunk_size, memory_limit)
+
+
+def invalidate(mesh):
+    """ Drops the cached tables of a mesh """
+    if hasattr(mesh, _CACHE):
+        delattr(mesh, _CACHE)
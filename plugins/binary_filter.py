@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 from paraview.util.vtkAlgorithm import *
-import struct
 
 
 @smproxy.filter()
@@ -13,28 +12,58 @@ class FluxReader(VTKPythonAlgorithmBase):
                          outputType='vtkUnstructuredGrid')
         self._filename = ""
         self._numlights = None
-        self._bindata = None
+        self._cache_mb = 1024
+        self._series = None
 
     @smproperty.intvector(name="Number of Lights", default_values=1249)
     def SetNumLights(self, numLights):
         if numLights != self._numlights:
             self._numlights = numLights
+            self._series = None
             self.Modified()
 
     def GetNumLights(self):
         return self._numlights
 
+    @smproperty.intvector(name="Cache Size (MB)", default_values=1024)
+    def SetCacheSize(self, cache_mb):
+        if cache_mb != self._cache_mb:
+            self._cache_mb = cache_mb
+            if self._series is not None:
+                self._series.max_bytes = cache_mb << 20
+            self.Modified()
+
+    def GetCacheSize(self):
+        return self._cache_mb
+
     @smproperty.stringvector(name="Flux File")
     @smdomain.filelist()
     @smhint.filechooser(extensions="bin", file_description="Flux file to read in")
     def SetFileName(self, fname):
         if fname != self._filename:
             self._filename = fname
+            self._series = None
             self.Modified()
 
     def GetFileName(self):
         return self._filename
 
+    def _get_series(self):
+        # A numbered file, e.g. flux_00000.bin, brings in its whole series
+        if self._series is None:
+            from meshiah.flux import FluxSeries
+            self._series = FluxSeries.from_file(
+                self._filename, number_of_lights=self._numlights,
+                max_bytes=self._cache_mb << 20)
+        return self._series
+
+    @smproperty.doublevector(name="TimestepValues", information_only="1",
+                             si_class="vtkSITimeStepsProperty")
+    def GetTimestepValues(self):
+        if not self._filename:
+            return None
+        return list(self._get_series().times)
+
     def RequestDataObject(self, request, inInfo, outInfo):
         inData = self.GetInputData(inInfo, 0, 0)
         outData = self.GetOutputData(outInfo, 0)
@@ -44,29 +73,45 @@ class FluxReader(VTKPythonAlgorithmBase):
         outInfo.GetInformationObject(0).Set(outData.DATA_OBJECT(), outData)
         return super().RequestDataObject(request, inInfo, outInfo)
 
+    def RequestInformation(self, request, inInfo, outInfo):
+        from vtkmodules.vtkCommonExecutionModel import \
+            vtkStreamingDemandDrivenPipeline as sddp
+        info = outInfo.GetInformationObject(0)
+        info.Remove(sddp.TIME_STEPS())
+        info.Remove(sddp.TIME_RANGE())
+        if self._filename:
+            times = self._get_series().times
+            info.Set(sddp.TIME_STEPS(), times, len(times))
+            info.Set(sddp.TIME_RANGE(), [times[0], times[-1]], 2)
+        return 1
+
+    def RequestUpdateExtent(self, request, inInfo, outInfo):
+        # The input grid is static, ask for it regardless of the time
+        from vtkmodules.vtkCommonExecutionModel import \
+            vtkStreamingDemandDrivenPipeline as sddp
+        inInfo[0].GetInformationObject(0).Remove(sddp.UPDATE_TIME_STEP())
+        return 1
+
     def RequestData(self, request, inInfo, outInfo):
-        from vtkmodules.numpy_interface import dataset_adapter as dsa
+        from vtkmodules.util import numpy_support
         from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
-        import vtk
-        inData = self.GetInputData(inInfo, 0, 0)
-        # outData = self.GetOutputData(outInfo, 0)
-        output = dsa.WrapDataObject(vtkUnstructuredGrid.GetData(outInfo, 0))
+        from vtkmodules.vtkCommonExecutionModel import \
+            vtkStreamingDemandDrivenPipeline as sddp
+        inData = vtkUnstructuredGrid.GetData(inInfo[0], 0)
+        output = vtkUnstructuredGrid.GetData(outInfo, 0)
+        # Share the input arrays, only FluxData is swapped per step
         output.ShallowCopy(inData)
-        # output = dsa.WrapDataObject(vtkUnstructuredGrid.GetData(outData, 0))
-        data = self._read_flux_file()
-        data_vtk = vtk.vtkDoubleArray()
-        data_vtk.SetNumberOfValues(len(data))
+
+        series = self._get_series()
+        info = outInfo.GetInformationObject(0)
+        index = 0
+        if info.Has(sddp.UPDATE_TIME_STEP()):
+            index = series.index_at(info.Get(sddp.UPDATE_TIME_STEP()))
+        data = series[index]
+        # deep=0 wraps the cached array without copying it
+        data_vtk = numpy_support.numpy_to_vtk(data, deep=0)
         data_vtk.SetName('FluxData')
-        for i, val in enumerate(data):
-            data_vtk.InsertValue(i, val[0]/self._numlights)
         output.GetCellData().AddArray(data_vtk)
+        output.GetInformation().Set(output.DATA_TIME_STEP(),
+                                    series.times[index])
         return 1
-
-    def _read_flux_file(self):
-        f = open(self._filename, 'rb')
-        number_of_lights = int.from_bytes(f.read(4), byteorder='little')
-        assert(number_of_lights == self._numlights)
-        num_doubles = int.from_bytes(f.read(4), byteorder='little')
-        self._bindata = [struct.unpack('d', f.read(8))
-                         for i in range(num_doubles)]
-        return self._bindata
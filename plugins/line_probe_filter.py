@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+from paraview.util.vtkAlgorithm import *
+
+# VTK cell types the probe locates samples in
+_VTK_TYPES = {5: "triangle", 10: "tetra"}
+
+
+@smproxy.filter()
+@smproperty.input(name="Input")
+@smdomain.datatype(dataTypes=["vtkUnstructuredGrid"], composite_data_supported=False)
+class LineProbe(VTKPythonAlgorithmBase):
+    """
+    Samples the point data of a triangle or tetrahedron mesh along a line
+
+    The samples are located once, see meshiah.remap.line_probe, and the
+    weights kept until the line or the mesh changes, so scrubbing time
+    only gathers the new values. Samples outside the mesh are NaN.
+    """
+
+    def __init__(self):
+        super().__init__(nInputPorts=1, nOutputPorts=1,
+                         outputType='vtkPolyData')
+        self._p0 = [0.0, 0.0, 0.0]
+        self._p1 = [1.0, 0.0, 0.0]
+        self._resolution = 100
+        self._probe = None
+        self._key = None
+
+    @smproperty.doublevector(name="Point1", default_values=[0.0, 0.0, 0.0])
+    def SetPoint1(self, x, y, z):
+        if [x, y, z] != self._p0:
+            self._p0 = [x, y, z]
+            self.Modified()
+
+    @smproperty.doublevector(name="Point2", default_values=[1.0, 0.0, 0.0])
+    def SetPoint2(self, x, y, z):
+        if [x, y, z] != self._p1:
+            self._p1 = [x, y, z]
+            self.Modified()
+
+    @smproperty.intvector(name="Resolution", default_values=100)
+    @smdomain.intrange(min=1, max=100000)
+    def SetResolution(self, resolution):
+        if resolution != self._resolution:
+            self._resolution = resolution
+            self.Modified()
+
+    def _get_probe(self, grid):
+        import meshio
+        import numpy as np
+        from meshiah.remap import line_probe
+        from vtkmodules.numpy_interface import dataset_adapter as dsa
+
+        # A time step usually brings a new grid of the same mesh, only
+        # changes of its size or extent locate the samples again
+        key = (grid.GetNumberOfPoints(), grid.GetNumberOfCells(),
+               grid.GetBounds(), tuple(self._p0), tuple(self._p1),
+               self._resolution)
+        if key != self._key:
+            mesh = dsa.WrapDataObject(grid)
+            cell_conn = np.asarray(mesh.GetCells())
+            cell_offsets = np.asarray(mesh.GetCellLocations())
+            cell_types = np.asarray(mesh.GetCellTypes())
+            cells = []
+            for vtk_type, cell_type in _VTK_TYPES.items():
+                offsets = cell_offsets[cell_types == vtk_type]
+                if len(offsets):
+                    width = cell_conn[offsets[0]]
+                    cells.append((cell_type, cell_conn[
+                        offsets[:, None] + np.arange(1, width + 1)]))
+            points = np.asarray(mesh.GetPoints())
+            self._probe = line_probe(meshio.Mesh(points, cells), self._p0,
+                                     self._p1, self._resolution + 1)
+            self._key = key
+        return self._probe
+
+    def RequestData(self, request, inInfo, outInfo):
+        import numpy as np
+        from vtkmodules.util import numpy_support
+        from vtkmodules.vtkCommonCore import vtkPoints
+        from vtkmodules.vtkCommonDataModel import (
+            vtkPolyData, vtkPolyLine, vtkCellArray, vtkUnstructuredGrid)
+        grid = vtkUnstructuredGrid.GetData(inInfo[0], 0)
+        output = vtkPolyData.GetData(outInfo, 0)
+        probe = self._get_probe(grid)
+
+        points = vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(probe.points, deep=1))
+        line = vtkPolyLine()
+        line.GetPointIds().SetNumberOfIds(len(probe.points))
+        for i in range(len(probe.points)):
+            line.GetPointIds().SetId(i, i)
+        lines = vtkCellArray()
+        lines.InsertNextCell(line)
+        output.SetPoints(points)
+        output.SetLines(lines)
+
+        point_data = grid.GetPointData()
+        for i in range(point_data.GetNumberOfArrays()):
+            array = point_data.GetArray(i)
+            if array is None or array.GetNumberOfComponents() != 1:
+                continue
+            values = probe(numpy_support.vtk_to_numpy(array)
+                           .astype(np.float64))
+            sampled = numpy_support.numpy_to_vtk(values, deep=1)
+            sampled.SetName(array.GetName())
+            output.GetPointData().AddArray(sampled)
+        distance = numpy_support.numpy_to_vtk(probe.distance, deep=1)
+        distance.SetName("Distance")
+        output.GetPointData().AddArray(distance)
+        mask = numpy_support.numpy_to_vtk(
+            (~probe.outside).astype(np.uint8), deep=1)
+        mask.SetName("vtkValidPointMask")
+        output.GetPointData().AddArray(mask)
+        return 1
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+from paraview.util.vtkAlgorithm import *
+
+
+@smproxy.filter()
+@smproperty.input(name="Live Results")
+@smdomain.datatype(dataTypes=["vtkUnstructuredGrid"], composite_data_supported=False)
+class LiveResults(VTKPythonAlgorithmBase):
+    """
+    Attaches the latest step of fsd/flux files a running solver writes
+
+    Every execution reads only what was appended since the last one, see
+    meshiah.TailReader. Press Refresh to pick up new steps.
+    """
+
+    def __init__(self):
+        super().__init__(nInputPorts=1, nOutputPorts=1,
+                         outputType='vtkUnstructuredGrid')
+        self._pattern = ""
+        self._name = "LiveData"
+        self._reader = None
+        self._latest = None
+
+    @smproperty.stringvector(name="Result Files", default_values="")
+    def SetPattern(self, pattern):
+        # A glob pattern such as /run/out/T_*.fsd
+        if pattern != self._pattern:
+            self._pattern = pattern
+            self._reader = None
+            self._latest = None
+            self.Modified()
+
+    @smproperty.stringvector(name="Array Name", default_values="LiveData")
+    def SetArrayName(self, name):
+        if name != self._name:
+            self._name = name
+            self.Modified()
+
+    @smproperty.xml("""
+        <Property name="Refresh" command="Refresh"
+                  panel_widget="command_button"/>
+        """)
+    def Refresh(self):
+        self.Modified()
+
+    def RequestData(self, request, inInfo, outInfo):
+        import meshiah
+        from vtkmodules.util import numpy_support
+        from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
+        inData = vtkUnstructuredGrid.GetData(inInfo[0], 0)
+        output = vtkUnstructuredGrid.GetData(outInfo, 0)
+        output.ShallowCopy(inData)
+        if not self._pattern:
+            return 1
+
+        npoints = inData.GetNumberOfPoints()
+        if self._reader is None:
+            # fsd steps hold one value per node
+            self._reader = meshiah.TailReader(self._pattern, nvalues=npoints)
+        for _, _, values in self._reader.poll():
+            self._latest = values
+        if self._latest is None:
+            return 1
+
+        array = numpy_support.numpy_to_vtk(self._latest, deep=0)
+        array.SetName(self._name)
+        if len(self._latest) == npoints:
+            output.GetPointData().AddArray(array)
+        else:
+            output.GetCellData().AddArray(array)
+        return 1
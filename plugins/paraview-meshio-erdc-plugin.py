@@ -1,4 +1,5 @@
-import numpy as np
+import logging
+
 from paraview.util.vtkAlgorithm import (
     VTKPythonAlgorithmBase,
     smdomain,
@@ -6,43 +7,33 @@ from paraview.util.vtkAlgorithm import (
     smproperty,
     smproxy,
 )
-from vtkmodules.numpy_interface import dataset_adapter as dsa
-from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
-import sys
-import meshiah
-try:
-    import meshio
-    meshioLib = True
-except ImportError:
-    print(f"Meshio not found")
-    meshioLib = False
-
-paraview_plugin_version = meshiah.__version__
+
+logger = logging.getLogger(__name__)
+
+# Loading the plugin only registers the proxies; meshio, meshiah and vtk
+# are imported by the first RequestData, so the format lists are kept
+# here rather than asked of meshio. tests/test_plugins.py checks them.
+paraview_plugin_version = '0.1.0'
+meshio_extensions = [
+    "f3grid", "msh", "mdpa", "ply", "stl", "vtk", "vtu", "xdmf", "xmf",
+    "cgns", "h5m", "inp", "avs", "xml", "e", "exo", "ex2", "hmf", "med",
+    "mesh", "meshb", "bdf", "fem", "nas", "obj", "off", "post", "post.gz",
+    "dato", "dato.gz", "su2", "svg", "dat", "tec", "ele", "node", "ugrid",
+    "wkt",
+]
+meshio_input_filetypes = [
+    "ansys", "flac3d", "gmsh", "mdpa", "ply", "stl", "vtk", "vtu", "xdmf",
+    "cgns", "h5m", "abaqus", "avsucd", "dolfin-xml", "exodus", "hmf", "med",
+    "medit", "nastran", "neuroglancer", "obj", "off", "permas", "su2",
+    "tecplot", "tetgen", "ugrid", "wkt",
+]
 erdc_exclusive_input_filetypes = ["dm"]
-erdc_exclusive_extensions = ["2dm", "3dm"]
-
-if meshioLib:
-    # paraview_plugin_version = meshio.__version__
-    vtk_to_meshio_type = meshio.vtk._vtk.vtk_to_meshio_type
-    erdc_to_vtk_type = meshio.vtk._vtk.meshio_to_vtk_type
-    meshio_input_filetypes = list(meshio._helpers.reader_map.keys())
-    meshio_extensions = [ext[1:]
-                         for ext in meshio.extension_to_filetype.keys()]
-    erdc_extensions = erdc_exclusive_extensions + meshio_extensions
-    erdc_input_filetypes = ["automatic"] + \
-        meshio_input_filetypes + erdc_exclusive_input_filetypes
-    reader_name = 'ERDC-meshio reader'
-    description = 'ERDC-meshio supported files'
-else:
-    vtk_to_erdc_type = {5: "triangle", 10: "tetrahedra"}
-    erdc_to_vtk_type = {"triangle": 5, "tetrahedra": 10}
-    erdc_input_filetypes = ["automatic"] + erdc_exclusive_input_filetypes
-    erdc_extensions = erdc_exclusive_extensions
-    reader_name = 'ERDC reader'
-    description = 'ERDC supported files'
-
-print(f"ERDC extensions:\n {erdc_extensions}")
-print(f"ERDC input filetypes:\n {erdc_input_filetypes}")
+erdc_exclusive_extensions = ["2dm", "3dm", "mbm"]
+erdc_extensions = erdc_exclusive_extensions + meshio_extensions
+erdc_input_filetypes = ["automatic"] + \
+    meshio_input_filetypes + erdc_exclusive_input_filetypes
+reader_name = 'ERDC-meshio reader'
+description = 'ERDC-meshio supported files'
 
 
 def get_erdc_extensions(fname):
@@ -54,6 +45,28 @@ def get_erdc_extensions(fname):
         return None
 
 
+def get_reader(fname, file_format=None):
+    """
+    How to read a file, ("meshiah", extension) or ("meshio", file type)
+
+    A file format chosen by the user is honoured; the extension only
+    decides when it is left automatic.
+    """
+    ext = get_erdc_extensions(fname)
+    if file_format in erdc_exclusive_input_filetypes:
+        if ext not in erdc_exclusive_extensions:
+            raise ValueError(f"ERDC meshes must have one of the extensions "
+                             f"{erdc_exclusive_extensions}: {fname}")
+        return "meshiah", ext
+    elif file_format in meshio_input_filetypes:
+        return "meshio", file_format
+    elif file_format:
+        raise ValueError(f"Unknown file format {file_format} for {fname}")
+    elif ext is None:
+        raise ValueError(f"Unable to deduce file format from file: {fname}")
+    return "meshiah", ext
+
+
 @smproxy.reader(
     name=reader_name,
     extensions=erdc_extensions,
@@ -67,6 +80,10 @@ class ERDCReader(VTKPythonAlgorithmBase):
         )
         self._filename = None
         self._file_format = None
+        self._geometry = False
+        self._level_of_detail = 0
+        self._cache = False
+        self._build_index = False
 
     @smproperty.stringvector(name="FileName")
     @smdomain.filelist()
@@ -101,19 +118,108 @@ class ERDCReader(VTKPythonAlgorithmBase):
             self._file_format = file_format
             self.Modified()
 
+    @smproperty.intvector(name="CellGeometry", default_values=0)
+    @smdomain.xml("""<BooleanDomain name="bool"/>""")
+    def SetCellGeometry(self, geometry):
+        # Area, Normal, Centroid and Volume of the elements as cell data
+        geometry = bool(geometry)
+        if self._geometry != geometry:
+            self._geometry = geometry
+            self.Modified()
+
+    @smproperty.intvector(name="LevelOfDetail", default_values=0)
+    @smdomain.xml(
+        """
+        <EnumerationDomain name="enum">
+            <Entry value="0" text="Full"/>
+            <Entry value="1" text="Surface preview"/>
+            <Entry value="2" text="Subsampled preview"/>
+        </EnumerationDomain>
+        """
+    )
+    def SetLevelOfDetail(self, level):
+        # A preview of 2dm/3dm files, switch to Full to load everything
+        if self._level_of_detail != level:
+            self._level_of_detail = level
+            self.Modified()
+
+    @smproperty.intvector(name="BinaryCache", default_values=0)
+    @smdomain.xml("""<BooleanDomain name="bool"/>""")
+    def SetBinaryCache(self, cache):
+        # Keep a binary copy of 2dm/3dm files, the surface preview needs it
+        cache = bool(cache)
+        if self._cache != cache:
+            self._cache = cache
+            self.Modified()
+
+    @smproperty.intvector(name="BuildIndex", default_values=0)
+    @smdomain.xml("""<BooleanDomain name="bool"/>""")
+    def SetBuildIndex(self, build_index):
+        # Index 2dm/3dm files for the subsampled preview, one full pass
+        build_index = bool(build_index)
+        if self._build_index != build_index:
+            self._build_index = build_index
+            self.Modified()
+
+    def RequestInformation(self, request, inInfoVec, outInfoVec):
+        # Each pvserver rank asks for its own piece of the elements
+        from vtkmodules.vtkCommonExecutionModel import vtkAlgorithm
+        info = outInfoVec.GetInformationObject(0)
+        info.Set(vtkAlgorithm.CAN_HANDLE_PIECE_REQUEST(), 1)
+        return 1
+
     def RequestData(self, request, inInfoVec, outInfoVec):
+        import meshio
+        import numpy as np
+        import meshiah
+        from vtkmodules.numpy_interface import dataset_adapter as dsa
+        from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
+        from vtkmodules.vtkCommonExecutionModel import \
+            vtkStreamingDemandDrivenPipeline as sddp
         output = dsa.WrapDataObject(vtkUnstructuredGrid.GetData(outInfoVec))
+        info = outInfoVec.GetInformationObject(0)
+        piece = info.Get(sddp.UPDATE_PIECE_NUMBER()) or 0
+        npieces = info.Get(sddp.UPDATE_NUMBER_OF_PIECES()) or 1
 
         # Determine how to read the mesh
-        self._file_format = get_erdc_extensions(self._filename)
-        if(self._file_format):
-            mesh = meshiah.read(self._filename)
+        reader, file_format = get_reader(self._filename, self._file_format)
+        erdc_mesh = reader == "meshiah" and file_format in ("2dm", "3dm")
+        if(erdc_mesh and self._level_of_detail):
+            mode = meshiah.PREVIEW_MODES[self._level_of_detail - 1]
+            if self._build_index and \
+                    meshiah.load_index(self._filename) is None:
+                # One pass over the file, later previews only seek
+                logger.info("Indexing %s for its preview", self._filename)
+                meshiah.build_index(self._filename)
+            try:
+                mesh = meshiah.read_preview(self._filename, mode)
+            except ValueError as error:
+                raise ValueError(f"{error}; turn on BinaryCache with a Full "
+                                 f"read, or BuildIndex") from error
+            if npieces > 1:
+                mesh = meshiah.select_piece(mesh, piece, npieces)
             points, cells = mesh.points, mesh.cells
-        elif(meshioLib and not self._file_format):
-            mesh = meshio.read(self._filename, self._file_format)
+        elif(erdc_mesh and npieces > 1):
+            # Only this piece's elements and nodes, via the byte index
+            mesh = meshiah.read_piece(self._filename, piece, npieces)
+            if self._geometry:
+                from meshiah.geometry import add_cell_properties
+                add_cell_properties(mesh)
+            points, cells = mesh.points, mesh.cells
+        elif(reader == "meshiah"):
+            mesh = meshiah.read(self._filename, cache=self._cache,
+                                geometry=self._geometry)
+            if npieces > 1:
+                mesh = meshiah.select_piece(mesh, piece, npieces)
             points, cells = mesh.points, mesh.cells
         else:
-            print(f"Unable to deduce file format from file: {self._filename}")
+            mesh = meshio.read(self._filename, file_format)
+            if npieces > 1:
+                mesh = meshiah.select_piece(mesh, piece, npieces)
+            if self._geometry:
+                from meshiah.geometry import add_cell_properties
+                add_cell_properties(mesh)
+            points, cells = mesh.points, mesh.cells
 
         # Points
         if points.shape[1] == 2:
@@ -121,22 +227,7 @@ class ERDCReader(VTKPythonAlgorithmBase):
         output.SetPoints(points)
 
         # CellBlock, adapted from test/legacy_writer.py
-        cell_types = np.array([], dtype=np.ubyte)
-        cell_offsets = np.array([], dtype=int)
-        cell_conn = np.array([], dtype=int)
-        for meshio_type, data in cells:
-            vtk_type = meshio.vtk._vtk.meshio_to_vtk_type[meshio_type]
-            ncells, npoints = data.shape
-            cell_types = np.hstack(
-                [cell_types, np.full(ncells, vtk_type, dtype=np.ubyte)]
-            )
-            offsets = len(cell_conn) + (1 + npoints) * \
-                np.arange(ncells, dtype=int)
-            cell_offsets = np.hstack([cell_offsets, offsets])
-            conn = np.hstack(
-                [npoints * np.ones((ncells, 1), dtype=int), data]
-            ).flatten()
-            cell_conn = np.hstack([cell_conn, conn])
+        cell_types, cell_offsets, cell_conn = meshiah.vtk_cell_arrays(mesh)
         output.SetCells(cell_types, cell_offsets, cell_conn)
 
         # Point data
@@ -178,6 +269,11 @@ class MeshioWriter(VTKPythonAlgorithmBase):
             self.Modified()
 
     def RequestData(self, request, inInfoVec, outInfoVec):
+        import meshio
+        import numpy as np
+        from vtkmodules.numpy_interface import dataset_adapter as dsa
+        from vtkmodules.vtkCommonDataModel import vtkUnstructuredGrid
+        vtk_to_meshio_type = meshio.vtk._vtk.vtk_to_meshio_type
         mesh = dsa.WrapDataObject(vtkUnstructuredGrid.GetData(inInfoVec[0]))
 
         # Read points
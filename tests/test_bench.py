@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from meshiah import bench
+
+
+def test_RunBenchmarks(tmp_path):
+    results = bench.run_benchmarks(fixture_dir='tmp', scales=[2000],
+                                   repeat=1, workdir=str(tmp_path))
+    assert 'read_2dm[Scenario1-2dm]' in results
+    assert 'read_3dm[synthetic-3dm-2000]' in results
+    assert 'read_flux_file[synthetic-2000]' in results
+    for result in results.values():
+        assert result['wall_time'] > 0
+        assert result['peak_memory'] >= 0
+
+
+def test_SelectSkipsSetup(tmp_path):
+    results = bench.run_benchmarks(fixture_dir='tmp', scales=[2000],
+                                   repeat=1, select=['read_2dm[synthetic'],
+                                   workdir=str(tmp_path),
+                                   plugin_dir=str(tmp_path / 'none'))
+    assert list(results) == ['read_2dm[synthetic-2dm-2000]']
+    # Nothing is generated for the cases left out
+    assert not [name for name in os.listdir(tmp_path)
+                if 'Scenario1' in name or '3dm' in name or
+                name.endswith(('.fsd', '.bin'))]
+
+
+def test_CheckRegressions():
+    history = {'runs': [{'results': {'case': {'wall_time': 1.0,
+                                              'peak_memory': 100}}}]}
+    fast = {'case': {'wall_time': 1.1, 'peak_memory': 100}}
+    slow = {'case': {'wall_time': 1.5, 'peak_memory': 100}}
+    assert bench.check_regressions(fast, history, threshold=0.25) == []
+    assert len(bench.check_regressions(slow, history, threshold=0.25)) == 1
+    assert bench.check_regressions(slow, history, threshold=1.0) == []
+
+
+def test_BenchHistory(tmp_path):
+    history_file = str(tmp_path / 'history.json')
+    results, regressions = bench.bench(history_file=history_file,
+                                       fixture_dir='tmp', scales=[],
+                                       repeat=1, select=['read_2dm'])
+    assert regressions == []
+    history = bench.load_history(history_file)
+    assert len(history['runs']) == 1
+    assert set(history['runs'][0]['results']) == set(results)
+
+
+@pytest.mark.skipif('MESHIAH_BENCH_HISTORY' not in os.environ,
+                    reason='set MESHIAH_BENCH_HISTORY to run the benchmarks')
+def test_BenchmarkRegressions():
+    threshold = float(os.environ.get('MESHIAH_BENCH_THRESHOLD', 0.25))
+    _, regressions = bench.bench(
+        history_file=os.environ['MESHIAH_BENCH_HISTORY'],
+        threshold=threshold)
+    assert regressions == []
@@ -0,0 +1,57 @@
+import meshio
+import numpy as np
+
+import meshiah
+from meshiah import generate
+from meshiah.cli import main
+from meshiah.diff import fingerprint, mesh_diff
+
+
+def _renumbered(mesh, seed=0):
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(mesh.points))
+    conn = np.argsort(order)[mesh.cells[0][1]]
+    cells = rng.permutation(len(conn))
+    # Rotating the nodes of an element keeps it the same element
+    return meshio.Mesh(mesh.points[order],
+                       [(mesh.cells[0].type, conn[cells][:, [1, 2, 0]])],
+                       cell_data={'Region':
+                                  [mesh.cell_data['Region'][0][cells]]})
+
+
+def test_Fingerprint(tmp_path):
+    filename = str(tmp_path / 'mesh.2dm')
+    generate.generate_2dm(filename, 3000, regions=2, randomize=True)
+    mesh = meshiah.read(filename)
+    digest = fingerprint(mesh)
+    assert fingerprint(filename, chunk_size=500) == digest
+    assert fingerprint(_renumbered(mesh)) == digest
+    mesh.cell_data['Region'][0][0] += 1
+    assert fingerprint(mesh) != digest
+
+
+def test_MeshDiff(tmp_path, capsys):
+    filename = str(tmp_path / 'mesh.2dm')
+    generate.generate_2dm(filename, 3000, regions=2)
+    old = meshiah.read(filename)
+    new = _renumbered(old)
+    assert mesh_diff(old, new).equivalent
+
+    conn = new.cells[0][1]
+    moved = conn[10, 0]
+    new.points[moved] += 0.25
+    new.cell_data['Region'][0][20] += 5
+    new = meshio.Mesh(np.vstack([new.points, [[-1., -1., 0.]]]),
+                      [('triangle', conn[1:])],
+                      cell_data={'Region': [new.cell_data['Region'][0][1:]]})
+    diff = mesh_diff(old, new)
+    assert not diff.equivalent
+    assert np.array_equal(diff.moved[1], [moved])
+    assert np.array_equal(diff.added_nodes, [len(old.points)])
+    assert len(diff.removed_elements) == 1 and not len(diff.added_elements)
+    assert np.array_equal(diff.changed[1], [19])
+    old_ids, new_ids = diff.element_map
+    assert len(old_ids) == len(conn) - 1
+    meshio.write(str(tmp_path / 'new.vtu'), new)
+    assert main(['diff', filename, str(tmp_path / 'new.vtu')]) == 1
+    assert '1 removed' in capsys.readouterr().out
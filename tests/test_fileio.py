@@ -1,4 +1,18 @@
+import asyncio
+import concurrent.futures
+import os
+import pickle
+import shutil
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import meshio
+import numpy as np
+import pytest
+
+import meshiah
 from meshiah import fileio
+from meshiah import generate
 
 
 def test_Read2dm():
@@ -20,3 +34,436 @@ def test_MeshioType():
     mesh = fileio.read(filename)
     assert len(mesh.points) == 1942
     assert len(mesh.cells[0][1]) == 3743
+
+
+def test_ReadMany(tmp_path):
+    fsd_files = generate.generate_fsd_series(str(tmp_path / 'temps'), 1942, 5)
+    paths = ['tmp/Scenario1.2dm'] + fsd_files + ['tmp/Scenario1.3dm']
+    results = meshiah.read_many(paths, max_workers=3, max_in_flight=2)
+    assert len(results[0].points) == 1942
+    assert len(results[-1].points) == 9225
+    for filename, data in zip(fsd_files, results[1:-1]):
+        assert (data == fileio.read_fsd_file(filename)).all()
+
+    streamed = list(meshiah.iread_many(paths, max_workers=2, ordered=True))
+    assert [index for index, _, _ in streamed] == list(range(len(paths)))
+
+
+def test_ReadManyAsync(tmp_path):
+    paths = generate.generate_fsd_series(str(tmp_path / 'temps'), 100, 4)
+    results = asyncio.run(meshiah.read_many_async(paths, max_workers=2))
+    assert [len(data) for data in results] == [100] * 4
+
+    async def first():
+        async for index, _, data in meshiah.aread_many(paths, max_workers=1,
+                                                       max_in_flight=4):
+            return index, len(data)
+
+    # Stopping early cancels the queued reads instead of waiting for them
+    assert asyncio.run(first()) == (0, 100)
+
+
+def test_BinaryMesh(tmp_path):
+    mesh = fileio.read('tmp/Scenario1.3dm')
+    mesh.point_data['Temperature'] = np.linspace(0, 1, len(mesh.points))
+    filename = str(tmp_path / 'Scenario1.mbm')
+    meshiah.write_mbm(filename, mesh)
+    binary = fileio.read(filename)
+    assert np.array_equal(binary.points, mesh.points)
+    assert np.array_equal(binary.cells[0][1], mesh.cells[0][1])
+    assert binary.cells[0][0] == 'tetra'
+    assert np.array_equal(binary.cell_data['Region'][0],
+                          mesh.cell_data['Region'][0])
+    assert np.array_equal(binary.point_data['Temperature'],
+                          mesh.point_data['Temperature'])
+    meshiah.read_mbm(filename, verify=True)
+
+    with open(filename, 'r+b') as ofile:
+        ofile.seek(4096)
+        ofile.write(b'corrupt!')
+    with pytest.raises(ValueError):
+        meshiah.read_mbm(filename, verify=True)
+
+
+def test_BinaryCache(tmp_path):
+    filename = str(tmp_path / 'Scenario1.2dm')
+    shutil.copy('tmp/Scenario1.2dm', filename)
+    mesh = fileio.read(filename, cache=True)
+    assert os.path.exists(meshiah.cache_filename(filename))
+    cached = fileio.read(filename, cache=True)
+    assert len(cached.points) == len(mesh.points) == 1942
+    assert len(cached.cells[0][1]) == 3743
+
+    # Rebuilding the cache leaves meshes mapped from the old one intact
+    points = np.array(cached.points)
+    conn = np.array(cached.cells[0][1])
+    meshiah.write_mbm(meshiah.cache_filename(filename),
+                      meshio.Mesh(points[::-1] + 1, []))
+    arrays = meshiah.allocate_mbm(meshiah.cache_filename(filename),
+                                  [('points', '<f8', (3, 3))])
+    arrays['points'][:] = 7
+    del arrays
+    meshiah.seal_mbm(meshiah.cache_filename(filename))
+    assert np.array_equal(cached.points, points)
+    assert np.array_equal(cached.cells[0][1], conn)
+    assert (meshiah.read_mbm(meshiah.cache_filename(filename),
+                             verify=True).points == 7).all()
+    assert sorted(os.listdir(tmp_path)) == ['Scenario1.2dm',
+                                            'Scenario1.2dm.mbm']
+
+
+def test_SelectiveRead(tmp_path):
+    filename = str(tmp_path / 'regions.3dm')
+    generate.generate_3dm(filename, 6000, regions=3, randomize=True)
+    full = fileio.read(filename)
+
+    for selection in ({'regions': [2]}, {'bbox': (1, 1, 1, 8, 8, 8)},
+                      {'regions': [1, 3], 'bbox': (0, 0, 0, 5, 9, 9)}):
+        sub = fileio.read(filename, **selection)
+        expected = meshiah.select_mesh(full, **selection)
+        point_ids = sub.point_data['vtkOriginalPointIds']
+        cell_ids = sub.cell_data['vtkOriginalCellIds'][0]
+        assert np.array_equal(sub.points, expected.points)
+        assert np.array_equal(sub.cells[0][1], expected.cells[0][1])
+        assert np.array_equal(sub.points, full.points[point_ids])
+        assert np.array_equal(point_ids[sub.cells[0][1]],
+                              full.cells[0][1][cell_ids])
+    assert set(fileio.read(filename, regions=[2]).cell_data['Region'][0]) \
+        == {2}
+
+    # Point data follows the selected nodes
+    full.point_data['Depth'] = -full.points[:, 2]
+    for selection in ({'regions': [2]}, {'bbox': (1, 1, 1, 8, 8, 8)},
+                      {'bbox': (1, 1, 1, 8, 8, 8), 'elements': False}):
+        sub = meshiah.select_mesh(full, **selection)
+        assert np.array_equal(sub.point_data['Depth'], -sub.points[:, 2])
+
+
+def test_NodesOnlyRead():
+    nodes = fileio.read('tmp/Scenario1.3dm', elements=False)
+    assert len(nodes.points) == 9225
+    assert nodes.cells == []
+    elements = fileio.read('tmp/Scenario1.3dm', nodes=False)
+    assert len(elements.points) == 0
+    assert len(elements.cells[0][1]) == 39034
+    inside = fileio.read('tmp/Scenario1.3dm', elements=False,
+                         bbox=(50, 0, -10, 60, 10, 0))
+    assert ((inside.points[:, 0] >= 50) & (inside.points[:, 0] <= 60)).all()
+    assert len(inside.points) == np.count_nonzero(
+        meshiah.in_bbox(nodes.points, (50, 0, -10, 60, 10, 0)))
+
+
+def test_IndexedRead(tmp_path):
+    filename = str(tmp_path / 'indexed.2dm')
+    generate.generate_2dm(filename, 5000, regions=2, randomize=True)
+    full = fileio.read(filename, index=True)
+    assert os.path.exists(meshiah.index_filename(filename))
+    index = meshiah.load_index(filename)
+    assert index is not None
+    assert np.array_equal(index['stamp'],
+                          meshiah.build_index(filename, write=False)['stamp'])
+
+    small = meshiah.build_index(filename, stride=64, write=False)
+    # Scanning in small blocks of lines gives the same index
+    streamed = meshiah.build_index(filename, stride=64, write=False,
+                                   block_size=1000)
+    assert sorted(streamed) == sorted(small)
+    assert all(np.array_equal(streamed[key], small[key]) for key in small)
+    for start, stop in ((0, 10), (63, 65), (1000, 2345), (4990, 6000)):
+        points = meshiah.read_node_range(filename, start, stop, small)
+        assert np.array_equal(points, full.points[start:stop])
+        conn, mats = meshiah.read_element_range(filename, start, stop, small)
+        assert np.array_equal(conn, full.cells[0][1][start:stop])
+        assert np.array_equal(mats, full.cell_data['Region'][0][start:stop])
+
+    parts = meshiah.split_range(5000, 3, 64)
+    assert parts[0][0] == 0 and parts[-1][1] == 5000
+    assert all(a[1] == b[0] for a, b in zip(parts, parts[1:]))
+    mesh = meshiah.read_indexed(filename, max_workers=3, processes=False)
+    assert np.array_equal(mesh.points, full.points)
+    assert np.array_equal(mesh.cells[0][1], full.cells[0][1])
+
+    # A partly written or corrupt index counts as missing
+    with open(meshiah.index_filename(filename), 'r+b') as ofile:
+        ofile.truncate(100)
+    assert meshiah.load_index(filename) is None
+    assert meshiah.get_index(filename) is not None
+
+    # Any change to the mesh file invalidates the index
+    with open(filename, 'a') as ofile:
+        ofile.write('\n')
+    assert meshiah.load_index(filename) is None
+
+
+def _point_sum(handle):
+    mesh = handle.open()
+    return mesh.points.sum(), mesh.points.flags.writeable
+
+
+def test_SharedMesh():
+    mesh = fileio.read('tmp/Scenario1.3dm')
+    with meshiah.share_mesh(mesh) as shared:
+        handle = pickle.loads(pickle.dumps(shared.handle))
+        assert len(pickle.dumps(handle)) < 200
+        view = handle.open()
+        assert np.array_equal(view.points, mesh.points)
+        assert np.array_equal(view.cells[0][1], mesh.cells[0][1])
+        with concurrent.futures.ProcessPoolExecutor(2) as pool:
+            results = list(pool.map(_point_sum, [shared.handle] * 2))
+        assert results == [(mesh.points.sum(), False)] * 2
+    assert shared.closed
+    assert not os.path.exists(shared.filename)
+
+    # A name reused for another mesh is not served from the old mapping
+    smaller = meshio.Mesh(mesh.points[:3], [("triangle", [[0, 1, 2]])])
+    fileio.write_mbm(shared.filename, smaller)
+    try:
+        assert len(meshiah.MeshHandle(shared.filename).open().points) == 3
+        assert np.array_equal(view.points, mesh.points)
+    finally:
+        os.remove(shared.filename)
+
+
+def test_OutOfCore(tmp_path):
+    filename = str(tmp_path / 'big.3dm')
+    npoints, _ = generate.generate_3dm(filename, 30000, regions=3,
+                                       randomize=True)
+    temperature = generate.generate_fsd_series(str(tmp_path / 'big'),
+                                               npoints, 1)[0]
+    full = fileio.read(filename)
+    limit = 128 << 10
+
+    tracemalloc.start()
+    mesh = meshiah.read_out_of_core(filename, {'T': temperature},
+                                    memory_limit=limit)
+    sub = meshiah.select_out_of_core(mesh, str(tmp_path / 'sub.mbm'),
+                                     regions=[2], bbox=(0, 0, 0, 9, 9, 9),
+                                     memory_limit=limit)
+    cells = meshiah.vtk_cell_arrays_out_of_core(mesh, memory_limit=limit)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 4 * limit
+    assert full.points.nbytes + full.cells[0][1].nbytes > 8 * limit
+
+    assert not mesh.points.flags.owndata
+    assert isinstance(mesh.cell_data['Region'][0], np.memmap)
+    assert np.array_equal(mesh.points, full.points)
+    assert np.array_equal(mesh.cells[0][1], full.cells[0][1])
+    assert np.array_equal(mesh.point_data['T'],
+                          fileio.read_fsd_file(temperature))
+    expected = meshiah.select_mesh(full, regions=[2],
+                                   bbox=(0, 0, 0, 9, 9, 9))
+    assert np.array_equal(sub.points, expected.points)
+    assert np.array_equal(sub.cells[0][1], expected.cells[0][1])
+    assert np.array_equal(sub.cell_data['vtkOriginalCellIds'][0],
+                          expected.cell_data['vtkOriginalCellIds'][0])
+    for ours, theirs in zip(cells, meshiah.vtk_cell_arrays(full)):
+        assert np.array_equal(ours, theirs)
+
+    parts = meshiah.split_regions_out_of_core(mesh, str(tmp_path / 'part'))
+    assert sorted(parts) == [1, 2, 3]
+    assert sum(len(meshiah.read_mbm(path).cells[0][1])
+               for path in parts.values()) == len(full.cells[0][1])
+
+    # A new field rebuilds the cache beside the mesh still mapping it
+    pressure = generate.generate_fsd_series(str(tmp_path / 'p'),
+                                            npoints, 1)[0]
+    rebuilt = meshiah.read_out_of_core(filename, {'T': temperature,
+                                                  'P': pressure},
+                                       memory_limit=limit)
+    assert np.array_equal(rebuilt.point_data['P'],
+                          fileio.read_fsd_file(pressure))
+    assert np.array_equal(mesh.points, full.points)
+    assert np.array_equal(mesh.point_data['T'],
+                          fileio.read_fsd_file(temperature))
+    assert not [name for name in os.listdir(tmp_path)
+                if name.endswith('.tmp')]
+
+    # So does a field file written again since
+    meshiah.write_fsd(temperature, -fileio.read_fsd_file(temperature))
+    stat = os.stat(temperature)
+    os.utime(temperature, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    rebuilt = meshiah.read_out_of_core(filename, {'T': temperature},
+                                       memory_limit=limit)
+    assert np.array_equal(rebuilt.point_data['T'],
+                          fileio.read_fsd_file(temperature))
+    assert (rebuilt.point_data['T'] != mesh.point_data['T']).any()
+
+
+def test_WriteVtu(tmp_path):
+    filename = str(tmp_path / 'mesh.3dm')
+    npoints, ncells = generate.generate_3dm(filename, 3000, regions=2)
+    mesh = fileio.read(filename)
+    flux = np.random.default_rng(0).random(ncells)
+    for compression in (None, 6):
+        vtu_file = str(tmp_path / f'mesh_{compression}.vtu')
+        meshiah.write_vtu(vtu_file, mesh, cell_data={'Flux': flux},
+                          point_data={'XY': mesh.points[:, :2]},
+                          compression=compression, block_size=10000)
+        back = meshio.read(vtu_file)
+        assert np.array_equal(back.points, mesh.points)
+        assert np.array_equal(back.cells[0][1], mesh.cells[0][1])
+        assert np.array_equal(back.cell_data['Region'][0],
+                              mesh.cell_data['Region'][0])
+        assert np.array_equal(back.cell_data['Flux'][0], flux)
+        assert np.array_equal(back.point_data['XY'], mesh.points[:, :2])
+
+    fsd_files = generate.generate_fsd_series(str(tmp_path / 'T'), npoints, 3)
+    pvd_file = meshiah.write_vtu_series(str(tmp_path / 'series'), mesh,
+                                        fsd_files, 'T', times=[0, 6, 12])
+    entries = ET.parse(pvd_file).getroot().findall('.//DataSet')
+    assert [float(e.get('timestep')) for e in entries] == [0, 6, 12]
+    step = meshio.read(str(tmp_path / entries[2].get('file')))
+    assert np.array_equal(step.point_data['T'],
+                          fileio.read_fsd_file(fsd_files[2]))
+
+
+def test_TailReader(tmp_path):
+    fsd_file = str(tmp_path / 'live_00000.fsd')
+    reader = meshiah.TailReader(str(tmp_path / 'live_*.*'), nvalues=3)
+    assert reader.poll() == []
+
+    with open(fsd_file, 'w') as ofile:
+        ofile.write('1.0\n2.0\n3.0\n4.0\n5')
+    steps = reader.poll()
+    assert [(path, step) for path, step, _ in steps] == [(fsd_file, 0)]
+    assert np.array_equal(steps[0][2], [1, 2, 3])
+    with open(fsd_file, 'a') as ofile:
+        ofile.write('.5\n6.0\n')
+    steps = reader.poll()
+    assert steps[0][1] == 1
+    assert np.array_equal(steps[0][2], [4, 5.5, 6])
+
+    flux_file = str(tmp_path / 'live_00001.bin')
+    meshiah.write_flux_file(flux_file, [1.0, 2.0])
+    with open(flux_file, 'rb') as ifile:
+        data = ifile.read()
+    with open(flux_file, 'ab') as ofile:
+        ofile.write(data[:-4])
+    steps = reader.poll()
+    assert len(steps) == 1 and np.array_equal(steps[0][2], [1, 2])
+
+    seen = []
+    assert meshiah.follow([fsd_file], lambda *step: seen.append(step),
+                          nvalues=3, interval=0, timeout=0) == 2
+    assert len(seen) == 2
+
+
+def test_WriteFsd(tmp_path):
+    rng = np.random.default_rng(0)
+    values = np.concatenate([np.round(rng.normal(290, 5, 1000), 6),
+                             rng.normal(size=100),
+                             [0.0, -0.0, 1e300, -1e-300, 5e-324, 2.0 ** 60]])
+    fsd_file = str(tmp_path / 'values.fsd')
+    assert meshiah.write_fsd(fsd_file, values, chunk_size=256) == fsd_file
+    read = meshiah.read_fsd_file(fsd_file)
+    assert np.array_equal(read.view(np.int64), values.view(np.int64))
+
+    # Full precision values over the whole range get the digits of repr
+    values = rng.normal(size=20000) * 10.0 ** rng.integers(-310, 308, 20000)
+    values = np.concatenate([values, 2.0 ** 53 + np.arange(0, 40, 2),
+                             [0.30000000000000004, 9.999999999999999e16]])
+    meshiah.write_fsd(fsd_file, values)
+    read = meshiah.read_fsd_file(fsd_file)
+    assert np.array_equal(read.view(np.int64), values.view(np.int64))
+    with open(fsd_file) as ifile:
+        lines = ifile.read().split()
+    for line, value in zip(lines, values.tolist()):
+        digits = line.lstrip('-').split('e')[0].replace('.', '').strip('0')
+        expected = repr(value).lstrip('-').split('e')[0].replace('.', '')
+        assert digits == expected.strip('0') or value == 0
+
+    steps = rng.normal(size=(3, 50))
+    names = meshiah.write_fsd(str(tmp_path / 'T'), steps, max_workers=2)
+    assert names == [str(tmp_path / f'T_{i:05d}.fsd') for i in range(3)]
+    for name, step in zip(names, steps):
+        assert np.array_equal(meshiah.read_fsd_file(name), step)
+    meshiah.write_fsd(fsd_file, steps[0], decimals=3)
+    assert np.allclose(meshiah.read_fsd_file(fsd_file), steps[0], atol=5e-4)
+
+
+def test_ReadPiece(tmp_path):
+    filename = str(tmp_path / 'pieces.2dm')
+    generate.generate_2dm(filename, 5000, regions=3)
+    full = fileio.read(filename)
+    index = meshiah.build_index(filename, stride=64)
+    npieces = 4
+    cell_ids = []
+    for piece in range(npieces):
+        mesh = meshiah.read_piece(filename, piece, npieces, index)
+        point_ids = mesh.point_data['vtkOriginalPointIds']
+        ids = mesh.cell_data['vtkOriginalCellIds'][0]
+        cell_ids.append(ids)
+        assert np.array_equal(mesh.points, full.points[point_ids])
+        assert np.array_equal(point_ids[mesh.cells[0][1]],
+                              full.cells[0][1][ids])
+        assert np.array_equal(mesh.cell_data['Region'][0],
+                              full.cell_data['Region'][0][ids])
+        # Memory follows the piece, not the whole mesh
+        assert len(ids) <= len(full.cells[0][1]) // npieces + 1
+        assert len(mesh.points) < len(full.points) / 2
+
+        selected = meshiah.select_piece(full, piece, npieces)
+        assert np.array_equal(selected.cell_data['vtkOriginalCellIds'][0],
+                              ids)
+        assert np.array_equal(selected.points, mesh.points)
+    # Every element is in exactly one piece
+    assert np.array_equal(np.concatenate(cell_ids),
+                          np.arange(len(full.cells[0][1])))
+
+
+def _piece_cell_ids(filename, piece, npieces):
+    return meshiah.read_piece(filename, piece, npieces) \
+        .cell_data['vtkOriginalCellIds'][0]
+
+
+def test_ConcurrentReadPiece(tmp_path):
+    # Ranks reading pieces of a file with no index all build and write it
+    filename = str(tmp_path / 'fresh.2dm')
+    generate.generate_2dm(filename, 20000, regions=2)
+    npieces = 6
+    with concurrent.futures.ProcessPoolExecutor(npieces) as pool:
+        parts = list(pool.map(_piece_cell_ids, [filename] * npieces,
+                              range(npieces), [npieces] * npieces))
+    assert np.array_equal(np.concatenate(parts),
+                          np.arange(len(fileio.read(filename).cells[0][1])))
+    assert meshiah.load_index(filename) is not None
+    assert sorted(os.listdir(tmp_path)) == ['fresh.2dm', 'fresh.2dm.idx']
+
+
+def test_ReadPreview(tmp_path):
+    filename = str(tmp_path / 'preview.3dm')
+    generate.generate_3dm(filename, 20000, regions=2)
+
+    # A preview never parses the whole file to build the index itself
+    with pytest.raises(ValueError):
+        meshiah.read_preview(filename, 'surface', max_cells=5000)
+    assert not os.path.exists(meshiah.index_filename(filename))
+
+    # Without the binary cache only indexed blocks are read
+    meshiah.build_index(filename)
+    sample = meshiah.read_preview(filename, 'surface', max_cells=5000)
+    ids = sample.cell_data['vtkOriginalCellIds'][0]
+    assert sample.cells[0].type == 'tetra' and 0 < len(ids) <= 5000
+    full = fileio.read(filename, cache=True)
+    point_ids = sample.point_data['vtkOriginalPointIds']
+    assert np.array_equal(point_ids[sample.cells[0][1]],
+                          full.cells[0][1][ids])
+
+    surface = meshiah.read_preview(filename, 'surface', max_cells=10 ** 6)
+    assert os.path.exists(meshiah.preview_filename(filename))
+    triangles = surface.cells[0][1]
+    assert surface.cells[0].type == 'triangle'
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]],
+                                    triangles[:, [2, 0]]]), axis=1)
+    # A closed surface, every edge shared by two triangles
+    assert (np.unique(edges, axis=0, return_counts=True)[1] == 2).all()
+    assert np.array_equal(surface.cell_data['Region'][0],
+                          full.cell_data['Region'][0][
+                              surface.cell_data['vtkOriginalCellIds'][0]])
+    again = meshiah.read_preview(filename, 'surface', max_cells=10 ** 6)
+    assert np.array_equal(again.cells[0][1], triangles)
+
+    outline = meshiah.boundary_mesh(meshiah.subsample_mesh(surface, 100))
+    assert outline.cells[0].type == 'line'
+    assert outline.point_data['vtkOriginalPointIds'].max() < len(full.points)
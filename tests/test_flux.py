@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+import meshiah
+from meshiah import cli
+from meshiah import flux
+from meshiah import generate
+
+
+def test_AggregateFlux(tmp_path):
+    prefix = str(tmp_path / 'flux')
+    paths = generate.generate_flux_series(prefix, 5000, 4,
+                                          number_of_lights=3)
+    expected = sum(meshiah.read_flux_file(path) for path in paths)
+
+    totals, lights = flux.aggregate_flux(paths, normalize=False)
+    assert lights == 12
+    assert np.allclose(totals, expected)
+    means, _ = flux.aggregate_flux(paths, chunk_size=700, max_workers=3)
+    assert np.allclose(means, expected / 12)
+
+    filename = str(tmp_path / 'total.bin')
+    meshiah.write_flux_file(filename, totals, lights)
+    assert meshiah.read_flux_header(filename) == (12, 5000)
+    assert np.array_equal(meshiah.read_flux_file(filename), totals)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason="needs /proc to count open files")
+def test_AggregateManyFluxFiles(tmp_path):
+    resource = pytest.importorskip('resource')
+    paths = generate.generate_flux_series(str(tmp_path / 'flux'), 300, 200)
+    expected = sum(meshiah.read_flux_file(path) for path in paths)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # Far fewer descriptors than files
+    resource.setrlimit(resource.RLIMIT_NOFILE,
+                       (len(os.listdir('/proc/self/fd')) + 16, hard))
+    try:
+        totals, lights = flux.aggregate_flux(paths, normalize=False,
+                                             chunk_size=64)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert lights == 200
+    assert np.allclose(totals, expected)
+
+
+def test_AggregateFluxHeaders(tmp_path):
+    short = generate.generate_flux_series(str(tmp_path / 'short'), 10, 1)
+    long = generate.generate_flux_series(str(tmp_path / 'long'), 20, 1)
+    with pytest.raises(ValueError):
+        flux.aggregate_flux(short + long)
+    with open(long[0], 'r+b') as ofile:
+        ofile.truncate(100)
+    with pytest.raises(ValueError):
+        flux.check_flux_headers(long)
+
+
+def test_FluxCommand(tmp_path):
+    mesh_file = str(tmp_path / 'mesh.2dm')
+    _, ncells = generate.generate_2dm(mesh_file, 500)
+    paths = generate.generate_flux_series(str(tmp_path / 'flux'), ncells, 3,
+                                          number_of_lights=2)
+    output = str(tmp_path / 'total.bin')
+    mesh_output = str(tmp_path / 'flux.vtu')
+    assert cli.main(['flux', *paths, '-o', output, '--mesh', mesh_file,
+                     '--mesh-output', mesh_output]) == 0
+    totals = meshiah.read_flux_file(output)
+    mesh = meshiah.read(mesh_output)
+    assert np.allclose(mesh.cell_data['FluxData'][0], totals / 6)
+
+
+def test_FluxSeries(tmp_path):
+    prefix = str(tmp_path / 'flux')
+    paths = generate.generate_flux_series(prefix, 1000, 5,
+                                          number_of_lights=4)
+    found, numbers = flux.series_paths(paths[2])
+    assert found == paths
+    assert numbers == [0, 1, 2, 3, 4]
+
+    # Room for two normalized steps of 8000 bytes
+    series = flux.FluxSeries.from_file(paths[0], number_of_lights=4,
+                                       max_bytes=16000)
+    assert series.index_at(2.4) == 2
+    for index in (0, 1, 2, 1):
+        assert np.array_equal(series[index],
+                              meshiah.read_flux_file(paths[index]) / 4)
+    assert series.cached_bytes <= 16000
+    assert series[1] is series[1]
+
+    raw = flux.FluxSeries(paths, normalize=False)
+    assert isinstance(raw[3], np.memmap)
+    with pytest.raises(ValueError):
+        flux.FluxSeries(paths, number_of_lights=2)[0]
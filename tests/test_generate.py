@@ -0,0 +1,39 @@
+import numpy as np
+
+from meshiah import fileio
+from meshiah import generate
+
+
+def test_Generate2dm(tmp_path):
+    filename = str(tmp_path / 'synthetic.2dm')
+    npoints, ncells = generate.generate_2dm(filename, 5000, regions=3)
+    mesh = fileio.read(filename)
+    assert len(mesh.points) == npoints
+    assert len(mesh.cells[0][1]) == ncells
+    assert set(mesh.cell_data['Region'][0]) == {1, 2, 3}
+
+
+def test_Generate3dmRandomized(tmp_path):
+    filename = str(tmp_path / 'synthetic.3dm')
+    npoints, ncells = generate.generate_3dm(filename, 5000, regions=4,
+                                            randomize=True, chunk_size=700)
+    mesh = fileio.read(filename)
+    tets = mesh.cells[0][1]
+    points = mesh.points
+    assert len(points) == npoints
+    assert len(tets) == ncells
+    assert len(np.unique(tets)) == npoints
+    edges = points[tets[:, 1:]] - points[tets[:, :1]]
+    assert (np.linalg.det(edges) > 0).all()
+    assert set(mesh.cell_data['Region'][0]) == {1, 2, 3, 4}
+
+
+def test_GenerateResultSeries(tmp_path):
+    prefix = str(tmp_path / 'synthetic')
+    fsd_files = generate.generate_fsd_series(prefix, 100, 3)
+    flux_files = generate.generate_flux_series(prefix, 50, 2,
+                                               number_of_lights=4)
+    assert len(fsd_files) == 3
+    assert len(fileio.read_fsd_file(fsd_files[-1])) == 100
+    assert fileio.read_flux_header(flux_files[0]) == (4, 50)
+    assert len(fileio.read_flux_file(flux_files[1])) == 50
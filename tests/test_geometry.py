@@ -0,0 +1,71 @@
+import meshio
+import numpy as np
+
+import meshiah
+from meshiah import generate
+from meshiah import geometry
+
+
+def test_TriangleProperties():
+    points = np.array([[0., 0., 0.], [2., 0., 0.], [0., 2., 0.],
+                       [0., 0., 3.]])
+    props = geometry.triangle_properties(points, [[0, 1, 2], [0, 3, 1]],
+                                         chunk_size=1)
+    assert np.allclose(props['Area'], [2., 3.])
+    assert np.allclose(props['Normal'], [[0, 0, 1], [0, 1, 0]])
+    assert np.allclose(props['Centroid'][0], [2 / 3, 2 / 3, 0])
+    tets = geometry.tetra_properties(points, [[0, 1, 2, 3], [0, 2, 1, 3]])
+    assert np.allclose(tets['Volume'], [2., -2.])
+
+
+def test_CellPropertiesCache(tmp_path):
+    filename = str(tmp_path / 'mesh.3dm')
+    generate.generate_3dm(filename, 3000, randomize=True)
+    mesh = meshiah.read(filename)
+    props = geometry.cell_properties(mesh, chunk_size=500)
+    assert set(props) == {'Centroid', 'Volume'}
+    assert (props['Volume'][0] > 0).all()
+    assert np.isclose(props['Volume'][0].sum(), np.prod(
+        mesh.points.max(axis=0) - mesh.points.min(axis=0)), rtol=0.1)
+    assert geometry.cell_properties(mesh) is props
+
+    # Changes in place are noticed as well as replaced arrays
+    mesh.points[:] *= 2
+    scaled = geometry.cell_properties(mesh)
+    assert np.allclose(scaled['Volume'][0], 8 * props['Volume'][0])
+    mesh.points = mesh.points / 2
+    assert np.allclose(geometry.cell_properties(mesh)['Volume'][0],
+                       props['Volume'][0])
+
+    # A new array that happens to get the id of a freed one is not a hit
+    base = np.array(mesh.points)
+    for scale in (2, 3, 2, 3):
+        mesh.points = base * scale
+        assert np.allclose(geometry.cell_properties(mesh)['Volume'][0],
+                           scale ** 3 * props['Volume'][0])
+
+
+def test_GeometryInBinaryCache(tmp_path):
+    filename = str(tmp_path / 'mesh.2dm')
+    generate.generate_2dm(filename, 2000)
+    # Asking for geometry rebuilds a plain cache under the mapped mesh
+    plain = meshiah.read(filename, cache=True)
+    points = np.array(plain.points)
+    first = meshiah.read(filename, cache=True, geometry=True)
+    assert np.array_equal(plain.points, points)
+    cached = meshiah.read(filename, cache=True, geometry=True)
+    assert isinstance(cached.cell_data['Area'][0], np.memmap)
+    assert np.allclose(cached.cell_data['Area'][0],
+                       first.cell_data['Area'][0])
+    assert geometry.cell_properties(cached)['Area'][0] is \
+        cached.cell_data['Area'][0]
+
+    # The stored key covers the connectivity too
+    copy = meshio.Mesh(np.array(cached.points),
+                       [('triangle', np.array(cached.cells[0][1])[:, ::-1])],
+                       cell_data={name: [np.array(cached.cell_data[name][0])]
+                                  for name in ('Area', 'Normal',
+                                               'Centroid')},
+                       field_data=dict(cached.field_data))
+    flipped = geometry.cell_properties(copy)['Normal'][0]
+    assert np.allclose(flipped, -cached.cell_data['Normal'][0])
@@ -0,0 +1,56 @@
+import json
+import threading
+
+import meshiah
+from meshiah import fileio
+from meshiah import instrument
+
+
+def test_RecordPhases():
+    events = []
+    with instrument.record(callback=events.append) as rec:
+        mesh = fileio.read('tmp/Scenario1.2dm')
+        meshiah.vtk_cell_arrays(mesh)
+    summary = rec.summary()
+    for name in ('open', 'tokenize', 'convert', 'build_mesh',
+                 'vtk_conversion'):
+        assert summary['phases'][name]['count'] == 1
+    assert summary['counters']['points'] == 1942
+    assert summary['counters']['cells'] == 3743
+    assert len(events) == len(rec.events)
+
+
+def test_ThreadedCounts():
+    def work():
+        for _ in range(10000):
+            with instrument.phase('work'):
+                instrument.count('items')
+
+    with instrument.record() as rec:
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert rec.counters['items'] == 80000
+    assert rec.summary()['phases']['work']['count'] == 80000
+
+
+def test_DisabledPhase():
+    assert not instrument.enabled()
+    assert instrument.phase('open') is instrument.phase('convert')
+    instrument.count('points', 10)
+
+
+def test_TraceFiles(tmp_path):
+    trace_file = str(tmp_path / 'trace.json')
+    json_file = str(tmp_path / 'summary.json')
+    with instrument.record(json_file=json_file, trace_file=trace_file):
+        fileio.read('tmp/Scenario1.3dm')
+    with open(trace_file) as ifile:
+        trace = json.load(ifile)
+    names = {event['name'] for event in trace['traceEvents']}
+    assert {'open', 'tokenize', 'convert', 'build_mesh', 'cells'} <= names
+    with open(json_file) as ifile:
+        summary = json.load(ifile)
+    assert summary['counters']['cells'] == 39034
@@ -0,0 +1,72 @@
+import ast
+import os
+
+import meshio
+import pytest
+
+import meshiah
+from meshiah import bench
+
+PLUGIN_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'plugins')
+ERDC_PLUGIN = os.path.join(PLUGIN_DIR, 'paraview-meshio-erdc-plugin.py')
+
+
+def _constants(filename):
+    """ Module level names assigned a literal in a plugin """
+    with open(filename) as ifile:
+        tree = ast.parse(ifile.read())
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            try:
+                constants[node.targets[0].id] = ast.literal_eval(node.value)
+            except (AttributeError, ValueError):
+                pass
+    return constants
+
+
+def _functions(filename):
+    """ Module level names and functions of a plugin, without ParaView """
+    with open(filename) as ifile:
+        tree = ast.parse(ifile.read())
+    tree.body = [node for node in tree.body if isinstance(
+        node, (ast.Import, ast.Assign, ast.FunctionDef))]
+    namespace = {}
+    exec(compile(tree, filename, 'exec'), namespace)
+    return namespace
+
+
+def test_PluginFormats():
+    # The plugin lists formats statically so loading it skips meshio
+    constants = _constants(ERDC_PLUGIN)
+    assert constants['meshio_extensions'] == \
+        [ext[1:] for ext in meshio.extension_to_filetype]
+    assert constants['meshio_input_filetypes'] == \
+        list(meshio._helpers.reader_map)
+    assert constants['erdc_exclusive_extensions'] == \
+        ['2dm', '3dm', meshiah.binary_extension]
+    assert constants['paraview_plugin_version'] == meshiah.__version__
+
+
+def test_PluginImport():
+    for name in sorted(os.listdir(PLUGIN_DIR)):
+        if not name.endswith('.py'):
+            continue
+        result = bench.plugin_import_time(os.path.join(PLUGIN_DIR, name),
+                                          repeat=1)
+        assert result['output'] == '', name
+        assert not {'meshio', 'meshiah', 'numpy', 'vtkmodules'} & \
+            set(result['imported']), name
+
+
+def test_PluginReader():
+    get_reader = _functions(ERDC_PLUGIN)['get_reader']
+    # Automatic picks by extension, a chosen format is kept
+    assert get_reader('mesh.3dm') == ('meshiah', '3dm')
+    assert get_reader('mesh.vtu') == ('meshiah', 'vtu')
+    assert get_reader('mesh.dat', 'tecplot') == ('meshio', 'tecplot')
+    assert get_reader('mesh.2dm', 'dm') == ('meshiah', '2dm')
+    for args in (('mesh.unknown',), ('mesh.2dm', 'nonsense'),
+                 ('mesh.vtu', 'dm')):
+        with pytest.raises(ValueError):
+            get_reader(*args)
@@ -0,0 +1,44 @@
+import numpy as np
+
+import meshiah
+from meshiah import generate
+from meshiah import geometry
+from meshiah.refine import refine_mesh, refine_uniform
+
+
+def test_RefineTriangles():
+    points = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.],
+                       [1., 1., 0.]])
+    points_, cells, data, children = refine_uniform(
+        points, [("triangle", np.array([[0, 1, 2], [1, 3, 2]]))],
+        {"T": np.arange(4.)})
+    # 5 edges, the diagonal shared by both triangles gets one midpoint
+    assert len(points_) == 9 and children == [4]
+    assert cells[0][1].shape == (8, 3)
+    assert np.allclose(data["T"], points_[:, 0] + 2 * points_[:, 1])
+    area = geometry.triangle_properties(points_, cells[0][1])["Area"]
+    assert np.allclose(area, 0.125)
+
+
+def test_RefineMesh(tmp_path):
+    filename = str(tmp_path / 'mesh.3dm')
+    generate.generate_3dm(filename, 3000, regions=3, randomize=True)
+    mesh = meshiah.read(filename, geometry=True)
+    mesh.point_data["T"] = 2 * mesh.points[:, 0] - mesh.points[:, 2]
+    refined = refine_mesh(mesh, levels=2)
+    ncells = len(mesh.cells[0][1])
+    assert len(refined.cells[0][1]) == 64 * ncells
+    assert np.array_equal(refined.cell_data["Region"][0],
+                          np.repeat(mesh.cell_data["Region"][0], 64))
+    assert np.allclose(refined.point_data["T"],
+                       2 * refined.points[:, 0] - refined.points[:, 2])
+    # Children fill their parent with the same orientation
+    volume = refined.cell_data["Volume"][0]
+    assert (volume > 0).all()
+    assert np.allclose(volume.reshape(ncells, 64).sum(axis=1),
+                       mesh.cell_data["Volume"][0])
+    # Conforming: every interior face is shared by exactly two tetrahedra
+    tets = refined.cells[0][1]
+    faces = np.sort(tets[:, [[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]]]
+                    .reshape(-1, 3), axis=1)
+    assert np.unique(faces, axis=0, return_counts=True)[1].max() == 2
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import meshiah
+from meshiah import generate
+from meshiah.cli import main
+from meshiah.remap import line_probe, remap_mesh_data, remap_weights, \
+    sample_line
+
+
+def _linear(points):
+    return 2 * points[:, 0] - 3 * points[:, 1] + 0.5 * points[:, 2] + 1
+
+
+def test_RemapTetra(tmp_path):
+    generate.generate_3dm(str(tmp_path / 'old.3dm'), 3000, randomize=True)
+    generate.generate_3dm(str(tmp_path / 'new.3dm'), 5000, randomize=True,
+                          seed=1)
+    source = meshiah.read(str(tmp_path / 'old.3dm'))
+    target = meshiah.read(str(tmp_path / 'new.3dm'))
+    remap = remap_weights(source, target.points, chunk_size=500)
+    assert remap.shape == (len(target.points), len(source.points))
+    assert np.allclose(remap.weights.sum(axis=1), 1)
+
+    # Linear fields are reproduced inside, every step in one product
+    steps = np.stack([k * _linear(source.points) for k in range(1, 4)])
+    result = remap(steps, axis=1)
+    inside = ~remap.outside
+    assert result.shape == (3, len(target.points))
+    assert np.allclose(result[:, inside],
+                       np.outer([1, 2, 3], _linear(target.points[inside])))
+
+    # Outside the source the nearest node is used
+    assert remap.outside.any()
+    for point, node in zip(target.points[remap.outside][:50],
+                           remap.index[remap.outside][:50, 0]):
+        distance = ((source.points - point) ** 2).sum(axis=1)
+        assert np.isclose(distance[node], distance.min())
+
+
+def test_RemapTriangles(tmp_path):
+    generate.generate_2dm(str(tmp_path / 'old.2dm'), 2000, randomize=True)
+    source = meshiah.read(str(tmp_path / 'old.2dm'))
+    # Located in the plane, whatever the elevation
+    source.point_data['T'] = _linear(source.points * [1, 1, 0])
+    target = meshiah.read(str(tmp_path / 'old.2dm'))
+    target.points = 0.9 * target.points + 0.1
+    remap_mesh_data(source, target)
+    assert np.allclose(target.point_data['T'],
+                       _linear(target.points * [1, 1, 0]))
+
+
+def test_RemapCommand(tmp_path):
+    generate.generate_3dm(str(tmp_path / 'old.3dm'), 2000)
+    generate.generate_3dm(str(tmp_path / 'new.3dm'), 3000, randomize=True)
+    source = meshiah.read(str(tmp_path / 'old.3dm'))
+    target = meshiah.read(str(tmp_path / 'new.3dm'))
+    files = meshiah.write_fsd(str(tmp_path / 'T'),
+                              [_linear(source.points)] * 2)
+    assert main(['remap', str(tmp_path / 'old.3dm'),
+                 str(tmp_path / 'new.3dm')] + files +
+                ['-o', str(tmp_path / 'warm')]) == 0
+    warm = meshiah.read_fsd_file(str(tmp_path / 'warm_00001.fsd'))
+    assert len(warm) == len(target.points)
+
+
+def test_SampleLine(tmp_path):
+    generate.generate_3dm(str(tmp_path / 'mesh.3dm'), 3000, randomize=True)
+    mesh = meshiah.read(str(tmp_path / 'mesh.3dm'))
+    lo, hi = mesh.points.min(axis=0), mesh.points.max(axis=0)
+    p0 = lo + 0.25 * (hi - lo)
+    p1 = hi - 0.25 * (hi - lo)
+    steps = np.stack([k * _linear(mesh.points) for k in range(1, 5)])
+
+    profile = sample_line(mesh, steps, p0, p1, 20)
+    probe = line_probe(mesh, p0, p1, 20)
+    assert profile.shape == (4, 20)
+    assert np.allclose(profile, np.outer([1, 2, 3, 4],
+                                         _linear(probe.points)))
+    assert np.isclose(probe.distance[-1], np.linalg.norm(p1 - p0))
+    # The weights are located once per line
+    assert line_probe(mesh, p0, p1, 20) is probe
+
+    # Files are read in chunks, samples outside the mesh are NaN
+    paths = [str(tmp_path / f'T_{k:05d}.fsd') for k in range(4)]
+    meshiah.write_fsd(paths, steps)
+    beyond = hi + (hi - lo)
+    profile = sample_line(mesh, paths, p0, beyond, 30, chunk_size=3)
+    probe = line_probe(mesh, p0, beyond, 30)
+    assert probe.outside.any() and not probe.outside.all()
+    assert np.isnan(profile[:, probe.outside]).all()
+    assert np.allclose(profile[:, ~probe.outside],
+                       np.outer([1, 2, 3, 4],
+                                _linear(probe.points[~probe.outside])))
+
+
+def test_SampleLine2D(tmp_path):
+    generate.generate_2dm(str(tmp_path / 'mesh.2dm'), 2000)
+    mesh = meshiah.read(str(tmp_path / 'mesh.2dm'))
+    lo, hi = mesh.points.min(axis=0), mesh.points.max(axis=0)
+    # Endpoints in the xy plane, z is left out
+    p0 = (lo + 0.25 * (hi - lo))[:2]
+    p1 = (hi - 0.25 * (hi - lo))[:2]
+    probe = line_probe(mesh, list(p0), tuple(p1), 10)
+    assert probe.points.shape == (10, 3)
+    assert np.array_equal(probe.points[[0, -1], :2], [p0, p1])
+    assert not probe.outside.any()
+    flat = mesh.points * [1, 1, 0]
+    assert np.allclose(sample_line(mesh, _linear(flat), p0, p1, 10),
+                       _linear(probe.points))
+
+    # Moving the nodes, in place or by new arrays, locates the line again
+    points = np.array(mesh.points)
+    mesh.points[:, 0] += hi[0] - lo[0]
+    assert line_probe(mesh, p0, p1, 10).outside.all()
+    for shift in 2 * [0, hi[0] - lo[0]]:
+        mesh.points = points + [shift, 0, 0]
+        assert line_probe(mesh, p0, p1, 10).outside.all() == (shift > 0)
+    for bad in ([1.0], [1.0, 2.0, 3.0, 4.0], [[1.0, 2.0]]):
+        with pytest.raises(ValueError):
+            line_probe(mesh, bad, p1, 10)
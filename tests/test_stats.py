@@ -0,0 +1,87 @@
+import meshio
+import numpy as np
+
+import meshiah
+from meshiah import cli
+from meshiah import generate
+from meshiah import stats
+
+
+def test_SeriesStatistics(tmp_path):
+    paths = generate.generate_fsd_series(str(tmp_path / 'T'), 500, 7)
+    values = np.array([meshiah.read_fsd_file(path) for path in paths])
+    times = np.arange(7) * 3.0
+
+    for workers in (1, 3):
+        result = stats.series_statistics(paths, times, max_workers=workers)
+        assert result.count == 7
+        assert np.allclose(result.mean, values.mean(axis=0))
+        assert np.allclose(result.std, values.std(axis=0))
+        assert np.array_equal(result.min, values.min(axis=0))
+        assert np.array_equal(result.max, values.max(axis=0))
+        assert np.array_equal(result.time_of_peak,
+                              times[values.argmax(axis=0)])
+
+
+def test_MergeStable():
+    rng = np.random.default_rng(0)
+    values = 1e9 + rng.random((40, 10))
+    first = stats.SeriesStats(10)
+    second = stats.SeriesStats(10)
+    for step, row in enumerate(values):
+        (first if step < 25 else second).update(row, step)
+    merged = first.merge(second)
+    assert np.allclose(merged.variance(ddof=1), values.var(axis=0, ddof=1))
+
+
+def test_StatsCommand(tmp_path):
+    mesh_file = str(tmp_path / 'mesh.2dm')
+    npoints, _ = generate.generate_2dm(mesh_file, 300)
+    paths = generate.generate_fsd_series(str(tmp_path / 'T'), npoints, 4)
+    output = str(tmp_path / 'stats.vtu')
+    assert cli.main(['stats', mesh_file, *paths, '-o', output,
+                     '--name', 'T']) == 0
+    mesh = meshio.read(output)
+    assert sorted(mesh.point_data) == ['T_max', 'T_mean', 'T_min', 'T_std',
+                                       'T_time_of_peak']
+
+
+def test_CompareSeries(tmp_path):
+    reference = generate.generate_fsd_series(str(tmp_path / 'A'), 300, 6)
+    test = [str(tmp_path / f'B_{step:05d}.fsd') for step in range(6)]
+    values = np.array([meshiah.read_fsd_file(path) for path in reference])
+    rng = np.random.default_rng(1)
+    changed = values + rng.normal(0, 1e-3, values.shape)
+    meshiah.write_fsd(test, changed)
+    changed = np.array([meshiah.read_fsd_file(path) for path in test])
+    difference = np.abs(changed - values)
+
+    for workers in (1, 4):
+        result = stats.compare_series(reference, test, max_workers=workers)
+        table = result.table()
+        assert np.array_equal(table['steps'], np.arange(6))
+        assert np.allclose(table['max_abs'], difference.max(axis=1))
+        assert np.allclose(table['rms'],
+                           np.sqrt((difference ** 2).mean(axis=1)))
+        assert np.array_equal(table['worst'], difference.argmax(axis=1))
+        assert np.allclose(result.entity_max, difference.max(axis=0))
+        assert np.array_equal(result.entity_step, difference.argmax(axis=0))
+        top = result.worst_entities(5)
+        assert np.array_equal(top, np.argsort(-difference.max(axis=0))[:5])
+
+
+def test_CompareCommand(tmp_path, capsys):
+    mesh_file = str(tmp_path / 'mesh.2dm')
+    npoints, _ = generate.generate_2dm(mesh_file, 300)
+    paths = generate.generate_fsd_series(str(tmp_path / 'T'), npoints, 3)
+    output = str(tmp_path / 'diff.vtu')
+    table = str(tmp_path / 'diff.csv')
+    assert cli.main(['compare', mesh_file, '--reference', *paths,
+                     '--test', *paths, '-o', output, '--table', table,
+                     '--name', 'T']) == 0
+    assert 'largest difference 0 ' in capsys.readouterr().out
+    mesh = meshio.read(output)
+    assert sorted(mesh.point_data) == ['T_max_diff', 'T_rms_diff',
+                                       'T_step_of_max_diff']
+    assert not mesh.point_data['T_max_diff'].any()
+    assert len(np.loadtxt(table, delimiter=',', skiprows=1)) == 3
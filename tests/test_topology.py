@@ -0,0 +1,56 @@
+import meshio
+import numpy as np
+
+import meshiah
+from meshiah import generate
+from meshiah import topology
+
+
+def test_EdgeTable():
+    points = np.zeros((4, 3))
+    mesh = meshio.Mesh(points, [("triangle",
+                                 np.array([[0, 1, 2], [1, 3, 2]]))])
+    table = topology.edge_table(mesh)
+    assert np.array_equal(table['edges'],
+                          [[0, 1], [0, 2], [1, 2], [1, 3], [2, 3]])
+    assert np.array_equal(table['uses'], [1, 1, 2, 1, 1])
+    assert np.array_equal(table['cell_edges'][0], [[0, 2, 1], [3, 4, 2]])
+    assert topology.edge_table(mesh) is table
+
+    # Changed in place or replaced, again and again, the cells are rescanned
+    mesh.cells[0].data[1] = [0, 3, 2]
+    assert np.array_equal(topology.edge_table(mesh)['edges'],
+                          [[0, 1], [0, 2], [0, 3], [1, 2], [2, 3]])
+    for conn, edges in 2 * [([[0, 1, 2]], [[0, 1], [0, 2], [1, 2]]),
+                            ([[1, 2, 3]], [[1, 2], [1, 3], [2, 3]])]:
+        mesh.cells[0] = meshio.CellBlock('triangle', np.array(conn))
+        assert np.array_equal(topology.edge_table(mesh)['edges'], edges)
+
+
+def test_ChunkedTables(tmp_path):
+    filename = str(tmp_path / 'mesh.3dm')
+    generate.generate_3dm(filename, 5000, randomize=True)
+    mesh = meshiah.read(filename)
+    edges = topology.edge_table(mesh)
+    faces = topology.face_table(mesh)
+    tets = mesh.cells[0][1]
+    # Every cell edge maps to its sorted node pair
+    assert np.array_equal(
+        edges['edges'][edges['cell_edges'][0]],
+        np.sort(tets[:, topology.LOCAL_EDGES['tetra']], axis=2))
+    assert len(np.unique(edges['edges'], axis=0)) == len(edges['edges'])
+    assert faces['uses'].max() == 2 and faces['uses'].sum() == 4 * len(tets)
+    # Euler characteristic of a ball: V - E + F - T = 1
+    assert (len(mesh.points) - len(edges['edges']) + len(faces['faces']) -
+            len(tets)) == 1
+
+    # Grouping range by range of node ids gives the same tables
+    chunked = topology.unique_entities(len(mesh.points), mesh.cells,
+                                       topology.LOCAL_FACES, chunk_size=700,
+                                       memory_limit=64 << 10)
+    assert np.array_equal(chunked[0], faces['faces'])
+    assert np.array_equal(chunked[1], faces['uses'])
+    assert np.array_equal(chunked[2][0], faces['cell_faces'][0])
+
+    mesh.cells[0] = meshio.CellBlock('tetra', tets[:100])
+    assert len(topology.face_table(mesh)['cell_faces'][0]) == 100